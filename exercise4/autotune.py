@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Autotuner for the hybrid launch configuration of snowman.
+
+Searches (MPI ranks, OpenMP threads, tile size, OpenMP schedule) for a given
+core count with successive halving: every candidate is probed with a short,
+reduced-resolution render, the best 1/eta are kept and re-probed at the next,
+larger resolution, until the final round picks the winner. Probes are run one
+at a time with the local launcher, so it works on a single node, and the
+result is printed as a ready-to-use launch line for the full-size render.
+
+Usage:
+    ./autotune.py --cores 96 --image-size 1024 --snowmen 4
+    ./autotune.py --cores 8 --probe-sizes 64,96,128 --max-candidates 27
+"""
+
+import argparse
+import itertools
+import math
+import os
+import random
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import orchestrate
+import snowman_metrics
+
+TILE_SIZES = (8, 16, 32, 64, 128, 256)
+SCHEDULES = ('static', 'dynamic,1', 'dynamic,16', 'guided')
+
+
+def rank_thread_pairs(cores, thread_counts=None):
+    """
+    (procs, threads) pairs for `cores` cores. Rank 0 only coordinates, so for
+    every thread count both p*t == cores (master shares a slot) and one extra
+    rank on top of the workers (master oversubscribed) are candidates.
+    """
+    if thread_counts is None:
+        thread_counts = [t for t in range(1, cores + 1) if cores % t == 0]
+    pairs = set()
+    for t in thread_counts:
+        workers = cores // t
+        if workers < 1:
+            continue
+        for procs in (workers, workers + 1):
+            if procs >= 2:
+                pairs.add((procs, t))
+    return sorted(pairs)
+
+
+def search_space(cores, tile_sizes, schedules, thread_counts=None, max_tile=None):
+    space = []
+    for (procs, threads), tile, schedule in itertools.product(
+            rank_thread_pairs(cores, thread_counts), tile_sizes, schedules):
+        if max_tile is None or tile <= max_tile:
+            space.append({'procs': procs, 'threads': threads, 'tile_size': tile, 'schedule': schedule})
+    return space
+
+
+def probe(spec, candidate, image_size, snowmen, repeats, workdir):
+    """
+    Render `repeats` probes of one candidate; returns the median wall time or None on failure.
+    """
+    config = {'image_size': image_size, 'snowmen': snowmen, 'tile_size': candidate['tile_size'],
+              'procs': candidate['procs'], 'threads': candidate['threads'],
+              'args': ['--schedule', candidate['schedule']]}
+    times = []
+    for _ in range(repeats):
+        metrics_path = os.path.join(workdir, 'probe.ndjson')
+        if os.path.exists(metrics_path):
+            os.remove(metrics_path)
+        try:
+            proc = subprocess.run(orchestrate.build_command(spec, config),
+                                  env=orchestrate.run_env(spec, config, metrics_path=metrics_path),
+                                  cwd=workdir, capture_output=True, text=True, timeout=spec['timeout'])
+        except subprocess.TimeoutExpired:
+            return None
+        records = snowman_metrics.load_records(metrics_path) if os.path.exists(metrics_path) else []
+        if proc.returncode != 0 or not records:
+            return None
+        times.append(records[0]['wall_time'])
+    return statistics.median(times)
+
+
+def successive_halving(spec, candidates, probe_sizes, snowmen, eta=3, repeats=1, verbose=True):
+    """
+    Run the halving rounds; returns the list of (time, candidate) of the final round, fastest first.
+    Candidates whose tile is larger than a round's probe image skip that round and are probed
+    from the first round they fit in.
+    """
+    with tempfile.TemporaryDirectory(prefix='autotune_') as workdir:
+        for round_idx, size in enumerate(probe_sizes):
+            last = round_idx == len(probe_sizes) - 1
+            if verbose:
+                print(f'Round {round_idx + 1}/{len(probe_sizes)}: {len(candidates)} candidates at {size}×{size}',
+                      flush=True)
+            scored, waiting = [], []
+            for cand in candidates:
+                if cand['tile_size'] > size:
+                    waiting.append(cand)
+                    if verbose:
+                        print(f'  {describe(cand):<36} tile larger than the probe, next round')
+                    continue
+                t = probe(spec, cand, size, snowmen, repeats, workdir)
+                if t is None:
+                    if verbose:
+                        print(f'  {describe(cand):<36} failed')
+                    continue
+                scored.append((t, cand))
+                if verbose:
+                    print(f'  {describe(cand):<36} {t:8.3f} s', flush=True)
+            if not scored and not waiting:
+                raise SystemExit('All probes failed; check that ./snowman is built and the launcher works')
+            scored.sort(key=lambda s: s[0])
+            if last:
+                return scored
+            keep = max(1, math.ceil(len(scored) / eta))
+            candidates = [cand for _, cand in scored[:keep]] + waiting
+    return []
+
+
+def describe(cand):
+    return f"{cand['procs']}p×{cand['threads']}t tile {cand['tile_size']} {cand['schedule']}"
+
+
+def launch_line(spec, cand, image_size, snowmen):
+    config = {'image_size': image_size, 'snowmen': snowmen, 'tile_size': cand['tile_size'],
+              'procs': cand['procs'], 'threads': cand['threads'],
+              'args': ['--schedule', cand['schedule']]}
+    env = ' '.join(f'{k}={shlex.quote(str(v))}' for k, v in spec['env'].items())
+    cmd = shlex.join(orchestrate.build_command(spec, config))
+    return f"{env + ' ' if env else ''}OMP_NUM_THREADS={cand['threads']} {cmd}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Successive-halving autotuner for snowman launch parameters')
+    parser.add_argument('--cores', type=int, default=os.cpu_count(), help='cores to use (default: all)')
+    parser.add_argument('--image-size', type=int, default=1024, help='resolution of the real render')
+    parser.add_argument('--snowmen', type=int, default=4)
+    parser.add_argument('--probe-sizes', default='128,192,256',
+                        help='comma-separated probe resolutions, one per halving round')
+    parser.add_argument('--eta', type=int, default=3, help='keep the best 1/eta candidates per round')
+    parser.add_argument('--repeats', type=int, default=1, help='probes per candidate and round (median)')
+    parser.add_argument('--max-candidates', type=int, default=81,
+                        help='random subset of the search space for the first round (0 = all)')
+    parser.add_argument('--threads', help='comma-separated thread counts to consider (default: divisors of cores)')
+    parser.add_argument('--tile-sizes', default=','.join(map(str, TILE_SIZES)))
+    parser.add_argument('--schedules', default=';'.join(SCHEDULES), help='semicolon-separated OpenMP schedules')
+    parser.add_argument('--binary', default='./snowman')
+    parser.add_argument('--launcher', choices=('mpirun', 'srun'), default='mpirun')
+    parser.add_argument('--launcher-args', default='', help='extra launcher arguments')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per probe')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--env', action='append', default=[], metavar='VAR=VALUE',
+                        help='environment for all probes, e.g. OMP_PLACES=cores')
+    args = parser.parse_args(argv)
+
+    probe_sizes = [int(s) for s in args.probe_sizes.split(',')]
+    thread_counts = [int(t) for t in args.threads.split(',')] if args.threads else None
+    tile_sizes = [int(t) for t in args.tile_sizes.split(',')]
+    schedules = [s for s in args.schedules.split(';') if s]
+
+    spec = dict(orchestrate.DEFAULTS)
+    spec.update(binary=os.path.abspath(args.binary), launcher=args.launcher,
+                launcher_args=shlex.split(args.launcher_args), timeout=args.timeout,
+                env=dict(e.split('=', 1) for e in args.env))
+
+    # every candidate must fit at least the final, largest probe
+    space = search_space(args.cores, tile_sizes, schedules, thread_counts, max_tile=max(probe_sizes))
+    candidates = space
+    if args.max_candidates and len(space) > args.max_candidates:
+        candidates = random.Random(args.seed).sample(space, args.max_candidates)
+    print(f'Search space: {len(space)} configurations for {args.cores} cores, '
+          f'probing {len(candidates)} in {len(probe_sizes)} rounds')
+
+    final = successive_halving(spec, candidates, probe_sizes, args.snowmen, args.eta, args.repeats)
+
+    print(f'\nFinal round ({probe_sizes[-1]}×{probe_sizes[-1]} probes):')
+    best_time = final[0][0]
+    for t, cand in final:
+        print(f'  {describe(cand):<36} {t:8.3f} s  {t / best_time:5.2f}x')
+    best = final[0][1]
+    print(f'\nRecommended configuration for {args.cores} cores: {describe(best)}')
+    print(launch_line(dict(spec, binary=args.binary), best, args.image_size, args.snowmen))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+#include "checkpoint.hpp"
+#include <algorithm>
+#include <cstring>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+namespace {
+
+const char CHECKPOINT_MAGIC[8] = {'S', 'N', 'O', 'W', 'C', 'K', 'P', '\0'};
+const uint32_t CHECKPOINT_VERSION = 1;
+// frame buffers start on a page boundary so they can be synced on their own
+const uint64_t PAGE = 4096;
+
+struct CheckpointHeader {
+    char magic[8];
+    uint32_t version;
+    uint32_t reserved;
+    uint64_t key;
+    int32_t width, height, frames, num_tiles;
+    uint64_t marks_offset;
+    uint64_t frames_offset;
+    uint64_t file_size;
+};
+
+} // namespace
+
+Checkpoint::~Checkpoint() {
+    if (writer_.joinable()) writer_.join();
+    close();
+}
+
+void Checkpoint::close() {
+    if (data_) munmap(data_, size_);
+    data_ = nullptr;
+    size_ = 0;
+}
+
+bool Checkpoint::open(const std::string& path, uint64_t key, int width, int height, int frames, int num_tiles,
+                      std::string& error) {
+    CheckpointHeader want;
+    std::memset(&want, 0, sizeof(want));
+    std::memcpy(want.magic, CHECKPOINT_MAGIC, sizeof(want.magic));
+    want.version = CHECKPOINT_VERSION;
+    want.key = key;
+    want.width = width;
+    want.height = height;
+    want.frames = frames;
+    want.num_tiles = num_tiles;
+    want.marks_offset = sizeof(CheckpointHeader);
+    uint64_t num_marks = (uint64_t)frames * num_tiles;
+    want.frames_offset = (want.marks_offset + num_marks + PAGE - 1) / PAGE * PAGE;
+    frame_bytes_ = (size_t)width * height * 3;
+    want.file_size = want.frames_offset + (uint64_t)frames * frame_bytes_;
+
+    int fd = ::open(path.c_str(), O_RDWR | O_CREAT, 0644);
+    if (fd < 0) {
+        error = "cannot open checkpoint " + path;
+        return false;
+    }
+    CheckpointHeader have;
+    bool resume = pread(fd, &have, sizeof(have), 0) == (ssize_t)sizeof(have)
+                  && std::memcmp(&have, &want, sizeof(have)) == 0;
+    // a new or foreign file starts over with no tiles done (the file is sparse)
+    if (!resume && (ftruncate(fd, 0) != 0 || ftruncate(fd, (off_t)want.file_size) != 0
+                    || pwrite(fd, &want, sizeof(want), 0) != (ssize_t)sizeof(want))) {
+        ::close(fd);
+        error = "cannot create checkpoint " + path;
+        return false;
+    }
+    void* data = mmap(nullptr, want.file_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    ::close(fd);
+    if (data == MAP_FAILED) {
+        error = "cannot map checkpoint " + path;
+        return false;
+    }
+
+    path_ = path;
+    data_ = data;
+    size_ = want.file_size;
+    marks_ = static_cast<unsigned char*>(data_) + want.marks_offset;
+    frames_ = static_cast<unsigned char*>(data_) + want.frames_offset;
+    num_tiles_ = num_tiles;
+    done_.assign(marks_, marks_ + num_marks);
+    resumed_ = (int)std::count(done_.begin(), done_.end(), 1);
+    return true;
+}
+
+int Checkpoint::tiles_done(int frame) const {
+    auto first = done_.begin() + (size_t)frame * num_tiles_;
+    return (int)std::count(first, first + num_tiles_, 1);
+}
+
+void Checkpoint::save_async() {
+    if (!data_ || busy_) return;
+    if (writer_.joinable()) writer_.join();
+    saving_ = done_;
+    busy_ = true;
+    writer_ = std::thread([this] {
+        // pixels first, then the marks of the tiles they belong to
+        size_t header_bytes = frames_ - static_cast<unsigned char*>(data_);
+        msync(frames_, size_ - header_bytes, MS_SYNC);
+        std::memcpy(marks_, saving_.data(), saving_.size());
+        msync(data_, header_bytes, MS_SYNC);
+        ++writes_;
+        busy_ = false;
+    });
+}
+
+void Checkpoint::remove() {
+    if (writer_.joinable()) writer_.join();
+    close();
+    if (!path_.empty()) unlink(path_.c_str());
+}
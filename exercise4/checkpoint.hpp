@@ -0,0 +1,70 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+
+#ifndef CHECKPOINT_HPP
+#define CHECKPOINT_HPP
+
+#include <atomic>
+#include <cstddef>
+#include <cstdint>
+#include <string>
+#include <thread>
+#include <vector>
+
+// Render progress of the master kept in a file, so a job that is killed
+// (time limit, node failure) can be restarted and render only the missing
+// tiles.
+//
+// The file holds a header, one byte per (frame, tile) marking it done and
+// the RGB frame buffers of all frames. The buffers are mapped, so the
+// master decodes tiles straight into the file. save_async() makes the
+// progress so far durable on a background thread: it syncs the buffers
+// first and only then writes the done marks it had at the start, so a mark
+// never gets ahead of its pixels.
+class Checkpoint {
+public:
+    Checkpoint() = default;
+    Checkpoint(const Checkpoint&) = delete;
+    Checkpoint& operator=(const Checkpoint&) = delete;
+    ~Checkpoint();
+
+    // Open or create the checkpoint at `path` for `frames` frames of
+    // `num_tiles` tiles of a width*height image. The progress in an existing
+    // file is kept if it was written for the same `key` (a hash of the
+    // render settings), otherwise the file starts over.
+    bool open(const std::string& path, uint64_t key, int width, int height, int frames, int num_tiles,
+              std::string& error);
+
+    unsigned char* frame(int f) { return frames_ + (size_t)f * frame_bytes_; }
+    bool done(int frame, int tile) const { return done_[(size_t)frame * num_tiles_ + tile] != 0; }
+    void mark_done(int frame, int tile) { done_[(size_t)frame * num_tiles_ + tile] = 1; }
+    int tiles_done(int frame) const;
+    int resumed_tiles() const { return resumed_; }   // tiles done when opened
+    int writes() const { return writes_; }            // completed save_async() calls
+
+    // Start making the current progress durable, unless the previous save is
+    // still running (then this one is skipped). Never blocks on I/O.
+    void save_async();
+    // The render is complete: wait for a running save and delete the file.
+    void remove();
+
+private:
+    void close();
+
+    std::string path_;
+    void* data_ = nullptr;
+    size_t size_ = 0;
+    unsigned char* marks_ = nullptr;    // done marks in the file
+    unsigned char* frames_ = nullptr;   // frame buffers in the file
+    size_t frame_bytes_ = 0;
+    int num_tiles_ = 0;
+    std::vector<unsigned char> done_;   // current progress, ahead of marks_
+    std::vector<unsigned char> saving_; // snapshot being written
+    int resumed_ = 0;
+    std::atomic<int> writes_{0};
+    std::thread writer_;
+    std::atomic<bool> busy_{false};
+};
+
+#endif
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Compare two renders tile by tile.
+
+Each argument is either a PPM image or a per-tile hash file as written by
+`snowman --tile-hashes` (default output.tiles):
+
+    snowman-tiles/1 <width> <height> <tile_size> <seed_mode>
+    <tile_id> <x0> <y0> <w> <h> fnv1a64:<hex>
+
+Two images are compared pixel by pixel (memory-mapped and in bands, see
+ppm_io.py) and the max error and PSNR are reported per tile; differing tiles can be highlighted in a diff image. If one
+side is a hash file, the image is hashed on the same tile grid, so a golden
+render only needs to be kept as its (small) hash file. The exit status is 1
+if the renders differ beyond --max-error / --min-psnr (or any hash differs),
+which lets scripts gate performance changes on the output.
+
+Note that the snowflakes depend on the tile size and, unless snowman runs with
+--seed-mode tile, on which rank rendered which tile.
+
+Usage:
+    ./compare_renders.py golden.tiles output.ppm
+    ./compare_renders.py before.ppm after.ppm --tile-size 32 --max-error 8 --diff-image diff.ppm
+    ./compare_renders.py output.ppm --save-hashes golden.tiles --tile-size 16
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+import ppm_io
+
+TILES_MAGIC = 'snowman-tiles/1'
+
+
+def read_tile_hashes(path):
+    """
+    Returns (meta, tiles): meta with width, height, tile_size, seed_mode;
+    tiles as a list of (tile_id, x0, y0, w, h, hash).
+    """
+    with open(path) as f:
+        header = f.readline().split()
+        if not header or header[0] != TILES_MAGIC:
+            raise ValueError(f'{path}: not a {TILES_MAGIC} file')
+        meta = {'width': int(header[1]), 'height': int(header[2]), 'tile_size': int(header[3]),
+                'seed_mode': header[4] if len(header) > 4 else None}
+        tiles = []
+        for line in f:
+            fields = line.split()
+            if fields:
+                tiles.append(tuple(int(v) for v in fields[:5]) + (fields[5],))
+    return meta, tiles
+
+
+def write_tile_hashes(path, tiles, width, height, tile_size, seed_mode='unknown'):
+    with open(path, 'w') as f:
+        f.write(f'{TILES_MAGIC} {width} {height} {tile_size} {seed_mode}\n')
+        for tile in tiles:
+            f.write(' '.join(map(str, tile)) + '\n')
+
+
+def tile_grid(width, height, tile_size):
+    """
+    (tile_id, x0, y0, w, h) in the row-major order of main.cpp.
+    """
+    return [(i, x0, y0, min(tile_size, width - x0), min(tile_size, height - y0))
+            for i, (y0, x0) in enumerate((y, x) for y in range(0, height, tile_size)
+                                         for x in range(0, width, tile_size))]
+
+
+def image_tile_hashes(image, tile_size):
+    """
+    Hashes of an (h, w, 3) image in the same format as write_tile_hashes() in metrics.cpp.
+    """
+    height, width = image.shape[:2]
+    hashes = ppm_io.tile_hashes(image, tile_size).ravel()
+    return [(i, x0, y0, w, h, f'fnv1a64:{int(hashes[i]):016x}')
+            for i, x0, y0, w, h in tile_grid(width, height, tile_size)]
+
+
+def highlight(image, bad, tile_size):
+    """
+    Copy of `image` dimmed outside the differing tiles, which get a red outline.
+    `bad` is a boolean (tiles_y, tiles_x) mask.
+    """
+    out = (image.astype(np.float64) * 0.4).astype(np.uint8)
+    height, width = image.shape[:2]
+    for ty, tx in zip(*np.nonzero(bad)):
+        y0, x0 = ty * tile_size, tx * tile_size
+        y1, x1 = min(y0 + tile_size, height), min(x0 + tile_size, width)
+        out[y0:y1, x0:x1] = image[y0:y1, x0:x1]
+        out[y0:y1, [x0, x1 - 1]] = (255, 0, 0)
+        out[[y0, y1 - 1], x0:x1] = (255, 0, 0)
+    return out
+
+
+def load(path):
+    """
+    ('image', array) for a PPM or ('hashes', (meta, tiles)) for a hash file.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(TILES_MAGIC))
+    if magic.decode(errors='replace') == TILES_MAGIC:
+        return 'hashes', read_tile_hashes(path)
+    return 'image', ppm_io.read_ppm(path)
+
+
+def compare_hashes(base_tiles, new_tiles):
+    """
+    Tile ids whose hashes differ, or None if the tile grids do not match.
+    """
+    if [t[:5] for t in base_tiles] != [t[:5] for t in new_tiles]:
+        return None
+    return [b[0] for b, n in zip(base_tiles, new_tiles) if b[5] != n[5]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tile-wise comparison of snowman renders')
+    parser.add_argument('base', help='reference PPM or tile hash file')
+    parser.add_argument('new', nargs='?', help='PPM or tile hash file to check')
+    parser.add_argument('--tile-size', type=int, default=None,
+                        help='comparison grid for two images (default 16) or for --save-hashes')
+    parser.add_argument('--max-error', type=int, default=0, help='allowed max channel error per tile')
+    parser.add_argument('--min-psnr', type=float, default=None, help='required PSNR (dB) per tile')
+    parser.add_argument('--diff-image', help='write the new image with differing tiles highlighted')
+    parser.add_argument('--save-hashes', help='write the tile hashes of BASE (an image) to this file')
+    parser.add_argument('--seed-mode', default='unknown', help='seed mode recorded with --save-hashes')
+    args = parser.parse_args(argv)
+
+    base_kind, base = load(args.base)
+    if args.save_hashes:
+        if base_kind != 'image':
+            parser.error('--save-hashes needs an image')
+        height, width = base.shape[:2]
+        tile_size = args.tile_size or 16
+        write_tile_hashes(args.save_hashes, image_tile_hashes(base, tile_size), width, height,
+                          tile_size, args.seed_mode)
+        print(f'Tile hashes of {args.base} ({tile_size}×{tile_size} tiles) saved to {args.save_hashes}')
+        if not args.new:
+            return 0
+    if not args.new:
+        parser.error('need a second render to compare against')
+    new_kind, new = load(args.new)
+
+    if base_kind == 'image' and new_kind == 'image':
+        if base.shape != new.shape:
+            print(f'Image sizes differ: {base.shape[1]}×{base.shape[0]} vs {new.shape[1]}×{new.shape[0]}')
+            return 1
+        tile_size = args.tile_size or 16
+        result = ppm_io.diff(base, new, tile_size)
+        max_err, psnr = result['tile_max_error'], result['tile_psnr']
+        bad = max_err > args.max_error
+        if args.min_psnr is not None:
+            bad |= psnr < args.min_psnr
+        differing = int((max_err > 0).sum())
+        finite = psnr[np.isfinite(psnr)]
+        print(f'{max_err.size} tiles of {tile_size}×{tile_size}: {differing} differ, {int(bad.sum())} out of bounds')
+        if differing:
+            print(f'max error {int(max_err.max())}, worst tile PSNR {finite.min():.2f} dB')
+            tx_count = max_err.shape[1]
+            for ty, tx in sorted(zip(*np.nonzero(bad)), key=lambda p: psnr[p]):
+                tile_id = ty * tx_count + tx
+                print(f'  tile {tile_id:5d} at ({tx * tile_size}, {ty * tile_size}): '
+                      f'max error {int(max_err[ty, tx]):3d}, PSNR {psnr[ty, tx]:6.2f} dB')
+        if args.diff_image:
+            ppm_io.write_ppm(args.diff_image, highlight(new, bad, tile_size))
+            print(f'Diff image saved to {args.diff_image}')
+        return 1 if bad.any() else 0
+
+    # at least one side is a hash file: compare on its grid
+    meta, base_tiles = base if base_kind == 'hashes' else new
+    image = base if base_kind == 'image' else new if new_kind == 'image' else None
+    if image is not None:
+        if image.shape[:2] != (meta['height'], meta['width']):
+            print(f"Image size {image.shape[1]}×{image.shape[0]} does not match the "
+                  f"{meta['width']}×{meta['height']} hash file")
+            return 1
+        other_tiles = image_tile_hashes(image, meta['tile_size'])
+    else:
+        other_tiles = (new if base_kind == 'hashes' else base)[1]
+    if base_kind == 'image':
+        base_tiles, other_tiles = other_tiles, base_tiles
+    differing = compare_hashes(base_tiles, other_tiles)
+    if differing is None:
+        print('Tile grids differ; compare renders made with the same image and tile size')
+        return 1
+    print(f"{len(base_tiles)} tiles of {meta['tile_size']}×{meta['tile_size']} "
+          f"(seed mode {meta['seed_mode']}): {len(differing)} differ")
+    for tile_id in differing[:50]:
+        _, x0, y0, w, h, _ = base_tiles[tile_id]
+        print(f'  tile {tile_id:5d} at ({x0}, {y0}) {w}×{h}')
+    if len(differing) > 50:
+        print(f'  ... and {len(differing) - 50} more')
+    if args.diff_image and image is not None and differing:
+        tx_count = -(-meta['width'] // meta['tile_size'])
+        bad = np.zeros((-(-meta['height'] // meta['tile_size']), tx_count), dtype=bool)
+        for tile_id in differing:
+            bad[divmod(tile_id, tx_count)] = True
+        ppm_io.write_ppm(args.diff_image, highlight(image, bad, meta['tile_size']))
+        print(f'Diff image saved to {args.diff_image}')
+    return 1 if differing else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
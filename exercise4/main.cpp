@@ -1,219 +1,951 @@
-// This file is distributed under the MIT license.
-// See the LICENSE file for details.
-
-/*
-  SNOWMAN is currently under active development.
-  Features, functionality, and output may change frequently.
-
-  It is created for teaching purposes as part of an HPC (High Performance Computing) course.
-
-  If you encounter any issues feel free to reach out:
-
-  Contact: kmanda@uni-bonn.de.com
-*/
-
-#include <mpi.h>
-#include <iostream>
-#include <vector>
-#include <string>
-#include <chrono>
-#include <cstring>
-#include "raytracer.hpp"
-#include "scene.hpp"
-
-int main(int argc, char* argv[]) {
-    MPI_Init(&argc, &argv);
-
-    int rank, size;
-    MPI_Comm_rank(MPI_COMM_WORLD, &rank);
-    MPI_Comm_size(MPI_COMM_WORLD, &size);
-
-    if (argc < 3) {
-        if (rank == 0) {
-            std::cout << "Usage: " << argv[0] << " <image_size> <num_snowmen> <tile_size>\n";
-        }
-        MPI_Finalize();
-        return 1;
-    }
-
-    int image_size = std::stoi(argv[1]);
-    int num_snowmen = std::stoi(argv[2]);
-    int tile_size = std::stoi(argv[3]);
-
-    // Scene generation and RayTracer setup
-    Scene scene;
-    scene.generate_snowmen(num_snowmen);
-
-    RayTracer raytracer(image_size, image_size);
-    raytracer.set_scene(&scene);
-
-    // accumulate local compute time (sum of tile times) per rank
-    double local_compute_time = 0.0;
-
-    // --- Master/Worker Tile-based rendering ---
-    if (size == 1) {
-        // Single-process fallback: render whole image as before
-        std::vector<Color> pixels;
-        auto t0 = std::chrono::high_resolution_clock::now();
-        raytracer.render(0,1,pixels);
-        auto t1 = std::chrono::high_resolution_clock::now();
-        std::chrono::duration<double> dur = t1 - t0;
-        std::cout << "Single-rank render time: " << dur.count() << " s\n";
-        raytracer.save_image("output.ppm", pixels);
-        if (rank == 0) std::cout << "Image saved to output.ppm\n";
-        local_compute_time = dur.count();
-    } else {
-        const int TILE_SIZE = tile_size;
-        struct Tile { int id; int x0; int y0; int w; int h; };
-
-        std::vector<Tile> tiles;
-        int id = 0;
-        for (int y = 0; y < image_size; y += TILE_SIZE) {
-            for (int x = 0; x < image_size; x += TILE_SIZE) {
-                int w = std::min(TILE_SIZE, image_size - x);
-                int h = std::min(TILE_SIZE, image_size - y);
-                tiles.push_back(Tile{id, x, y, w, h});
-                ++id;
-            }
-        }
-
-        int num_tiles = (int)tiles.size();
-
-        if (rank == 0) {
-            // Master: coordinate work and gather results
-            std::vector<unsigned char> full_buf(image_size * image_size * 3);
-
-            int next_tile = 0;
-            // send initial tiles to workers
-            for (int worker = 1; worker < size; ++worker) {
-                if (next_tile < num_tiles) {
-                    int meta[5] = {tiles[next_tile].id, tiles[next_tile].x0, tiles[next_tile].y0, tiles[next_tile].w, tiles[next_tile].h};
-                    MPI_Send(meta, 5, MPI_INT, worker, 1, MPI_COMM_WORLD);
-                    ++next_tile;
-                } else {
-                    MPI_Send(nullptr, 0, MPI_INT, worker, 2, MPI_COMM_WORLD); // done
-                }
-            }
-
-            int tiles_received = 0;
-            while (tiles_received < num_tiles) {
-                MPI_Status status;
-                int header[3]; // tile_id, w, h
-                MPI_Recv(header, 3, MPI_INT, MPI_ANY_SOURCE, 4, MPI_COMM_WORLD, &status);
-                int src = status.MPI_SOURCE;
-                int tile_id = header[0];
-                int w = header[1];
-                int h = header[2];
-                int bufsize = w * h * 3;
-                std::vector<unsigned char> buf(bufsize);
-                MPI_Recv(buf.data(), bufsize, MPI_UNSIGNED_CHAR, src, 5, MPI_COMM_WORLD, &status);
-                // receive elapsed time for this tile
-                double elapsed = 0.0;
-                MPI_Recv(&elapsed, 1, MPI_DOUBLE, src, 6, MPI_COMM_WORLD, &status);
-
-                // place buffer into full_buf at correct offset
-                Tile t = tiles[tile_id];
-                for (int row = 0; row < t.h; ++row) {
-                    int dest_row = t.y0 + row;
-                    int dest_off = (dest_row * image_size + t.x0) * 3;
-                    int src_off = row * t.w * 3;
-                    std::memcpy(&full_buf[dest_off], &buf[src_off], t.w * 3);
-                }
-
-                ++tiles_received;
-
-                // (elapsed time received; master does not aggregate per-worker here)
-
-                // send next tile to this worker or done
-                if (next_tile < num_tiles) {
-                    int meta[5] = {tiles[next_tile].id, tiles[next_tile].x0, tiles[next_tile].y0, tiles[next_tile].w, tiles[next_tile].h};
-                    MPI_Send(meta, 5, MPI_INT, src, 1, MPI_COMM_WORLD);
-                    ++next_tile;
-                } else {
-                    MPI_Send(nullptr, 0, MPI_INT, src, 2, MPI_COMM_WORLD);
-                }
-            }
-
-            // (master will compute standard MPI-reduced metrics after workers finish)
-
-            // all tiles received -> save image
-            std::vector<Color> full_pixels(image_size * image_size);
-            for (int i = 0; i < image_size * image_size; ++i) {
-                full_pixels[i] = Color(full_buf[3*i], full_buf[3*i + 1], full_buf[3*i + 2]);
-            }
-            raytracer.save_image("output.ppm", full_pixels);
-            std::cout << "Master: Image saved to output.ppm\n";
-        } else {
-            // Worker loop
-            while (true) {
-                MPI_Status status;
-                int meta[5];
-                MPI_Recv(meta, 5, MPI_INT, 0, MPI_ANY_TAG, MPI_COMM_WORLD, &status);
-                if (status.MPI_TAG == 2) {
-                    break; // done
-                }
-                int tile_id = meta[0];
-                int x0 = meta[1];
-                int y0 = meta[2];
-                int w = meta[3];
-                int h = meta[4];
-
-                unsigned int seed = static_cast<unsigned int>(tile_id * 10007u) ^ static_cast<unsigned int>(rank + 12345);
-                double t0 = MPI_Wtime();
-                std::vector<Color> out;
-                raytracer.renderTile(x0, y0, w, h, seed, out);
-                double t1 = MPI_Wtime();
-                double elapsed = t1 - t0;
-
-                // convert to bytes
-                int bufsize = w * h * 3;
-                std::vector<unsigned char> buf(bufsize);
-                for (int i = 0; i < w * h; ++i) {
-                    buf[3*i + 0] = out[i].r;
-                    buf[3*i + 1] = out[i].g;
-                    buf[3*i + 2] = out[i].b;
-                }
-
-                int header[3] = {tile_id, w, h};
-                MPI_Send(header, 3, MPI_INT, 0, 4, MPI_COMM_WORLD);
-                MPI_Send(buf.data(), bufsize, MPI_UNSIGNED_CHAR, 0, 5, MPI_COMM_WORLD);
-                MPI_Send(&elapsed, 1, MPI_DOUBLE, 0, 6, MPI_COMM_WORLD);
-
-                // accumulate local compute time for this worker
-                local_compute_time += elapsed;
-
-                // lightweight instrumentation to stderr
-                // std::cerr << "Rank " << rank << " rendered tile " << tile_id << " (" << w << "x" << h << ") in " << elapsed << " s\n";
-            }
-        }
-    }
-
-    // --- Report original-style performance metrics (max/min/avg local compute time) ---
-    double max_local_compute_time = 0.0;
-    double min_local_compute_time = 0.0;
-    double sum_local_compute_time = 0.0;
-    MPI_Reduce(&local_compute_time, &max_local_compute_time, 1, MPI_DOUBLE, MPI_MAX, 0, MPI_COMM_WORLD);
-    MPI_Reduce(&local_compute_time, &min_local_compute_time, 1, MPI_DOUBLE, MPI_MIN, 0, MPI_COMM_WORLD);
-    MPI_Reduce(&local_compute_time, &sum_local_compute_time, 1, MPI_DOUBLE, MPI_SUM, 0, MPI_COMM_WORLD);
-
-    // Gather all local compute times to rank 0 for per-rank output
-    std::vector<double> all_local_compute_times(size);
-    MPI_Gather(&local_compute_time, 1, MPI_DOUBLE, all_local_compute_times.data(), 1, MPI_DOUBLE, 0, MPI_COMM_WORLD);
-
-    if (rank == 0) {
-        double avg_local_compute_time = sum_local_compute_time / size;
-        std::cout << "\n--- Computational Performance Metrics ---\n";
-        std::cout << "Image Size: " << image_size << ", Num Snowmen: " << num_snowmen << ", MPI Processes: " << size << "\n";
-        std::cout << "Max Local Computation Time (across all ranks): " << max_local_compute_time << " seconds\n";
-        std::cout << "Min Local Computation Time (across all ranks): " << min_local_compute_time << " seconds\n";
-        std::cout << "Avg Local Computation Time (across all ranks): " << avg_local_compute_time << " seconds\n";
-        
-        std::cout << "\n--- Per-Rank Computation Time ---\n";
-        for (int i = 0; i < size; ++i) {
-            std::cout << "Rank " << i << ": " << all_local_compute_times[i] << " seconds\n";
-        }
-    }
-
-    MPI_Finalize();
-    return 0;
-}
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+/*
+  SNOWMAN is currently under active development.
+  Features, functionality, and output may change frequently.
+
+  It is created for teaching purposes as part of an HPC (High Performance Computing) course.
+
+  If you encounter any issues feel free to reach out:
+
+  Contact: kmanda@uni-bonn.de.com
+*/
+
+#include <mpi.h>
+#include <algorithm>
+#include <cmath>
+#include <cstdio>
+#include <iostream>
+#include <map>
+#include <numeric>
+#include <sstream>
+#include <vector>
+#include <string>
+#include <thread>
+#include <chrono>
+#include <cstring>
+#include <omp.h>
+#include "raytracer.hpp"
+#include "scene.hpp"
+#include "scene_share.hpp"
+#include "options.hpp"
+#include "metrics.hpp"
+#include "tile_codec.hpp"
+#include "checkpoint.hpp"
+
+struct Tile { int id; int x0; int y0; int w; int h; };
+
+// Ints per task sent to a worker: tile_id, x0, y0, w, h, frame, stride.
+// Stride 1 renders the tile, a larger one a preview of every stride-th pixel.
+const int TASK_INTS = 7;
+
+// Row-major TILE_SIZE x TILE_SIZE decomposition of the image; ids are the indices.
+static std::vector<Tile> make_tiles(int image_size, int tile_size) {
+    std::vector<Tile> tiles;
+    int id = 0;
+    for (int y = 0; y < image_size; y += tile_size) {
+        for (int x = 0; x < image_size; x += tile_size) {
+            int w = std::min(tile_size, image_size - x);
+            int h = std::min(tile_size, image_size - y);
+            tiles.push_back(Tile{id, x, y, w, h});
+            ++id;
+        }
+    }
+    return tiles;
+}
+
+// Snowflake seed of a tile. With per_tile the rank is left out, so the image
+// no longer depends on which worker rendered which tile.
+static unsigned int tile_seed(int tile_id, int rank, bool per_tile) {
+    if (per_tile) rank = 0;
+    return static_cast<unsigned int>(tile_id * 10007u) ^ static_cast<unsigned int>(rank + 12345);
+}
+
+// Camera and snowfall of a frame of the animation; frame 0 is the still image.
+static void setup_frame(RayTracer& raytracer, const Options& opts, int frame) {
+    Camera camera;
+    double angle = opts.orbit * M_PI / 180.0 * frame / opts.frames;
+    if (angle != 0.0) {
+        // orbit around the vertical axis through the look-at point
+        Vec3 rel = camera.position - camera.lookat;
+        camera.position = camera.lookat + Vec3(rel.x * std::cos(angle) + rel.z * std::sin(angle), rel.y,
+                                               rel.z * std::cos(angle) - rel.x * std::sin(angle));
+    }
+    raytracer.set_camera(camera);
+    raytracer.set_snow_fall(opts.snowfall * frame);
+}
+
+// Output file of a frame: output.ppm for a still image, otherwise the
+// numbered file or the single stream file of --frame-output.
+static std::string frame_file(const Options& opts, int frame) {
+    if (opts.frames == 1) return "output.ppm";
+    if (opts.frame_output.find('%') == std::string::npos) return opts.frame_output;
+    char name[4096];
+    std::snprintf(name, sizeof(name), opts.frame_output.c_str(), frame);
+    return name;
+}
+
+// Frames after the first are appended when all go to one stream file.
+static bool append_frame(const Options& opts, int frame) {
+    return frame > 0 && opts.frame_output.find('%') == std::string::npos;
+}
+
+// Hash of the settings and the scene file contents that determine the
+// pixels; a checkpoint is only resumed by a run with the same key.
+static uint64_t checkpoint_key(const Options& opts) {
+    std::ostringstream settings;
+    settings << opts.image_size << ' ' << opts.num_snowmen << ' ' << opts.tile_size << ' ' << opts.seed_mode << ' '
+             << opts.scene << ' ' << opts.instancing << ' ' << opts.frames << ' ' << opts.orbit << ' '
+             << opts.snowfall << ' ' << opts.aa_samples << ' ' << opts.aa_threshold;
+    std::string s = settings.str();
+    uint64_t key = fnv1a64(reinterpret_cast<const unsigned char*>(s.data()), s.size());
+    // the scene was loaded from this file before, so it can be read
+    uint64_t scene_hash = 0;
+    std::string error;
+    if (!opts.scene.empty() && hash_scene_file(opts.scene, scene_hash, error)) {
+        key = fnv1a64(reinterpret_cast<const unsigned char*>(&scene_hash), sizeof(scene_hash), key);
+    }
+    return key;
+}
+
+// Timings of one render, valid on rank 0 of its communicator.
+struct RunTimes {
+    double wall_time = 0.0;
+    double max_compute_time = 0.0;
+    double avg_compute_time = 0.0;
+};
+
+// Render the image (or animation) with the ranks of `comm`, rank 0 as the
+// master, then report the metrics of the run. `start` is the time the run
+// is measured from.
+static RunTimes render_run(const Options& opts, const std::string& schedule, MPI_Comm comm, RayTracer& raytracer,
+                           const SceneView& scene_view, const SharedScene& shared, double scene_load_time,
+                           double start) {
+    int rank, size;
+    MPI_Comm_rank(comm, &rank);
+    MPI_Comm_size(comm, &size);
+    int image_size = opts.image_size;
+    int num_snowmen = opts.num_snowmen;
+    int tile_size = opts.tile_size;
+    bool per_tile_seeds = opts.seed_mode == "tile";
+    std::string error;
+
+    // accumulate local compute time (sum of tile times) per rank
+    double local_compute_time = 0.0;
+    // time spent in MPI calls of the tile protocol and number of tiles rendered
+    double local_comm_time = 0.0;
+    int local_tiles = 0;
+    // tile transport: bytes before and after encoding (workers), time to encode and decode
+    TileEncoding tile_encoding = TileEncoding::RAW;
+    parse_tile_encoding(opts.tile_encoding, tile_encoding, error);
+    double tile_bytes[2] = {0.0, 0.0};
+    double local_codec_time = 0.0;
+    // checksum of the final image, the last frame of an animation (only meaningful on rank 0)
+    uint64_t image_checksum = 0;
+    // checkpoint saves completed and tiles taken from the checkpoint (rank 0)
+    int checkpoint_writes = 0;
+    int resumed_tiles = 0;
+    // tile copies sent by tail speculation and copies that finished first (rank 0)
+    int speculative_tiles[2] = {0, 0};
+    // seconds from the start of the run to the first preview (rank 0)
+    double first_preview_time = -1.0;
+
+    // --- Master/Worker Tile-based rendering ---
+    if (size == 1) {
+        // Single-process fallback: render whole image as before (each frame)
+        std::vector<Color> pixels;
+        for (int frame = 0; frame < opts.frames; ++frame) {
+            setup_frame(raytracer, opts, frame);
+            // preview passes of the first frame, as the master hands them out
+            for (size_t pass = 0; frame == 0 && pass < opts.progressive.size(); ++pass) {
+                int stride = opts.progressive[pass];
+                std::vector<Color> preview(image_size * image_size);
+                std::vector<Color> small;
+                for (const Tile& t : make_tiles(image_size, tile_size)) {
+                    int pw = (t.w + stride - 1) / stride;
+                    small.resize(pw * ((t.h + stride - 1) / stride));
+                    raytracer.renderPreview(t.x0, t.y0, t.w, t.h, stride, small.data());
+                    for (int y = 0; y < t.h; ++y) {
+                        for (int x = 0; x < t.w; ++x) {
+                            preview[(t.y0 + y) * image_size + t.x0 + x] = small[(y / stride) * pw + x / stride];
+                        }
+                    }
+                }
+                raytracer.save_image(opts.preview_output, preview);
+                if (first_preview_time < 0) first_preview_time = MPI_Wtime() - start;
+                std::cout << "Preview of 1/" << stride * stride << " of the pixels saved to " << opts.preview_output
+                          << " after " << MPI_Wtime() - start << " s\n";
+            }
+            auto t0 = std::chrono::high_resolution_clock::now();
+            if (per_tile_seeds || opts.sweep) {
+                // same tiles and seeds as the master/worker path, rendered in place; a sweep's
+                // 1-rank run needs them so that it does the same work as the runs it is compared to
+                pixels.resize(image_size * image_size);
+                for (const Tile& t : make_tiles(image_size, tile_size)) {
+                    raytracer.renderTile(t.x0, t.y0, t.w, t.h, tile_seed(t.id, rank, per_tile_seeds),
+                                         pixels.data() + t.y0 * image_size + t.x0, image_size);
+                }
+            } else {
+                raytracer.render(0,1,pixels);
+            }
+            auto t1 = std::chrono::high_resolution_clock::now();
+            std::chrono::duration<double> dur = t1 - t0;
+            std::string file = frame_file(opts, frame);
+            raytracer.save_image(file, pixels, append_frame(opts, frame));
+            if (opts.frames == 1) {
+                std::cout << "Single-rank render time: " << dur.count() << " s\n";
+                std::cout << "Image saved to output.ppm\n";
+            } else {
+                std::cout << "Frame " << frame << " rendered in " << dur.count() << " s, saved to " << file << "\n";
+            }
+            local_compute_time += dur.count();
+            ++local_tiles;
+            const unsigned char* rgb = reinterpret_cast<const unsigned char*>(pixels.data());
+            image_checksum = fnv1a64(rgb, pixels.size() * sizeof(Color));
+            if (opts.frames == 1 && !opts.tile_hashes.empty()
+                && !write_tile_hashes(opts.tile_hashes, rgb, image_size, image_size, tile_size, opts.seed_mode)) {
+                std::cerr << "Warning: could not write tile hashes to " << opts.tile_hashes << "\n";
+            }
+        }
+    } else {
+        std::vector<Tile> tiles = make_tiles(image_size, tile_size);
+
+        int num_tiles = (int)tiles.size();
+
+        if (rank == 0) {
+            // Master: coordinate work and gather results. The tasks of all
+            // frames form one queue of (frame, tile), so workers go on with
+            // the next frame while the last tiles of a frame are in flight.
+            // With --checkpoint the frames live in the checkpoint file and
+            // the tiles it marks done are not rendered again.
+            Checkpoint checkpoint;
+            bool checkpointing = !opts.checkpoint.empty();
+            if (checkpointing) {
+                if (!checkpoint.open(opts.checkpoint, checkpoint_key(opts), image_size, image_size, opts.frames,
+                                     num_tiles, error)) {
+                    std::cerr << "Error: " << error << "\n";
+                    MPI_Abort(comm, 1);
+                }
+                if (checkpoint.resumed_tiles() > 0) {
+                    std::cout << "Resuming from checkpoint " << opts.checkpoint << ": " << checkpoint.resumed_tiles()
+                              << " of " << num_tiles * opts.frames << " tiles done\n";
+                }
+            }
+            double last_save = MPI_Wtime();
+
+            struct FrameBuffer {
+                std::vector<unsigned char> own;   // without a checkpoint
+                unsigned char* rgb = nullptr;
+                int received = 0;
+            };
+            std::map<int, FrameBuffer> open_frames;   // frames being rendered or waiting to be written
+            auto frame_buffer = [&](int frame) -> FrameBuffer& {
+                FrameBuffer& fb = open_frames[frame];
+                if (!fb.rgb) {
+                    if (checkpointing) {
+                        fb.rgb = checkpoint.frame(frame);
+                    } else {
+                        fb.own.resize(image_size * image_size * 3);
+                        fb.rgb = fb.own.data();
+                    }
+                }
+                return fb;
+            };
+            int next_write = 0;
+            int tiles_expected = num_tiles * opts.frames;
+            if (checkpointing) {
+                for (int frame = 0; frame < opts.frames; ++frame) {
+                    int done = checkpoint.tiles_done(frame);
+                    if (done > 0) frame_buffer(frame).received = done;
+                }
+                tiles_expected -= checkpoint.resumed_tiles();
+            }
+
+            // write completed frames in order
+            auto write_frames = [&]() {
+                for (auto it = open_frames.find(next_write);
+                     it != open_frames.end() && it->second.received == num_tiles;
+                     it = open_frames.find(next_write)) {
+                    const unsigned char* full_buf = it->second.rgb;
+                    size_t full_bytes = (size_t)image_size * image_size * 3;
+                    std::vector<Color> full_pixels(image_size * image_size);
+                    for (int i = 0; i < image_size * image_size; ++i) {
+                        full_pixels[i] = Color(full_buf[3*i], full_buf[3*i + 1], full_buf[3*i + 2]);
+                    }
+                    std::string file = frame_file(opts, next_write);
+                    raytracer.save_image(file, full_pixels, append_frame(opts, next_write));
+                    if (opts.frames == 1) {
+                        std::cout << "Master: Image saved to output.ppm\n";
+                    } else {
+                        std::cout << "Master: Frame " << next_write << " saved to " << file << "\n";
+                    }
+                    image_checksum = fnv1a64(full_buf, full_bytes);
+                    if (opts.frames == 1 && !opts.tile_hashes.empty()
+                        && !write_tile_hashes(opts.tile_hashes, full_buf, image_size, image_size,
+                                              tile_size, opts.seed_mode)) {
+                        std::cerr << "Warning: could not write tile hashes to " << opts.tile_hashes << "\n";
+                    }
+                    open_frames.erase(it);
+                    ++next_write;
+                }
+            };
+            write_frames();
+
+            // Frame 0 goes in row-major order; each later frame is ordered
+            // most expensive tile first by the latest measured cost per tile
+            // (mostly from the previous frame), so no long tile is left last.
+            std::vector<double> tile_cost(num_tiles, 0.0);
+            std::vector<int> order(num_tiles);
+            int next_frame = 0;
+            int next_pos = 0;
+            // Tail speculation (--speculate): once the queue is empty, idle
+            // workers are parked instead of released and get a copy of a
+            // tile that has been in flight for more than opts.speculate times
+            // the median tile time, times the tiles of its batch. The first
+            // result of a tile is kept and later copies are dropped.
+            int tiles_received = 0;
+            std::vector<char> got(num_tiles * opts.frames, 0);      // first result received
+            std::vector<int> copy_on(num_tiles * opts.frames, 0);   // rank + 1 of the speculative copy
+            std::vector<std::vector<int>> in_flight(size);           // frame * num_tiles + tile per worker
+            std::vector<double> sent_at(size, 0.0);                  // send time of the current batch
+            std::vector<int> sent_tiles(size, 0);                    // tiles in the current batch
+            std::vector<double> tile_times;
+            std::vector<int> parked;
+            int speculated = 0;
+            int speculation_won = 0;
+            if (checkpointing) {
+                for (int frame = 0; frame < opts.frames; ++frame) {
+                    for (int tile = 0; tile < num_tiles; ++tile) {
+                        got[frame * num_tiles + tile] = checkpoint.done(frame, tile);
+                    }
+                }
+            }
+
+            // Progressive previews (--progressive): before its tiles, the
+            // first frame is rendered in passes of every stride-th pixel per
+            // tile without snowflakes, and each pass is written to
+            // opts.preview_output once all its tiles are in.
+            int num_passes = (int)opts.progressive.size();
+            int preview_pass = 0;
+            int preview_pos = 0;
+            std::vector<int> preview_received(num_passes, 0);
+            std::vector<unsigned char> preview(num_passes > 0 ? image_size * image_size * 3 : 0);
+            double first_preview = -1.0;
+
+            // Send `worker` its next tiles, up to opts.batch of one frame or
+            // preview pass (one tile unless --tile-exec task), or done. Tiles
+            // done in the checkpoint are skipped.
+            std::vector<int> outstanding(size, 0);
+            auto send_next = [&](int worker) {
+                std::vector<int> meta;
+                if (preview_pass < num_passes) {
+                    int pass = preview_pass;
+                    while (preview_pass == pass && (int)meta.size() < TASK_INTS * opts.batch) {
+                        const Tile& t = tiles[preview_pos];
+                        meta.insert(meta.end(), {t.id, t.x0, t.y0, t.w, t.h, 0, opts.progressive[pass]});
+                        if (++preview_pos == num_tiles) {
+                            preview_pos = 0;
+                            ++preview_pass;
+                        }
+                    }
+                    MPI_Send(meta.data(), (int)meta.size(), MPI_INT, worker, 1, comm);
+                    outstanding[worker] = (int)meta.size() / TASK_INTS;
+                    in_flight[worker].clear();
+                    return;
+                }
+                int frame = -1;
+                while (next_frame < opts.frames && (frame < 0 || next_frame == frame)
+                       && (int)meta.size() < TASK_INTS * opts.batch) {
+                    if (next_pos == 0) {
+                        std::iota(order.begin(), order.end(), 0);
+                        if (next_frame > 0) {
+                            std::stable_sort(order.begin(), order.end(),
+                                             [&](int a, int b) { return tile_cost[a] > tile_cost[b]; });
+                        }
+                    }
+                    const Tile& t = tiles[order[next_pos]];
+                    if (!checkpointing || !checkpoint.done(next_frame, t.id)) {
+                        meta.insert(meta.end(), {t.id, t.x0, t.y0, t.w, t.h, next_frame, 1});
+                        frame = next_frame;
+                    }
+                    if (++next_pos == num_tiles) {
+                        next_pos = 0;
+                        ++next_frame;
+                    }
+                }
+                if (meta.empty()) {
+                    if (opts.speculate > 0 && tiles_received < tiles_expected) {
+                        parked.push_back(worker);
+                    } else {
+                        MPI_Send(nullptr, 0, MPI_INT, worker, 2, comm); // done
+                    }
+                    return;
+                }
+                MPI_Send(meta.data(), (int)meta.size(), MPI_INT, worker, 1, comm);
+                outstanding[worker] = (int)meta.size() / TASK_INTS;
+                in_flight[worker].clear();
+                for (size_t i = 0; i < meta.size(); i += TASK_INTS) {
+                    in_flight[worker].push_back(meta[i + 5] * num_tiles + meta[i]);
+                }
+                sent_at[worker] = MPI_Wtime();
+                sent_tiles[worker] = outstanding[worker];
+            };
+
+            // Give parked workers copies of the tiles that take too long.
+            auto speculate = [&]() {
+                if (parked.empty() || tile_times.empty()) return;
+                std::vector<double> times = tile_times;
+                std::nth_element(times.begin(), times.begin() + times.size() / 2, times.end());
+                double limit = opts.speculate * times[times.size() / 2];
+                double now = MPI_Wtime();
+                for (int worker = 1; worker < size && !parked.empty(); ++worker) {
+                    // a batch of --tile-exec task is timed as a whole
+                    if (outstanding[worker] == 0 || now - sent_at[worker] <= limit * sent_tiles[worker]) continue;
+                    for (int task : in_flight[worker]) {
+                        if (got[task] || copy_on[task] || parked.empty()) continue;
+                        int helper = parked.back();
+                        parked.pop_back();
+                        const Tile& t = tiles[task % num_tiles];
+                        int meta[TASK_INTS] = {t.id, t.x0, t.y0, t.w, t.h, task / num_tiles, 1};
+                        MPI_Send(meta, TASK_INTS, MPI_INT, helper, 1, comm);
+                        outstanding[helper] = 1;
+                        in_flight[helper].assign(1, task);
+                        sent_at[helper] = now;
+                        sent_tiles[helper] = 1;
+                        copy_on[task] = helper + 1;
+                        ++speculated;
+                    }
+                }
+            };
+
+            // send initial tiles to workers
+            for (int worker = 1; worker < size; ++worker) {
+                send_next(worker);
+            }
+
+            // after the last tile, wait for copies still being rendered
+            while (tiles_received < tiles_expected
+                   || std::any_of(outstanding.begin(), outstanding.end(), [](int n) { return n > 0; })) {
+                MPI_Status status;
+                int header[5]; // tile_id, w, h, frame, stride
+                double c0 = MPI_Wtime();
+                if (!parked.empty()) {
+                    // poll, so that stragglers are noticed while no results come in
+                    int arrived = 0;
+                    while (!arrived) {
+                        speculate();
+                        MPI_Iprobe(MPI_ANY_SOURCE, 4, comm, &arrived, MPI_STATUS_IGNORE);
+                        if (!arrived) std::this_thread::sleep_for(std::chrono::milliseconds(1));
+                    }
+                }
+                MPI_Recv(header, 5, MPI_INT, MPI_ANY_SOURCE, 4, comm, &status);
+                int src = status.MPI_SOURCE;
+                int tile_id = header[0];
+                int w = header[1];
+                int h = header[2];
+                int frame = header[3];
+                int stride = header[4];
+                // the encoded size varies per tile
+                MPI_Probe(src, 5, comm, &status);
+                int bufsize = 0;
+                MPI_Get_count(&status, MPI_UNSIGNED_CHAR, &bufsize);
+                std::vector<unsigned char> buf(bufsize);
+                MPI_Recv(buf.data(), bufsize, MPI_UNSIGNED_CHAR, src, 5, comm, &status);
+                // receive elapsed time for this tile
+                double elapsed = 0.0;
+                MPI_Recv(&elapsed, 1, MPI_DOUBLE, src, 6, comm, &status);
+                local_comm_time += MPI_Wtime() - c0;
+
+                if (stride > 1) {
+                    // each preview pixel fills its stride x stride block of the tile
+                    Tile t = tiles[tile_id];
+                    int pw = (w + stride - 1) / stride;
+                    int ph = (h + stride - 1) / stride;
+                    std::vector<unsigned char> small(pw * ph * 3);
+                    double d0 = MPI_Wtime();
+                    if (!decode_tile(buf.data(), buf.size(), pw, ph, small.data(), pw * 3, error)) {
+                        std::cerr << "Error: preview of tile " << tile_id << " from rank " << src << ": " << error
+                                  << "\n";
+                        MPI_Abort(comm, 1);
+                    }
+                    for (int y = 0; y < h; ++y) {
+                        for (int x = 0; x < w; ++x) {
+                            std::memcpy(&preview[((t.y0 + y) * image_size + t.x0 + x) * 3],
+                                        &small[((y / stride) * pw + x / stride) * 3], 3);
+                        }
+                    }
+                    local_codec_time += MPI_Wtime() - d0;
+                    int pass = (int)(std::find(opts.progressive.begin(), opts.progressive.end(), stride)
+                                     - opts.progressive.begin());
+                    if (++preview_received[pass] == num_tiles) {
+                        std::vector<Color> preview_pixels(image_size * image_size);
+                        for (int i = 0; i < image_size * image_size; ++i) {
+                            preview_pixels[i] = Color(preview[3*i], preview[3*i + 1], preview[3*i + 2]);
+                        }
+                        raytracer.save_image(opts.preview_output, preview_pixels);
+                        if (first_preview < 0) first_preview = MPI_Wtime() - start;
+                        std::cout << "Master: Preview of 1/" << stride * stride << " of the pixels saved to "
+                                  << opts.preview_output << " after " << MPI_Wtime() - start << " s\n";
+                    }
+                    if (--outstanding[src] == 0) send_next(src);
+                    continue;
+                }
+
+                int task = frame * num_tiles + tile_id;
+                std::vector<int>& flying = in_flight[src];
+                flying.erase(std::remove(flying.begin(), flying.end(), task), flying.end());
+                if (got[task]) {
+                    // a slower copy of a speculated tile
+                    if (--outstanding[src] == 0) send_next(src);
+                    continue;
+                }
+                got[task] = 1;
+                if (copy_on[task] == src + 1) ++speculation_won;
+                tile_cost[tile_id] = elapsed;
+                tile_times.push_back(elapsed);
+
+                // decode the tile straight into the frame at its offset
+                FrameBuffer& fb = frame_buffer(frame);
+                Tile t = tiles[tile_id];
+                double d0 = MPI_Wtime();
+                if (!decode_tile(buf.data(), buf.size(), w, h, &fb.rgb[(t.y0 * image_size + t.x0) * 3],
+                                 image_size * 3, error)) {
+                    std::cerr << "Error: tile " << tile_id << " from rank " << src << ": " << error << "\n";
+                    MPI_Abort(comm, 1);
+                }
+                local_codec_time += MPI_Wtime() - d0;
+                ++fb.received;
+                ++tiles_received;
+                if (checkpointing) {
+                    checkpoint.mark_done(frame, tile_id);
+                    if (MPI_Wtime() - last_save >= opts.checkpoint_interval) {
+                        checkpoint.save_async();
+                        last_save = MPI_Wtime();
+                    }
+                }
+
+                // send next tiles to this worker once its batch is done, or done
+                if (--outstanding[src] == 0) {
+                    c0 = MPI_Wtime();
+                    send_next(src);
+                    local_comm_time += MPI_Wtime() - c0;
+                }
+
+                write_frames();
+                if (tiles_received == tiles_expected) {
+                    for (int worker : parked) MPI_Send(nullptr, 0, MPI_INT, worker, 2, comm); // done
+                    parked.clear();
+                }
+            }
+            first_preview_time = first_preview;
+            speculative_tiles[0] = speculated;
+            speculative_tiles[1] = speculation_won;
+            if (checkpointing) {
+                checkpoint_writes = checkpoint.writes();
+                resumed_tiles = checkpoint.resumed_tiles();
+                checkpoint.remove();
+            }
+
+            // (master will compute standard MPI-reduced metrics after workers finish)
+        } else {
+            // Worker loop. With --tile-exec task it runs on the master thread
+            // of one persistent parallel region and each tile of a batch is
+            // an OpenMP task rendered by one thread, so the team stays busy
+            // without a fork/join per tile. Otherwise the pixels of each tile
+            // are spread over the threads.
+            bool tile_tasks = opts.tile_exec == "task";
+            raytracer.set_pixel_parallel(!tile_tasks);
+            // the camera may still be at the last frame of a previous sweep run
+            int current_frame = 0;
+            setup_frame(raytracer, opts, current_frame);
+            std::vector<int> meta(TASK_INTS * opts.batch);
+            #pragma omp parallel if(tile_tasks)
+            #pragma omp master
+            while (true) {
+                MPI_Status status;
+                double c0 = MPI_Wtime();
+                MPI_Recv(meta.data(), (int)meta.size(), MPI_INT, 0, MPI_ANY_TAG, comm, &status);
+                local_comm_time += MPI_Wtime() - c0;
+                if (status.MPI_TAG == 2) {
+                    break; // done
+                }
+                int count = 0;
+                MPI_Get_count(&status, MPI_INT, &count);
+                int n = count / TASK_INTS;
+                int frame = meta[5]; // the tiles of a batch belong to one frame
+                if (frame != current_frame) {
+                    setup_frame(raytracer, opts, frame);
+                    current_frame = frame;
+                }
+
+                std::vector<std::vector<Color>> outs(n);
+                std::vector<std::vector<unsigned char>> bufs(n);
+                std::vector<double> elapsed(n);
+                std::vector<double> encode_time(n);
+                std::vector<double> raw_bytes(n);
+                double b0 = MPI_Wtime();
+                for (int k = 0; k < n; ++k) {
+                    #pragma omp task if(tile_tasks) firstprivate(k) shared(meta, outs, elapsed)
+                    {
+                        const int* m = &meta[TASK_INTS * k]; // tile_id, x0, y0, w, h, frame, stride
+                        unsigned int seed = tile_seed(m[0], rank, per_tile_seeds);
+                        int stride = m[6];
+                        double t0 = omp_get_wtime();
+                        if (stride > 1) {
+                            outs[k].resize(((m[3] + stride - 1) / stride) * ((m[4] + stride - 1) / stride));
+                            raytracer.renderPreview(m[1], m[2], m[3], m[4], stride, outs[k].data());
+                        } else {
+                            raytracer.renderTile(m[1], m[2], m[3], m[4], seed, outs[k]);
+                        }
+                        elapsed[k] = omp_get_wtime() - t0;
+                    }
+                }
+                #pragma omp taskwait
+                // accumulate local compute time (rendering only) for this worker
+                local_compute_time += MPI_Wtime() - b0;
+
+                // convert to bytes and encode for sending
+                for (int k = 0; k < n; ++k) {
+                    #pragma omp task if(tile_tasks) firstprivate(k) shared(meta, outs, bufs, encode_time, raw_bytes)
+                    {
+                        const int* m = &meta[TASK_INTS * k];
+                        int stride = m[6];
+                        const std::vector<Color>& out = outs[k];
+                        double e0 = omp_get_wtime();
+                        std::vector<unsigned char> rgb(out.size() * 3);
+                        for (size_t i = 0; i < out.size(); ++i) {
+                            rgb[3*i + 0] = out[i].r;
+                            rgb[3*i + 1] = out[i].g;
+                            rgb[3*i + 2] = out[i].b;
+                        }
+                        encode_tile(rgb.data(), (m[3] + stride - 1) / stride, (m[4] + stride - 1) / stride,
+                                    tile_encoding, bufs[k]);
+                        encode_time[k] = omp_get_wtime() - e0;
+                        raw_bytes[k] = rgb.size();
+                    }
+                }
+                #pragma omp taskwait
+                for (int k = 0; k < n; ++k) {
+                    if (meta[TASK_INTS * k + 6] == 1) ++local_tiles;
+                    tile_bytes[0] += raw_bytes[k];
+                    tile_bytes[1] += bufs[k].size();
+                    local_codec_time += encode_time[k];
+                }
+
+                c0 = MPI_Wtime();
+                for (int k = 0; k < n; ++k) {
+                    const int* m = &meta[TASK_INTS * k];
+                    int header[5] = {m[0], m[3], m[4], frame, m[6]};
+                    MPI_Send(header, 5, MPI_INT, 0, 4, comm);
+                    MPI_Send(bufs[k].data(), (int)bufs[k].size(), MPI_UNSIGNED_CHAR, 0, 5, comm);
+                    MPI_Send(&elapsed[k], 1, MPI_DOUBLE, 0, 6, comm);
+                }
+                local_comm_time += MPI_Wtime() - c0;
+
+                // lightweight instrumentation to stderr
+                // std::cerr << "Rank " << rank << " rendered " << n << " tile(s) of frame " << frame << "\n";
+            }
+        }
+    }
+
+    double wall_time = MPI_Wtime() - start;
+
+    // --- Report original-style performance metrics (max/min/avg local compute time) ---
+    double max_local_compute_time = 0.0;
+    double min_local_compute_time = 0.0;
+    double sum_local_compute_time = 0.0;
+    MPI_Reduce(&local_compute_time, &max_local_compute_time, 1, MPI_DOUBLE, MPI_MAX, 0, comm);
+    MPI_Reduce(&local_compute_time, &min_local_compute_time, 1, MPI_DOUBLE, MPI_MIN, 0, comm);
+    MPI_Reduce(&local_compute_time, &sum_local_compute_time, 1, MPI_DOUBLE, MPI_SUM, 0, comm);
+
+    // Gather all local compute times to rank 0 for per-rank output
+    std::vector<double> all_local_compute_times(size);
+    MPI_Gather(&local_compute_time, 1, MPI_DOUBLE, all_local_compute_times.data(), 1, MPI_DOUBLE, 0, comm);
+    std::vector<double> all_comm_times(size);
+    MPI_Gather(&local_comm_time, 1, MPI_DOUBLE, all_comm_times.data(), 1, MPI_DOUBLE, 0, comm);
+    std::vector<int> all_tiles(size);
+    MPI_Gather(&local_tiles, 1, MPI_INT, all_tiles.data(), 1, MPI_INT, 0, comm);
+    // camera rays (samples) and supersampled pixels of all ranks
+    unsigned long long local_rays[2] = {raytracer.rays_traced(), raytracer.pixels_refined()};
+    unsigned long long total_rays[2] = {0, 0};
+    MPI_Reduce(local_rays, total_rays, 2, MPI_UNSIGNED_LONG_LONG, MPI_SUM, 0, comm);
+    // tile transport of all workers; encoding time of the workers and decoding time of the master
+    double total_tile_bytes[2] = {0.0, 0.0};
+    MPI_Reduce(tile_bytes, total_tile_bytes, 2, MPI_DOUBLE, MPI_SUM, 0, comm);
+    double worker_codec_time = rank == 0 ? 0.0 : local_codec_time;
+    double encode_time = 0.0;
+    MPI_Reduce(&worker_codec_time, &encode_time, 1, MPI_DOUBLE, MPI_SUM, 0, comm);
+    // work per phase of tile rendering, over all ranks
+    PhaseStats local_phases = raytracer.phase_stats();
+    PhaseStats phases;
+    MPI_Reduce(local_phases.time, phases.time, PhaseStats::PHASES, MPI_DOUBLE, MPI_SUM, 0, comm);
+    unsigned long long local_ops[6] = {local_phases.flakes_generated, local_phases.box_tests,
+                                       local_phases.sphere_tests, local_phases.plane_tests,
+                                       local_phases.flake_tests, local_phases.flakes_near};
+    unsigned long long ops[6] = {0, 0, 0, 0, 0, 0};
+    MPI_Reduce(local_ops, ops, 6, MPI_UNSIGNED_LONG_LONG, MPI_SUM, 0, comm);
+    const char* op_names[6] = {"flakes_generated", "box_tests", "sphere_tests", "plane_tests",
+                               "flake_tests", "flakes_near"};
+    const char* phase_names[PhaseStats::PHASES] = {"flake_gen", "intersect", "overlay"};
+    double pixels_rendered = double(image_size) * image_size * opts.frames;
+
+    if (rank == 0) {
+        double avg_local_compute_time = sum_local_compute_time / size;
+        std::cout << "\n--- Computational Performance Metrics ---\n";
+        std::cout << "Image Size: " << image_size << ", Num Snowmen: " << num_snowmen << ", MPI Processes: " << size << "\n";
+        if (!opts.scene.empty() || opts.scene_share == "bcast" || opts.instancing) {
+            std::cout << "Scene: " << (opts.scene.empty() ? "generated" : opts.scene) << " ("
+                      << scene_view.num_spheres << " spheres, " << scene_view.num_nodes
+                      << " BVH nodes, ";
+            if (scene_view.num_instances > 0) {
+                std::cout << scene_view.num_instances << " instances of " << scene_view.num_template_spheres
+                          << " spheres, ";
+            }
+            std::cout << "ready in " << scene_load_time << " s";
+            if (opts.scene_share == "bcast") {
+                std::cout << ", shared: " << shared.bytes() << " bytes on each of " << shared.nodes() << " node(s)";
+            }
+            std::cout << ")\n";
+        }
+        std::cout << "Max Local Computation Time (across all ranks): " << max_local_compute_time << " seconds\n";
+        std::cout << "Min Local Computation Time (across all ranks): " << min_local_compute_time << " seconds\n";
+        std::cout << "Avg Local Computation Time (across all ranks): " << avg_local_compute_time << " seconds\n";
+        
+        if (opts.aa_samples > 1) {
+            std::cout << "Camera Rays: " << total_rays[0] << " (" << total_rays[0] / pixels_rendered
+                      << " per pixel, " << total_rays[1] << " pixels supersampled with up to "
+                      << opts.aa_samples << " samples)\n";
+        }
+        if (opts.profile_phases) {
+            std::cout << "Phases (thread-seconds):";
+            for (int p = 0; p < PhaseStats::PHASES; ++p) {
+                std::cout << " " << phase_names[p] << " " << phases.time[p];
+            }
+            std::cout << "\nOperations:";
+            for (int i = 0; i < 6; ++i) std::cout << " " << op_names[i] << " " << ops[i];
+            std::cout << "\n";
+        }
+        if (size > 1) {
+            std::cout << "Tile Transport (" << opts.tile_encoding << "): " << total_tile_bytes[1] << " bytes sent for "
+                      << total_tile_bytes[0] << " bytes of pixels (" << total_tile_bytes[1] / total_tile_bytes[0]
+                      << "), encoding " << encode_time << " s on the workers, decoding " << local_codec_time
+                      << " s on the master\n";
+        }
+        if (first_preview_time >= 0) {
+            std::cout << "Progressive: first preview after " << first_preview_time << " s, final image after "
+                      << wall_time << " s\n";
+        }
+        if (opts.speculate > 0 && size > 1) {
+            std::cout << "Speculation: " << speculative_tiles[0] << " tile copies sent, " << speculative_tiles[1]
+                      << " finished first\n";
+        }
+        std::cout << "\n--- Per-Rank Computation Time ---\n";
+        for (int i = 0; i < size; ++i) {
+            std::cout << "Rank " << i << ": " << all_local_compute_times[i] << " seconds\n";
+        }
+
+        if (!opts.metrics_json.empty()) {
+            RunMetrics m;
+            m.image_size = image_size;
+            m.num_snowmen = num_snowmen;
+            m.tile_size = tile_size;
+            m.procs = size;
+            m.threads = omp_get_max_threads();
+            m.mode = (size == 1) ? "single" : (opts.tile_exec == "task" ? "tile-tasks" : "tiles");
+            m.schedule = schedule;
+            m.seed_mode = opts.seed_mode;
+            m.wall_time = wall_time;
+            m.compute_time = all_local_compute_times;
+            m.comm_time = all_comm_times;
+            m.tiles = all_tiles;
+            m.image_file = frame_file(opts, opts.frames - 1);
+            m.image_checksum = image_checksum;
+            m.tile_hashes = opts.frames == 1 ? opts.tile_hashes : "";
+            m.stats.emplace_back("scene_spheres", (double)scene_view.num_spheres);
+            m.stats.emplace_back("scene_bvh_nodes", (double)scene_view.num_nodes);
+            if (opts.instancing) m.stats.emplace_back("scene_instances", (double)scene_view.num_instances);
+            m.stats.emplace_back("scene_load_time", scene_load_time);
+            if (opts.frames > 1) m.stats.emplace_back("frames", opts.frames);
+            if (opts.sweep) m.stats.emplace_back("sweep", 1);
+            m.stats.emplace_back("camera_rays", (double)total_rays[0]);
+            if (opts.tile_exec == "task") m.stats.emplace_back("tile_batch", opts.batch);
+            if (size > 1) {
+                m.stats.emplace_back("tile_bytes_raw", total_tile_bytes[0]);
+                m.stats.emplace_back("tile_bytes_sent", total_tile_bytes[1]);
+                m.stats.emplace_back("tile_encode_time", encode_time);
+                m.stats.emplace_back("tile_decode_time", local_codec_time);
+            }
+            if (!opts.checkpoint.empty() && size > 1) {
+                m.stats.emplace_back("checkpoint_writes", checkpoint_writes);
+                m.stats.emplace_back("resumed_tiles", resumed_tiles);
+            }
+            if (first_preview_time >= 0) {
+                m.stats.emplace_back("preview_passes", (double)opts.progressive.size());
+                m.stats.emplace_back("preview_first_time", first_preview_time);
+            }
+            if (opts.speculate > 0 && size > 1) {
+                m.stats.emplace_back("speculate_factor", opts.speculate);
+                m.stats.emplace_back("speculative_tiles", speculative_tiles[0]);
+                m.stats.emplace_back("speculative_won", speculative_tiles[1]);
+            }
+            if (opts.flake_overlay == "splat") m.stats.emplace_back("flake_splat", 1);
+            if (opts.wavefront) m.stats.emplace_back("wavefront", 1);
+            if (opts.aa_samples > 1) {
+                m.stats.emplace_back("aa_samples", opts.aa_samples);
+                m.stats.emplace_back("aa_threshold", opts.aa_threshold);
+                m.stats.emplace_back("aa_pixels_refined", (double)total_rays[1]);
+                m.stats.emplace_back("rays_per_pixel", total_rays[0] / pixels_rendered);
+            }
+            if (opts.profile_phases) {
+                for (int p = 0; p < PhaseStats::PHASES; ++p) {
+                    m.stats.emplace_back(std::string("phase_time_") + phase_names[p], phases.time[p]);
+                }
+                for (int i = 0; i < 6; ++i) m.stats.emplace_back(std::string("ops_") + op_names[i], (double)ops[i]);
+            }
+            if (opts.scene_share == "bcast") {
+                m.stats.emplace_back("scene_shared_bytes", (double)shared.bytes());
+                m.stats.emplace_back("scene_shared_nodes", (double)shared.nodes());
+            }
+            if (!append_metrics_json(opts.metrics_json, m)) {
+                std::cerr << "Warning: could not write metrics to " << opts.metrics_json << "\n";
+            }
+        }
+    }
+
+
+    RunTimes times;
+    times.wall_time = wall_time;
+    times.max_compute_time = max_local_compute_time;
+    times.avg_compute_time = sum_local_compute_time / size;
+    return times;
+}
+
+int main(int argc, char* argv[]) {
+    // only the master thread makes MPI calls, also inside the task region
+    int thread_level;
+    MPI_Init_thread(&argc, &argv, MPI_THREAD_FUNNELED, &thread_level);
+    double wall_start = MPI_Wtime();
+
+    int rank, size;
+    MPI_Comm_rank(MPI_COMM_WORLD, &rank);
+    MPI_Comm_size(MPI_COMM_WORLD, &size);
+
+    Options opts;
+    std::string error;
+    if (!parse_options(argc, argv, opts, error)) {
+        if (rank == 0) {
+            std::cout << "Error: " << error << "\n";
+            print_usage(argv[0]);
+        }
+        MPI_Finalize();
+        return 1;
+    }
+    // the default batch follows the thread count, which may differ per rank;
+    // the master's batch is what the workers receive
+    MPI_Bcast(&opts.batch, 1, MPI_INT, 0, MPI_COMM_WORLD);
+    if (opts.tile_exec == "task" && thread_level < MPI_THREAD_FUNNELED) {
+        if (rank == 0) {
+            std::cout << "Warning: MPI provides no MPI_THREAD_FUNNELED support, using --tile-exec pixel\n";
+        }
+        opts.tile_exec = "pixel";
+        opts.batch = 1;
+    }
+
+    std::string schedule = apply_schedule(opts);
+    if (schedule.empty()) {
+        if (rank == 0) std::cout << "Error: invalid OpenMP schedule '" << opts.schedule << "'\n";
+        MPI_Finalize();
+        return 1;
+    }
+
+    int image_size = opts.image_size;
+    int num_snowmen = opts.num_snowmen;
+
+    // Scene generation and RayTracer setup
+    Scene scene;
+    MappedScene mapped;
+    SharedScene shared;
+    RayTracer raytracer(image_size, image_size);
+    double scene_load_time = 0.0;
+    double s0 = MPI_Wtime();
+    // with --scene-share bcast only rank 0 builds the scene
+    bool builds_scene = opts.scene_share == "local" || rank == 0;
+    scene.instanced = opts.instancing;
+    if (opts.scene.empty()) {
+        if (builds_scene) scene.generate_snowmen(num_snowmen);
+    } else {
+        // rank 0 parses the description into the cache if it is missing or
+        // stale; then the ranks map the cache instead of parsing it
+        std::string cache = is_scene_cache(opts.scene) ? opts.scene : opts.scene_cache;
+        int ok = 1;
+        if (rank == 0 && cache != opts.scene) {
+            bool rebuilt = false;
+            ok = update_scene_cache(opts.scene, cache, opts.instancing, rebuilt, error) ? 1 : 0;
+            if (ok && rebuilt) std::cout << "Scene cache written to " << cache << "\n";
+        }
+        MPI_Bcast(&ok, 1, MPI_INT, 0, MPI_COMM_WORLD);
+        int mapped_ok = ok && (!builds_scene || mapped.open(cache, error)) ? 1 : 0;
+        MPI_Allreduce(MPI_IN_PLACE, &mapped_ok, 1, MPI_INT, MPI_MIN, MPI_COMM_WORLD);
+        if (!mapped_ok) {
+            if (!error.empty()) std::cout << "Error (rank " << rank << "): " << error << "\n";
+            MPI_Finalize();
+            return 1;
+        }
+    }
+    SceneView scene_view = opts.scene.empty() ? scene.view() : mapped.view();
+    if (opts.scene_share == "bcast") {
+        shared.share(scene_view, MPI_COMM_WORLD);
+        scene_view = shared.view();
+        // rank 0's private copy is no longer needed
+        scene = Scene();
+        mapped.close();
+    }
+    raytracer.set_scene(scene_view);
+    raytracer.set_sampling(opts.aa_samples, opts.aa_threshold);
+    raytracer.set_profiling(opts.profile_phases);
+    raytracer.set_culling(opts.tile_culling);
+    raytracer.set_splatting(opts.flake_overlay == "splat");
+    raytracer.set_wavefront(opts.wavefront);
+    scene_load_time = MPI_Wtime() - s0;
+
+    if (!opts.sweep) {
+        render_run(opts, schedule, MPI_COMM_WORLD, raytracer, scene_view, shared, scene_load_time, wall_start);
+    } else {
+        // The same render on 1, 2, 4, ... ranks and finally all of them, in
+        // one job with the scene built once. Ranks not taking part in a run
+        // wait at the barrier.
+        std::vector<int> counts;
+        for (int p = 1; p < size; p *= 2) counts.push_back(p);
+        counts.push_back(size);
+        std::vector<RunTimes> runs;
+        for (int p : counts) {
+            MPI_Comm comm;
+            MPI_Comm_split(MPI_COMM_WORLD, rank < p ? 0 : MPI_UNDEFINED, rank, &comm);
+            MPI_Barrier(MPI_COMM_WORLD);
+            if (comm != MPI_COMM_NULL) {
+                raytracer.reset_counters();
+                runs.push_back(render_run(opts, schedule, comm, raytracer, scene_view, shared, scene_load_time,
+                                          MPI_Wtime()));
+                MPI_Comm_free(&comm);
+            }
+            MPI_Barrier(MPI_COMM_WORLD);
+        }
+        if (rank == 0) {
+            std::cout << "\n--- Scaling Sweep (scene ready in " << scene_load_time << " s, not included) ---\n";
+            std::printf("%6s %12s %9s %11s %16s %10s\n", "procs", "wall [s]", "speedup", "efficiency",
+                        "max compute [s]", "imbalance");
+            for (size_t i = 0; i < runs.size(); ++i) {
+                const RunTimes& r = runs[i];
+                double speedup = runs[0].wall_time / r.wall_time;
+                std::printf("%6d %12.4f %9.3f %11.3f %16.4f %10.3f\n", counts[i], r.wall_time, speedup,
+                            speedup / counts[i], r.max_compute_time,
+                            r.avg_compute_time > 0 ? r.max_compute_time / r.avg_compute_time : 1.0);
+            }
+        }
+    }
+
+    shared.free();
+    MPI_Finalize();
+    return 0;
+}
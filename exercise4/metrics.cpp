@@ -0,0 +1,170 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+#include "metrics.hpp"
+#include <algorithm>
+#include <cstdio>
+#include <ctime>
+#include <fstream>
+#include <numeric>
+#include <sstream>
+#include <unistd.h>
+
+#ifndef SNOWMAN_GIT_REV
+#define SNOWMAN_GIT_REV "unknown"
+#endif
+
+extern char** environ;
+
+namespace {
+
+const char* SCHEMA = "snowman-metrics/1";
+
+// Environment variables controlling process/thread placement
+const char* PINNING_PREFIXES[] = {"OMP_", "KMP_AFFINITY", "I_MPI_PIN"};
+
+std::string quote(const std::string& s) {
+    std::string out = "\"";
+    for (char c : s) {
+        switch (c) {
+            case '"':  out += "\\\""; break;
+            case '\\': out += "\\\\"; break;
+            case '\n': out += "\\n"; break;
+            case '\t': out += "\\t"; break;
+            default:
+                if (static_cast<unsigned char>(c) < 0x20) {
+                    char buf[8];
+                    std::snprintf(buf, sizeof(buf), "\\u%04x", c);
+                    out += buf;
+                } else {
+                    out += c;
+                }
+        }
+    }
+    return out + "\"";
+}
+
+std::string number(double v) {
+    char buf[32];
+    std::snprintf(buf, sizeof(buf), "%.9g", v);
+    return buf;
+}
+
+template <typename T>
+std::string array(const std::vector<T>& values) {
+    std::string out = "[";
+    for (size_t i = 0; i < values.size(); ++i) {
+        if (i) out += ",";
+        out += number(static_cast<double>(values[i]));
+    }
+    return out + "]";
+}
+
+std::string timestamp() {
+    std::time_t now = std::time(nullptr);
+    char buf[32];
+    std::strftime(buf, sizeof(buf), "%Y-%m-%dT%H:%M:%SZ", std::gmtime(&now));
+    return buf;
+}
+
+std::string pinning_env() {
+    std::vector<std::string> vars;
+    for (char** e = environ; e && *e; ++e) {
+        std::string entry = *e;
+        for (const char* prefix : PINNING_PREFIXES) {
+            if (entry.rfind(prefix, 0) == 0) {
+                vars.push_back(entry);
+                break;
+            }
+        }
+    }
+    std::sort(vars.begin(), vars.end());
+
+    std::string out = "{";
+    for (size_t i = 0; i < vars.size(); ++i) {
+        size_t eq = vars[i].find('=');
+        if (i) out += ",";
+        out += quote(vars[i].substr(0, eq)) + ":" + quote(vars[i].substr(eq + 1));
+    }
+    return out + "}";
+}
+
+} // namespace
+
+bool write_tile_hashes(const std::string& path, const unsigned char* rgb, int width, int height,
+                       int tile_size, const std::string& seed_mode) {
+    std::ofstream ofs(path);
+    if (!ofs) return false;
+    ofs << "snowman-tiles/1 " << width << " " << height << " " << tile_size << " " << seed_mode << "\n";
+    int id = 0;
+    for (int y0 = 0; y0 < height; y0 += tile_size) {
+        for (int x0 = 0; x0 < width; x0 += tile_size) {
+            int w = std::min(tile_size, width - x0);
+            int h = std::min(tile_size, height - y0);
+            uint64_t hash = 14695981039346656037ull;
+            for (int row = 0; row < h; ++row) {
+                hash = fnv1a64(rgb + (size_t(y0 + row) * width + x0) * 3, size_t(w) * 3, hash);
+            }
+            char hex[40];
+            std::snprintf(hex, sizeof(hex), "fnv1a64:%016llx", (unsigned long long)hash);
+            ofs << id++ << " " << x0 << " " << y0 << " " << w << " " << h << " " << hex << "\n";
+        }
+    }
+    return static_cast<bool>(ofs);
+}
+
+bool append_metrics_json(const std::string& path, const RunMetrics& m) {
+    char host[256] = "unknown";
+    gethostname(host, sizeof(host) - 1);
+
+    char checksum[40];
+    std::snprintf(checksum, sizeof(checksum), "fnv1a64:%016llx", (unsigned long long)m.image_checksum);
+
+    double max_t = 0.0, min_t = 0.0, avg_t = 0.0;
+    if (!m.compute_time.empty()) {
+        max_t = *std::max_element(m.compute_time.begin(), m.compute_time.end());
+        min_t = *std::min_element(m.compute_time.begin(), m.compute_time.end());
+        avg_t = std::accumulate(m.compute_time.begin(), m.compute_time.end(), 0.0) / m.compute_time.size();
+    }
+
+    std::ostringstream os;
+    os << "{" << quote("schema") << ":" << quote(SCHEMA)
+       << "," << quote("timestamp") << ":" << quote(timestamp())
+       << "," << quote("host") << ":" << quote(host)
+       << "," << quote("git_rev") << ":" << quote(SNOWMAN_GIT_REV)
+       << "," << quote("compiler") << ":" << quote(__VERSION__)
+       << "," << quote("config") << ":{"
+       << quote("image_size") << ":" << m.image_size
+       << "," << quote("num_snowmen") << ":" << m.num_snowmen
+       << "," << quote("tile_size") << ":" << m.tile_size
+       << "," << quote("procs") << ":" << m.procs
+       << "," << quote("threads") << ":" << m.threads
+       << "," << quote("mode") << ":" << quote(m.mode)
+       << "," << quote("schedule") << ":" << quote(m.schedule)
+       << "," << quote("seed_mode") << ":" << quote(m.seed_mode) << "}"
+       << "," << quote("env") << ":" << pinning_env()
+       << "," << quote("wall_time") << ":" << number(m.wall_time)
+       << "," << quote("max_time") << ":" << number(max_t)
+       << "," << quote("min_time") << ":" << number(min_t)
+       << "," << quote("avg_time") << ":" << number(avg_t)
+       << "," << quote("rank_compute_time") << ":" << array(m.compute_time)
+       << "," << quote("rank_comm_time") << ":" << array(m.comm_time)
+       << "," << quote("rank_tiles") << ":" << array(m.tiles)
+       << "," << quote("image") << ":{"
+       << quote("file") << ":" << quote(m.image_file)
+       << "," << quote("width") << ":" << m.image_size
+       << "," << quote("height") << ":" << m.image_size
+       << "," << quote("checksum") << ":" << quote(checksum)
+       << "," << quote("tile_hashes") << ":" << quote(m.tile_hashes) << "}"
+       << "," << quote("stats") << ":{";
+    for (size_t i = 0; i < m.stats.size(); ++i) {
+        if (i) os << ",";
+        os << quote(m.stats[i].first) << ":" << number(m.stats[i].second);
+    }
+    os << "}}\n";
+
+    std::ofstream ofs(path, std::ios::app);
+    if (!ofs) return false;
+    ofs << os.str();
+    return static_cast<bool>(ofs);
+}
@@ -0,0 +1,51 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+
+#ifndef METRICS_HPP
+#define METRICS_HPP
+
+#include <cstddef>
+#include <cstdint>
+#include <string>
+#include <utility>
+#include <vector>
+#include "utils.hpp"
+
+// One run of the renderer, written as a single NDJSON line by the master.
+// Field names are the schema shared with the Python tools (snowman_metrics.py).
+struct RunMetrics {
+    int image_size = 0;
+    int num_snowmen = 0;
+    int tile_size = 0;
+    int procs = 1;
+    int threads = 1;
+    std::string mode;                   // "single", "tiles" or "tile-tasks"
+    std::string schedule;               // OpenMP schedule of the pixel loop, "kind,chunk"
+    std::string seed_mode;              // "rank" or "tile"
+
+    double wall_time = 0.0;             // rank 0, from after MPI_Init to image written
+    std::vector<double> compute_time;   // per rank: sum of render times
+    std::vector<double> comm_time;      // per rank: time spent in MPI calls of the tile protocol
+    std::vector<int> tiles;             // per rank: tiles rendered
+
+    std::string image_file;
+    uint64_t image_checksum = 0;        // FNV-1a 64 over the RGB bytes
+    std::string tile_hashes;            // file written by write_tile_hashes, if any
+
+    // Additional named counters of optional features
+    std::vector<std::pair<std::string, double>> stats;
+};
+
+// Write FNV-1a 64 hashes of the tile_size x tile_size tiles of an RGB image
+// (row-major tile order as in main.cpp) for compare_renders.py:
+//   snowman-tiles/1 <width> <height> <tile_size> <seed_mode>
+//   <tile_id> <x0> <y0> <w> <h> fnv1a64:<hex>     (one line per tile)
+// Returns false if the file cannot be written.
+bool write_tile_hashes(const std::string& path, const unsigned char* rgb, int width, int height,
+                       int tile_size, const std::string& seed_mode);
+
+// Append `m` as one JSON line to `path`. Returns false if the file cannot be written.
+bool append_metrics_json(const std::string& path, const RunMetrics& m);
+
+#endif
@@ -0,0 +1,288 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+#include "options.hpp"
+#include <cstdlib>
+#include <iostream>
+#include <stdexcept>
+#include <omp.h>
+#include "tile_codec.hpp"
+
+namespace {
+
+bool parse_int(const std::string& s, int& value) {
+    try {
+        size_t pos = 0;
+        value = std::stoi(s, &pos);
+        return pos == s.size();
+    } catch (const std::exception&) {
+        return false;
+    }
+}
+
+bool parse_double(const std::string& s, double& value) {
+    try {
+        size_t pos = 0;
+        value = std::stod(s, &pos);
+        return pos == s.size();
+    } catch (const std::exception&) {
+        return false;
+    }
+}
+
+} // namespace
+
+bool parse_options(int argc, char* argv[], Options& opts, std::string& error) {
+    if (const char* env = std::getenv("SNOWMAN_METRICS_JSON")) {
+        opts.metrics_json = env;
+    }
+
+    int positional = 0;
+    for (int i = 1; i < argc; ++i) {
+        std::string arg = argv[i];
+        auto next_value = [&](std::string& value) {
+            if (i + 1 >= argc) {
+                error = "missing value for " + arg;
+                return false;
+            }
+            value = argv[++i];
+            return true;
+        };
+
+        if (arg == "--metrics-json") {
+            if (!next_value(opts.metrics_json)) return false;
+        } else if (arg == "--schedule") {
+            if (!next_value(opts.schedule)) return false;
+        } else if (arg == "--seed-mode") {
+            if (!next_value(opts.seed_mode)) return false;
+            if (opts.seed_mode != "rank" && opts.seed_mode != "tile") {
+                error = "--seed-mode must be 'rank' or 'tile'";
+                return false;
+            }
+        } else if (arg == "--tile-hashes") {
+            if (!next_value(opts.tile_hashes)) return false;
+        } else if (arg == "--scene") {
+            if (!next_value(opts.scene)) return false;
+        } else if (arg == "--scene-cache") {
+            if (!next_value(opts.scene_cache)) return false;
+        } else if (arg == "--frames" || arg == "--orbit" || arg == "--snowfall") {
+            std::string value;
+            if (!next_value(value)) return false;
+            bool ok = arg == "--frames" ? parse_int(value, opts.frames) && opts.frames > 0
+                    : parse_double(value, arg == "--orbit" ? opts.orbit : opts.snowfall);
+            if (!ok) {
+                error = "invalid value '" + value + "' for " + arg;
+                return false;
+            }
+        } else if (arg == "--aa-samples" || arg == "--aa-threshold") {
+            std::string value;
+            if (!next_value(value)) return false;
+            int& target = arg == "--aa-samples" ? opts.aa_samples : opts.aa_threshold;
+            if (!parse_int(value, target) || target < (arg == "--aa-samples" ? 1 : 0)) {
+                error = "invalid value '" + value + "' for " + arg;
+                return false;
+            }
+        } else if (arg == "--tile-exec") {
+            if (!next_value(opts.tile_exec)) return false;
+            if (opts.tile_exec != "pixel" && opts.tile_exec != "task") {
+                error = "--tile-exec must be 'pixel' or 'task'";
+                return false;
+            }
+        } else if (arg == "--batch") {
+            std::string value;
+            if (!next_value(value)) return false;
+            if (!parse_int(value, opts.batch) || opts.batch < 1) {
+                error = "invalid value '" + value + "' for --batch";
+                return false;
+            }
+        } else if (arg == "--frame-output") {
+            if (!next_value(opts.frame_output)) return false;
+        } else if (arg == "--instancing") {
+            opts.instancing = true;
+        } else if (arg == "--flake-overlay") {
+            if (!next_value(opts.flake_overlay)) return false;
+            if (opts.flake_overlay != "ray" && opts.flake_overlay != "splat") {
+                error = "--flake-overlay must be 'ray' or 'splat'";
+                return false;
+            }
+        } else if (arg == "--tile-encoding") {
+            TileEncoding encoding;
+            if (!next_value(opts.tile_encoding)) return false;
+            if (!parse_tile_encoding(opts.tile_encoding, encoding, error)) return false;
+        } else if (arg == "--checkpoint") {
+            if (!next_value(opts.checkpoint)) return false;
+        } else if (arg == "--checkpoint-interval") {
+            std::string value;
+            if (!next_value(value)) return false;
+            if (!parse_double(value, opts.checkpoint_interval) || opts.checkpoint_interval < 0) {
+                error = "invalid value '" + value + "' for --checkpoint-interval";
+                return false;
+            }
+        } else if (arg == "--speculate") {
+            std::string value;
+            if (!next_value(value)) return false;
+            if (!parse_double(value, opts.speculate) || opts.speculate < 0) {
+                error = "invalid value '" + value + "' for --speculate";
+                return false;
+            }
+        } else if (arg == "--sweep") {
+            opts.sweep = true;
+        } else if (arg == "--progressive") {
+            std::string value;
+            if (!next_value(value)) return false;
+            opts.progressive.clear();
+            size_t pos = 0;
+            while (pos <= value.size()) {
+                size_t comma = value.find(',', pos);
+                if (comma == std::string::npos) comma = value.size();
+                int stride = 0;
+                if (!parse_int(value.substr(pos, comma - pos), stride) || stride < 2
+                    || (!opts.progressive.empty() && stride >= opts.progressive.back())) {
+                    error = "--progressive expects decreasing strides > 1, e.g. 8,4,2";
+                    return false;
+                }
+                opts.progressive.push_back(stride);
+                pos = comma + 1;
+            }
+        } else if (arg == "--preview-output") {
+            if (!next_value(opts.preview_output)) return false;
+        } else if (arg == "--wavefront") {
+            opts.wavefront = true;
+        } else if (arg == "--no-tile-culling") {
+            opts.tile_culling = false;
+        } else if (arg == "--profile-phases") {
+            opts.profile_phases = true;
+        } else if (arg == "--scene-share") {
+            if (!next_value(opts.scene_share)) return false;
+            if (opts.scene_share != "local" && opts.scene_share != "bcast") {
+                error = "--scene-share must be 'local' or 'bcast'";
+                return false;
+            }
+        } else if (arg.rfind("--", 0) == 0) {
+            error = "unknown option " + arg;
+            return false;
+        } else {
+            // no snowmen renders the empty scene
+            int value = 0;
+            int min_value = positional == 1 ? 0 : 1;
+            if (!parse_int(arg, value) || value < min_value) {
+                error = std::string(min_value == 0 ? "expected a non-negative" : "expected a positive")
+                        + " integer, got '" + arg + "'";
+                return false;
+            }
+            switch (positional++) {
+                case 0: opts.image_size = value; break;
+                case 1: opts.num_snowmen = value; break;
+                case 2: opts.tile_size = value; break;
+                default:
+                    error = "too many arguments";
+                    return false;
+            }
+        }
+    }
+
+    if (positional < 3) {
+        error = "expected <image_size> <num_snowmen> <tile_size>";
+        return false;
+    }
+    if (opts.tile_exec == "task" && opts.batch == 0) {
+        // one tile per thread and a spare one to take while others finish
+        opts.batch = 2 * omp_get_max_threads();
+    } else if (opts.tile_exec == "pixel") {
+        opts.batch = 1;
+    }
+    if (!opts.scene.empty() && opts.scene_cache.empty()) {
+        opts.scene_cache = opts.scene + ".bin";
+    }
+    return true;
+}
+
+void print_usage(const char* prog) {
+    std::cout << "Usage: " << prog << " <image_size> <num_snowmen> <tile_size> [options]\n"
+              << "Options:\n"
+              << "  --metrics-json <path>   append a JSON metrics record for this run\n"
+              << "                          (default: $SNOWMAN_METRICS_JSON)\n"
+              << "  --schedule <kind[,chunk]> OpenMP schedule of the pixel loop: static, dynamic,\n"
+              << "                          guided or auto (default: $OMP_SCHEDULE, else static)\n"
+              << "  --seed-mode rank|tile     seed snowflakes per tile and worker rank (default) or\n"
+              << "                          per tile only (image independent of the process count)\n"
+              << "  --tile-hashes <path>      write per-tile hashes of the image (default: output.tiles,\n"
+              << "                          empty to disable)\n"
+              << "  --scene <path>            render the scene described in this file instead of a\n"
+              << "                          row of num_snowmen snowmen\n"
+              << "  --scene-cache <path>      binary cache of --scene, rebuilt when the file changes\n"
+              << "                          (default: <scene>.bin)\n"
+              << "  --scene-share local|bcast build the scene on every rank (default) or on rank 0\n"
+              << "                          only, shared by all ranks of a node via MPI_Bcast and\n"
+              << "                          a shared-memory window\n"
+              << "  --instancing              store snowmen as instances of one template (two-level BVH)\n"
+              << "  --frames <n>              render an animation of n frames (default 1: output.ppm)\n"
+              << "  --orbit <degrees>         camera orbit over the whole animation (default 0)\n"
+              << "  --snowfall <units>        snowflake fall per frame (default 0)\n"
+              << "  --frame-output <path>     printf pattern for numbered frames (default frame_%04d.ppm)\n"
+              << "                          or one file for a stream of PPM frames\n"
+              << "  --tile-exec pixel|task    parallelize each tile over its pixels (default) or render\n"
+              << "                          batches of tiles as OpenMP tasks, one tile per thread\n"
+              << "  --batch <n>               tiles per request with --tile-exec task (default: 2 per thread)\n"
+              << "  --aa-samples <n>          adaptive anti-aliasing: up to n samples for high-contrast\n"
+              << "                          pixels (default 1: off)\n"
+              << "  --aa-threshold <t>        contrast (0-255 per channel) that triggers extra samples\n"
+              << "                          (default 16)\n"
+              << "  --flake-overlay ray|splat test the snowflakes per camera ray (default) or splat\n"
+              << "                          each one onto the pixels it can cover\n"
+              << "  --tile-encoding <enc>     compress tiles sent to the master: raw (default), rle,\n"
+              << "                          delta (rows minus the row above, then rle) or lz4\n"
+              << "  --checkpoint <path>       keep the rendered tiles in this file and resume from it\n"
+              << "                          when restarted with the same settings (deleted when done)\n"
+              << "  --checkpoint-interval <s> seconds between checkpoint saves (default 60)\n"
+              << "  --speculate <factor>      at the end of the run, send idle workers copies of tiles\n"
+              << "                          in flight for over factor x the median tile time (default 0: off)\n"
+              << "  --sweep                   render on 1, 2, 4, ... and all ranks of the job in turn\n"
+              << "                          and print a table of the scaling (one record per run)\n"
+              << "  --progressive <s1,s2,..>  first write previews of every s-th pixel (decreasing\n"
+              << "                          strides, e.g. 8,4,2; no snowflakes) of the first frame\n"
+              << "  --preview-output <path>   file of the previews (default preview.ppm)\n"
+              << "  --wavefront               render each tile in stages: visibility, shadow rays,\n"
+              << "                          shading, snowflakes\n"
+              << "  --no-tile-culling         test every snowflake in every tile (for comparison)\n"
+              << "  --profile-phases          time the phases of tile rendering and report their\n"
+              << "                          operation counts (see roofline.py)\n";
+}
+
+std::string apply_schedule(const Options& opts) {
+    if (!opts.schedule.empty()) {
+        std::string spec = opts.schedule;
+        int chunk = 0;
+        size_t comma = spec.find(',');
+        if (comma != std::string::npos) {
+            try {
+                chunk = std::stoi(spec.substr(comma + 1));
+            } catch (const std::exception&) {
+                return "";
+            }
+            spec = spec.substr(0, comma);
+        }
+
+        omp_sched_t kind;
+        if (spec == "static") kind = omp_sched_static;
+        else if (spec == "dynamic") kind = omp_sched_dynamic;
+        else if (spec == "guided") kind = omp_sched_guided;
+        else if (spec == "auto") kind = omp_sched_auto;
+        else return "";
+        omp_set_schedule(kind, chunk);
+    } else if (!std::getenv("OMP_SCHEDULE")) {
+        // keep the behaviour of the former plain collapse(2) loop
+        omp_set_schedule(omp_sched_static, 0);
+    }
+
+    omp_sched_t kind;
+    int chunk;
+    omp_get_schedule(&kind, &chunk);
+    // strip the monotonic modifier bit some runtimes report
+    switch (static_cast<int>(kind) & 0xff) {
+        case omp_sched_static:  return "static," + std::to_string(chunk);
+        case omp_sched_dynamic: return "dynamic," + std::to_string(chunk);
+        case omp_sched_guided:  return "guided," + std::to_string(chunk);
+        default:                return "auto," + std::to_string(chunk);
+    }
+}
@@ -0,0 +1,122 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+
+#ifndef OPTIONS_HPP
+#define OPTIONS_HPP
+
+#include <string>
+#include <vector>
+
+// Command line configuration of a run:
+//   snowman <image_size> <num_snowmen> <tile_size> [options]
+struct Options {
+    int image_size = 0;
+    int num_snowmen = 0;
+    int tile_size = 0;
+
+    // Append one NDJSON metrics record per run to this file.
+    // Defaults to $SNOWMAN_METRICS_JSON if set.
+    std::string metrics_json;
+
+    // OpenMP schedule of the pixel loop, e.g. "static", "dynamic,16", "guided".
+    // Empty: $OMP_SCHEDULE if set, otherwise static.
+    std::string schedule;
+
+    // Snowflake seeds: "rank" derives them from tile id and worker rank (the
+    // original behaviour), "tile" from the tile id only, which makes the image
+    // independent of the process count and of which worker got which tile.
+    std::string seed_mode = "rank";
+
+    // Per-tile hashes of the final image (see write_tile_hashes); empty: off.
+    std::string tile_hashes = "output.tiles";
+
+    // Scene description file (see scene_file.cpp) replacing the row of
+    // num_snowmen snowmen, and its binary cache (default: <scene>.bin).
+    // A cache file can also be given as the scene directly.
+    std::string scene;
+    std::string scene_cache;
+
+    // How ranks get the scene: "local" builds (or maps) it on every rank,
+    // "bcast" builds it on rank 0 only and broadcasts it into one MPI
+    // shared-memory window per node (see scene_share.hpp).
+    std::string scene_share = "local";
+
+    // Store snowmen as instances of one template with a two-level BVH
+    // instead of as individual spheres.
+    bool instancing = false;
+
+    // Animation: render `frames` frames in one job. The camera orbits the
+    // scene by `orbit` degrees over the sequence and the snowflakes fall by
+    // `snowfall` units per frame. Frames go to `frame_output`: a printf
+    // pattern gives numbered PPM files, any other name one file holding the
+    // stream of PPM frames. With frames == 1 the image is output.ppm as before.
+    int frames = 1;
+    double orbit = 0.0;
+    double snowfall = 0.0;
+    std::string frame_output = "frame_%04d.ppm";
+
+    // Adaptive anti-aliasing: up to aa_samples camera rays per pixel for
+    // pixels whose contrast to a neighbour exceeds aa_threshold (0-255).
+    int aa_samples = 1;
+    int aa_threshold = 16;
+
+    // Execution of tiles on a worker: "pixel" spreads the pixels of one tile
+    // over the OpenMP threads, "task" requests `batch` tiles at a time and
+    // renders them as OpenMP tasks (one tile per task, one thread per tile);
+    // batch 0 picks two tiles per thread.
+    std::string tile_exec = "pixel";
+    int batch = 0;
+
+    // Cull snowflakes and sky-only tiles per tile frustum (same image, faster).
+    bool tile_culling = true;
+
+    // Snowflake overlay: "ray" tests every flake per camera ray, "splat"
+    // projects the flakes of a tile and tests only their footprints (same image).
+    std::string flake_overlay = "ray";
+
+    // Render tiles in stages (G-buffer, shadow rays, shading, snowflakes)
+    // instead of pixel by pixel (same image).
+    bool wavefront = false;
+
+    // Encoding of the tiles sent from workers to the master: raw, rle, delta
+    // or lz4 (see tile_codec.hpp); a tile that does not shrink is sent raw.
+    std::string tile_encoding = "raw";
+
+    // Keep the progress of the master in this file (see checkpoint.hpp) and
+    // make it durable every checkpoint_interval seconds; a job restarted with
+    // the same settings renders only the missing tiles. Empty: off.
+    std::string checkpoint;
+    double checkpoint_interval = 60.0;
+
+    // Tail speculation: when no tiles are left to hand out, idle workers get
+    // a copy of any tile in flight for longer than `speculate` times the
+    // median tile time (per tile of its batch with --tile-exec task); the
+    // first result is kept. 0: off.
+    double speculate = 0.0;
+
+    // Scaling sweep: render on 1, 2, 4, ... ranks and finally all ranks of
+    // the job (sub-communicators of MPI_COMM_WORLD) and print one table.
+    bool sweep = false;
+
+    // Progressive rendering: before its tiles, the first frame is rendered in
+    // preview passes of every stride-th pixel (in x and y) of each tile,
+    // without snowflakes, and each pass is written to preview_output. Empty: off.
+    std::vector<int> progressive;
+    std::string preview_output = "preview.ppm";
+
+    // Time the phases of tile rendering and report them with their operation
+    // counts (for roofline.py).
+    bool profile_phases = false;
+};
+
+// Parse argv into `opts`. Returns false and sets `error` on invalid input.
+bool parse_options(int argc, char* argv[], Options& opts, std::string& error);
+
+void print_usage(const char* prog);
+
+// Apply opts.schedule (or the default) to the OpenMP runtime and return the
+// effective schedule as "kind,chunk". Returns an empty string if it is invalid.
+std::string apply_schedule(const Options& opts);
+
+#endif
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Benchmark orchestrator for the snowman binary.
+
+Replaces the hard-coded loops of the bash sweep scripts with a declarative
+sweep spec (TOML, or YAML if PyYAML is installed). Every configuration is run
+`repetitions` times in randomized order; independent runs are launched
+concurrently on disjoint cores when `concurrent = true` and the node has room.
+Each run writes its metrics record (`--metrics-json`, see snowman_metrics.py)
+to <output>/metrics/<key>.ndjson, so results are collected without scraping
+logs. Completed runs are appended to <output>/runs.ndjson, so an interrupted
+sweep is resumed by starting it again with the same spec.
+
+Spec example (see sweeps/*.toml):
+
+    binary = "./snowman"
+    launcher = "mpirun"            # or "srun"
+    repetitions = 3
+    output = "results/sweeps/tile_sizes"
+
+    [env]
+    OMP_PLACES = "cores"
+
+    [[grid]]                       # cartesian product of all lists
+    image_size = [1024]
+    snowmen = [4]
+    tile_size = [8, 16, 32, 64, 128, 256]
+    procs = [4]
+    threads = [3, 12, 24]
+
+A grid may list keys under `zip = [...]` to pair them element-wise instead of
+crossing them (e.g. procs and image_size for weak scaling).
+
+Usage:
+    ./orchestrate.py sweeps/tile_sizes_dynamic.toml [--dry-run] [--concurrent]
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import shlex
+import signal
+import subprocess
+import sys
+import time
+
+import results_db
+import snowman_metrics
+
+CONFIG_KEYS = ('image_size', 'snowmen', 'tile_size', 'procs', 'threads')
+DEFAULTS = {
+    'binary': './snowman',
+    'launcher': 'mpirun',
+    'launcher_args': [],
+    'repetitions': 1,
+    'shuffle': True,
+    'seed': None,
+    'concurrent': False,
+    'max_cores': None,
+    'timeout': None,
+    'build': None,
+    'output': 'results/sweep',
+    'record_db': None,
+    'variant': '',
+    'env': {},
+}
+
+
+# ---------------------------------------------------------------------------
+# Spec handling
+# ---------------------------------------------------------------------------
+
+def load_spec(path):
+    """
+    Load a sweep spec from TOML or YAML and fill in defaults.
+    """
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit('YAML specs need PyYAML (pip install pyyaml); use TOML instead')
+        with open(path) as f:
+            spec = yaml.safe_load(f)
+    else:
+        import tomllib
+        with open(path, 'rb') as f:
+            spec = tomllib.load(f)
+
+    merged = dict(DEFAULTS)
+    merged.update(spec)
+    if 'grid' not in merged:
+        raise SystemExit(f'{path}: spec needs at least one [[grid]] table')
+    if isinstance(merged['grid'], dict):
+        merged['grid'] = [merged['grid']]
+    if merged['launcher'] not in ('mpirun', 'srun'):
+        raise SystemExit(f"{path}: launcher must be 'mpirun' or 'srun', not {merged['launcher']!r}")
+    return merged
+
+
+def expand_grid(grid):
+    """
+    Expand one [[grid]] table into a list of configuration dicts.
+    """
+    grid = dict(grid)
+    zipped = grid.pop('zip', [])
+    fixed = {k: v for k, v in grid.items() if not isinstance(v, list)}
+    axes = {k: v for k, v in grid.items() if isinstance(v, list)}
+
+    zip_axes = {k: axes.pop(k) for k in zipped}
+    if zip_axes and len({len(v) for v in zip_axes.values()}) != 1:
+        raise SystemExit(f'zip keys {zipped} must have lists of equal length')
+    zip_rows = [dict(zip(zip_axes, row)) for row in zip(*zip_axes.values())] or [{}]
+
+    configs = []
+    keys = list(axes)
+    for values in itertools.product(*(axes[k] for k in keys)):
+        for zrow in zip_rows:
+            config = dict(fixed)
+            config.update(zip(keys, values))
+            config.update(zrow)
+            missing = [k for k in CONFIG_KEYS if k not in config]
+            if missing:
+                raise SystemExit(f'grid entry {config} is missing {missing}')
+            configs.append(config)
+    return configs
+
+
+def run_key(config, repetition):
+    """
+    Stable identifier of one (configuration, repetition) pair, used for resuming.
+    """
+    blob = json.dumps({'config': config, 'rep': repetition}, sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+def plan_runs(spec):
+    """
+    All (key, config, repetition) triples of the sweep, shuffled if requested.
+    """
+    runs = []
+    seen = set()
+    for grid in spec['grid']:
+        for config in expand_grid(grid):
+            for rep in range(spec['repetitions']):
+                key = run_key(config, rep)
+                if key not in seen:
+                    seen.add(key)
+                    runs.append((key, config, rep))
+    if spec['shuffle']:
+        random.Random(spec['seed']).shuffle(runs)
+    return runs
+
+
+def completed_keys(state_path):
+    """
+    Keys of runs that already finished successfully in a previous invocation.
+    """
+    done = set()
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # partially written line from an interrupted sweep
+                if record.get('status') == 'ok':
+                    done.add(record['key'])
+    return done
+
+
+# ---------------------------------------------------------------------------
+# Launching
+# ---------------------------------------------------------------------------
+
+def build_command(spec, config, cpus=None):
+    """
+    Command line for one run with the configured launcher.
+    """
+    args = [spec['binary'], str(config['image_size']), str(config['snowmen']), str(config['tile_size'])]
+    args += [str(a) for a in config.get('args', [])]
+    extra = [str(a) for a in spec['launcher_args']]
+    if spec['launcher'] == 'srun':
+        # srun places concurrent job steps on disjoint cores itself
+        return ['srun', '--exact', '-n', str(config['procs']), '-c', str(config['threads']),
+                '--cpu-bind=cores'] + extra + args
+    cmd = ['mpirun', '-np', str(config['procs'])] + extra + args
+    if cpus is not None:
+        # confine concurrent local runs to their own cores; MPI-level binding would
+        # otherwise place every run on the first cores of the node
+        cmd = ['taskset', '-c', ','.join(map(str, cpus))] + cmd
+    return cmd
+
+
+def run_env(spec, config, cpus=None, metrics_path=None):
+    env = dict(os.environ)
+    env.update({k: str(v) for k, v in spec['env'].items()})
+    env['OMP_NUM_THREADS'] = str(config['threads'])
+    for k, v in config.get('env', {}).items():
+        env[k] = str(v)
+    if metrics_path is not None:
+        env['SNOWMAN_METRICS_JSON'] = metrics_path
+    if cpus is not None:
+        if spec['launcher'] == 'mpirun':
+            env['OMPI_MCA_hwloc_base_binding_policy'] = 'none'
+            env['I_MPI_PIN'] = 'off'
+    return env
+
+
+def session_pids(sid):
+    """
+    Processes left in session `sid` (Linux /proc; empty elsewhere).
+    """
+    pids = []
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if entry.isdigit():
+            try:
+                if os.getsid(int(entry)) == sid:
+                    pids.append(int(entry))
+            except OSError:
+                pass
+    return pids
+
+
+def terminate(proc, grace=5.0):
+    """
+    Stop a run started in its own session and wait until its ranks are gone.
+    SIGTERM goes to the launcher's process group first: mpirun and srun forward
+    it and take the ranks down with them, while a SIGKILLed mpirun leaves them
+    running in their own process groups. Whatever is left of the session after
+    `grace` seconds is killed.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    deadline = time.perf_counter() + grace
+    while (proc.poll() is None or session_pids(proc.pid)) and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    for pid in session_pids(proc.pid):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    if proc.poll() is None:
+        proc.kill()
+    proc.wait()
+
+
+class CorePool:
+    """
+    Hands out disjoint sets of core ids to concurrently running configurations.
+    """
+
+    def __init__(self, total):
+        self.free = list(range(total))
+
+    def acquire(self, n):
+        if n > len(self.free):
+            return None
+        cpus, self.free = self.free[:n], self.free[n:]
+        return cpus
+
+    def release(self, cpus):
+        self.free = sorted(self.free + cpus)
+
+
+def collect_result(key, config, rep, proc, log_path, metrics_path, wall, cpus):
+    """
+    Structured record for a finished run, built from the binary's metrics file.
+    """
+    record = {'key': key, 'config': config, 'rep': rep, 'returncode': proc.returncode,
+              'wall_time': wall, 'log': log_path, 'cpus': cpus,
+              'finished_at': results_db.now()}
+    metrics = snowman_metrics.load_records(metrics_path) if os.path.exists(metrics_path) else []
+    if proc.returncode != 0 or len(metrics) != 1:
+        record['status'] = 'failed'
+        return record
+    record['status'] = 'ok'
+    record['metrics'] = metrics[0]
+    return record
+
+
+def store_in_db(spec, record):
+    run = snowman_metrics.to_run(record['metrics'], source=record['log'], label=spec['variant'])
+    run['extra'].update(sweep_key=record['key'], rep=record['rep'])
+    conn = results_db.connect(spec['record_db'])
+    with conn:
+        results_db.insert_run(conn, run)
+    conn.close()
+
+
+def run_sweep(spec, dry_run=False):
+    output = spec['output']
+    state_path = os.path.join(output, 'runs.ndjson')
+    log_dir = os.path.join(output, 'logs')
+
+    runs = plan_runs(spec)
+    done = completed_keys(state_path)
+    pending = [r for r in runs if r[0] not in done]
+    print(f'{len(runs)} runs planned, {len(runs) - len(pending)} already completed, {len(pending)} to go')
+
+    if dry_run:
+        for key, config, rep in pending:
+            print(f'[{key}] rep {rep}: {shlex.join(build_command(spec, config))}  '
+                  f'(OMP_NUM_THREADS={config["threads"]})')
+        return 0
+
+    metrics_dir = os.path.join(output, 'metrics')
+    os.makedirs(log_dir, exist_ok=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+    if spec['build']:
+        subprocess.run(spec['build'], shell=True, check=True)
+
+    total_cores = spec['max_cores'] or os.cpu_count()
+    pool = CorePool(total_cores)
+    concurrent = spec['concurrent']
+    running = []  # (key, config, rep, proc, log_file, metrics_path, t0, cpus)
+    failures = 0
+
+    with open(state_path, 'a') as state:
+        while pending or running:
+            # start whatever fits; without concurrency only one run at a time
+            i = 0
+            while i < len(pending) and (concurrent or not running):
+                key, config, rep = pending[i]
+                cpus = None
+                if concurrent:
+                    # backfill: skip runs that do not fit into the currently free cores
+                    cpus = pool.acquire(min(config['procs'] * config['threads'], total_cores))
+                    if cpus is None:
+                        i += 1
+                        continue
+                pending.pop(i)
+                cmd = build_command(spec, config, cpus)
+                log_path = os.path.join(log_dir, f'{key}.out')
+                metrics_path = os.path.join(metrics_dir, f'{key}.ndjson')
+                if os.path.exists(metrics_path):
+                    os.remove(metrics_path)  # left over from an interrupted attempt
+                log_file = open(log_path, 'w')
+                print(f'[{key}] start rep {rep}: {shlex.join(cmd)}', flush=True)
+                # own process group, so that a timeout can kill the ranks along with the launcher
+                proc = subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT,
+                                        env=run_env(spec, config, cpus, metrics_path), start_new_session=True)
+                running.append((key, config, rep, proc, log_file, metrics_path, time.perf_counter(), cpus))
+
+            time.sleep(0.05)
+            for entry in list(running):
+                key, config, rep, proc, log_file, metrics_path, t0, cpus = entry
+                timed_out = spec['timeout'] and time.perf_counter() - t0 > spec['timeout']
+                if timed_out and proc.poll() is None:
+                    terminate(proc)
+                if proc.poll() is None:
+                    continue
+                running.remove(entry)
+                log_file.close()
+                if cpus is not None:
+                    pool.release(cpus)
+                record = collect_result(key, config, rep, proc, log_file.name, metrics_path,
+                                        time.perf_counter() - t0, cpus)
+                if timed_out:
+                    record['status'] = 'timeout'
+                state.write(json.dumps(record) + '\n')
+                state.flush()
+                if record['status'] == 'ok':
+                    print(f"[{key}] done  {config['procs']}p×{config['threads']}t tile {config['tile_size']}: "
+                          f"{record['metrics']['max_time']:.3f} s", flush=True)
+                    if spec['record_db']:
+                        store_in_db(spec, record)
+                else:
+                    failures += 1
+                    print(f"[{key}] {record['status']} (exit code {proc.returncode}), see {log_file.name}",
+                          flush=True)
+
+    print(f'Sweep finished: {len(runs)} runs, {failures} failed this session. State: {state_path}')
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a declarative snowman benchmark sweep')
+    parser.add_argument('spec', help='sweep spec (.toml, or .yaml with PyYAML)')
+    parser.add_argument('--dry-run', action='store_true', help='print the pending commands only')
+    parser.add_argument('--concurrent', action='store_true', default=None,
+                        help='run independent configurations side by side when cores allow')
+    parser.add_argument('--launcher', choices=('mpirun', 'srun'), help='override the spec launcher')
+    parser.add_argument('--output', help='override the spec output directory')
+    parser.add_argument('--repetitions', type=int, help='override the spec repetitions')
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    for name in ('concurrent', 'launcher', 'output', 'repetitions'):
+        value = getattr(args, name)
+        if value is not None:
+            spec[name] = value
+    return run_sweep(spec, dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,26 @@ import matplotlib.pyplot as plt
 import numpy as np
 from collections import defaultdict
 import sys
+import glob
+import os
+
+import snowman_metrics
+
+def load_metrics_data(paths):
+    """
+    Load snowman --metrics-json records (e.g. an orchestrate.py sweep's
+    metrics/*.ndjson). Repeated runs are averaged.
+    Returns the same structure as parse_benchmark_output.
+    """
+    samples = defaultdict(lambda: defaultdict(list))
+    for path in paths:
+        for record in snowman_metrics.load_records(path):
+            config = record['config']
+            key = (config['procs'], config['threads'])
+            samples[key][config['tile_size']].append(record['max_time'])
+
+    return {key: {tile: float(np.mean(times)) for tile, times in tiles.items()}
+            for key, tiles in samples.items()}
 
 def parse_benchmark_output(filename):
     """
@@ -168,11 +188,16 @@ def print_summary(data):
         print(f"\nBest tile size: {max(times, key=lambda k: 1/times[k])}×{max(times, key=lambda k: 1/times[k])} ({min_time:.2f}s)")
 
 if __name__ == '__main__':
-    # Parse the benchmark output
-    output_file = 'results/tile_benchmark_hybrid_24044148.out'
+    # Parse the benchmark output: a job log, metrics files or a sweep output directory
+    output_file = sys.argv[1] if len(sys.argv) > 1 else 'results/tile_benchmark_hybrid_24044148.out'
     
     print(f"Parsing {output_file}...")
-    data = parse_benchmark_output(output_file)
+    if os.path.isdir(output_file):
+        data = load_metrics_data(sorted(glob.glob(os.path.join(output_file, 'metrics', '*.ndjson'))))
+    elif output_file.endswith(('.json', '.ndjson', '.jsonl')):
+        data = load_metrics_data(sys.argv[1:])
+    else:
+        data = parse_benchmark_output(output_file)
     
     if not data:
         print("ERROR: Could not parse benchmark output file!")
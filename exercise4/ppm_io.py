@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped PPM/PGM (P6/P5) I/O and chunked image statistics.
+
+Only the header is parsed; the pixel payload is np.memmap'ed, and every
+statistic below walks the image in bands of rows of at most `chunk_bytes`,
+so renders far larger than RAM (16K² is 768 MiB) can be diffed, hashed,
+summarized and previewed on a laptop.
+
+Usage:
+    ./ppm_io.py info output.ppm
+    ./ppm_io.py diff a.ppm b.ppm [--tile-size 64]
+    ./ppm_io.py hist output.ppm
+    ./ppm_io.py tiles output.ppm --tile-size 256
+    ./ppm_io.py preview output.ppm preview.ppm --max-size 1024
+"""
+
+import argparse
+import math
+import sys
+
+import numpy as np
+
+CHUNK_BYTES = 64 << 20
+FNV_OFFSET = np.uint64(14695981039346656037)
+FNV_PRIME = np.uint64(1099511628211)
+
+
+# --- header and mapping ---
+
+def read_header(path):
+    """
+    Returns (width, height, channels, maxval, payload offset) of a binary PPM (P6) or PGM (P5).
+    """
+    with open(path, 'rb') as f:
+        head = f.read(1024)
+    fields = []
+    pos = 0
+    while len(fields) < 4:
+        while pos < len(head) and head[pos:pos + 1].isspace():
+            pos += 1
+        if head[pos:pos + 1] == b'#':
+            pos = head.index(b'\n', pos)
+            continue
+        end = pos
+        while end < len(head) and not head[end:end + 1].isspace():
+            end += 1
+        if end == pos:
+            raise ValueError(f'{path}: truncated PNM header')
+        fields.append(head[pos:end])
+        pos = end
+    if fields[0] not in (b'P5', b'P6'):
+        raise ValueError(f'{path}: not a binary PPM/PGM ({fields[0]!r})')
+    width, height, maxval = int(fields[1]), int(fields[2]), int(fields[3])
+    if not 0 < maxval < 65536:
+        raise ValueError(f'{path}: invalid maxval {maxval}')
+    channels = 3 if fields[0] == b'P6' else 1
+    # exactly one whitespace byte separates the header from the payload
+    return width, height, channels, maxval, pos + 1
+
+
+def open_ppm(path, mode='r'):
+    """
+    The pixels of a PPM/PGM as an (h, w, channels) memmap; 16-bit files map as big-endian uint16.
+    """
+    width, height, channels, maxval, offset = read_header(path)
+    dtype = np.uint8 if maxval < 256 else np.dtype('>u2')
+    return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(height, width, channels))
+
+
+def create_ppm(path, width, height):
+    """
+    Create an 8-bit PPM of the given size and return its pixels as a writable memmap.
+    """
+    header = f'P6\n{width} {height}\n255\n'.encode()
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.truncate(len(header) + width * height * 3)
+    return np.memmap(path, dtype=np.uint8, mode='r+', offset=len(header), shape=(height, width, 3))
+
+
+def read_ppm(path):
+    """
+    Read-only (h, w, 3) view of a PPM; pixels are paged in on access.
+    """
+    image = open_ppm(path)
+    if image.shape[2] != 3 or image.dtype != np.uint8:
+        raise ValueError(f'{path}: not an 8-bit binary PPM')
+    return image
+
+
+def write_ppm(path, image):
+    """
+    Write an (h, w, 3) uint8 array (or memmap) as a binary PPM, band by band.
+    """
+    height, width = image.shape[:2]
+    with open(path, 'wb') as f:
+        f.write(f'P6\n{width} {height}\n255\n'.encode())
+        for _, _, band in bands(image):
+            f.write(np.ascontiguousarray(band, dtype=np.uint8).tobytes())
+
+
+def bands(image, chunk_bytes=CHUNK_BYTES, multiple=1):
+    """
+    Yield (y0, y1, rows) bands of at most chunk_bytes (at least `multiple`
+    rows, and a multiple of it except for the last band).
+    """
+    height = image.shape[0]
+    row_bytes = max(1, image[0:1].nbytes)
+    rows = max(multiple, (chunk_bytes // row_bytes) // multiple * multiple)
+    for y0 in range(0, height, rows):
+        y1 = min(height, y0 + rows)
+        yield y0, y1, image[y0:y1]
+
+
+# --- statistics ---
+
+def diff(a, b, tile_size=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Compare two images of equal shape. Returns a dict with the number of
+    differing pixels, the max channel error, MSE and PSNR, and with tile_size
+    also per tile 'tile_max_error' and 'tile_psnr' arrays of shape
+    (tiles_y, tiles_x) (PSNR is inf where identical).
+    """
+    if a.shape != b.shape:
+        raise ValueError(f'image shapes differ: {a.shape} vs {b.shape}')
+    height, width, channels = a.shape
+    step = tile_size or 1
+    tiles_x = -(-width // step)
+    tile_sq = np.zeros((-(-height // step), tiles_x)) if tile_size else None
+    tile_max = np.zeros_like(tile_sq) if tile_size else None
+    differing = 0
+    max_error = 0
+    sq_sum = 0.0
+    for y0, y1, band_a in bands(a, chunk_bytes // 4, step):
+        d = band_a.astype(np.int32) - b[y0:y1].astype(np.int32)
+        err = np.abs(d)
+        differing += int(err.any(axis=2).sum())
+        max_error = max(max_error, int(err.max(initial=0)))
+        sq = (d * d).astype(np.float64)
+        sq_sum += float(sq.sum())
+        if tile_size:
+            rows = y1 - y0
+            pad_y, pad_x = -rows % step, -width % step
+            sq = np.pad(sq.sum(axis=2), ((0, pad_y), (0, pad_x)))
+            err = np.pad(err.max(axis=2), ((0, pad_y), (0, pad_x)))
+            shape = (sq.shape[0] // step, step, tiles_x, step)
+            ty = y0 // step
+            tile_sq[ty:ty + shape[0]] += sq.reshape(shape).sum(axis=(1, 3))
+            tile_max[ty:ty + shape[0]] = np.maximum(tile_max[ty:ty + shape[0]], err.reshape(shape).max(axis=(1, 3)))
+    maxval = 255.0 if a.dtype == np.uint8 else 65535.0
+    mse = sq_sum / (height * width * channels)
+    result = {'pixels': height * width, 'differing': differing, 'max_error': max_error,
+              'mse': mse, 'psnr': _psnr(mse, maxval)}
+    if tile_size:
+        ys = np.minimum(step, height - np.arange(tile_sq.shape[0]) * step)
+        xs = np.minimum(step, width - np.arange(tiles_x) * step)
+        tile_mse = tile_sq / (ys[:, None] * xs[None, :] * channels)
+        with np.errstate(divide='ignore'):
+            result['tile_psnr'] = np.where(tile_mse > 0, 10 * np.log10(maxval ** 2 / tile_mse), np.inf)
+        result['tile_max_error'] = tile_max.astype(np.int64)
+    return result
+
+
+def _psnr(mse, maxval=255.0):
+    return math.inf if mse == 0 else 10 * math.log10(maxval ** 2 / mse)
+
+
+def histogram(image, chunk_bytes=CHUNK_BYTES):
+    """
+    Per-channel value histograms, shape (channels, maxval + 1).
+    """
+    bins = 256 if image.dtype == np.uint8 else 65536
+    hist = np.zeros((image.shape[2], bins), dtype=np.int64)
+    for _, _, band in bands(image, chunk_bytes):
+        for c in range(image.shape[2]):
+            hist[c] += np.bincount(np.asarray(band[..., c]).ravel(), minlength=bins)
+    return hist
+
+
+def tile_stats(image, tile_size, chunk_bytes=CHUNK_BYTES):
+    """
+    Per tile channel mean and standard deviation, each (tiles_y, tiles_x, channels).
+    """
+    height, width, channels = image.shape
+    tiles_x = -(-width // tile_size)
+    tiles_y = -(-height // tile_size)
+    sums = np.zeros((tiles_y, tiles_x, channels))
+    sq_sums = np.zeros_like(sums)
+    for y0, y1, band in bands(image, chunk_bytes // 8, tile_size):
+        v = np.pad(band.astype(np.float64), ((0, -(y1 - y0) % tile_size), (0, -width % tile_size), (0, 0)))
+        blocks = v.reshape(v.shape[0] // tile_size, tile_size, tiles_x, tile_size, channels)
+        ty = y0 // tile_size
+        sums[ty:ty + blocks.shape[0]] += blocks.sum(axis=(1, 3))
+        sq_sums[ty:ty + blocks.shape[0]] += (blocks * blocks).sum(axis=(1, 3))
+    ys = np.minimum(tile_size, height - np.arange(tiles_y) * tile_size)
+    xs = np.minimum(tile_size, width - np.arange(tiles_x) * tile_size)
+    n = (ys[:, None] * xs[None, :])[..., None]
+    mean = sums / n
+    std = np.sqrt(np.maximum(sq_sums / n - mean * mean, 0.0))
+    return mean, std
+
+
+def tile_hashes(image, tile_size, chunk_bytes=CHUNK_BYTES):
+    """
+    FNV-1a 64 of every tile (bytes row by row, as write_tile_hashes() in
+    metrics.cpp), shape (tiles_y, tiles_x) uint64. The hash runs over all
+    tiles of a band at once, one byte position per step.
+    """
+    height, width, channels = image.shape
+    tiles_x = -(-width // tile_size)
+    out = np.empty((-(-height // tile_size), tiles_x), dtype=np.uint64)
+    full_x = width // tile_size
+    with np.errstate(over='ignore'):
+        for y0, y1, band in bands(image, chunk_bytes, tile_size):
+            band = np.asarray(band)
+            for ty0 in range(0, y1 - y0, tile_size):
+                rows = band[ty0:ty0 + tile_size]
+                h = rows.shape[0]
+                ty = (y0 + ty0) // tile_size
+                if full_x:
+                    full = rows[:, :full_x * tile_size].reshape(h, full_x, tile_size * channels)
+                    out[ty, :full_x] = _fnv_columns(full.transpose(1, 0, 2).reshape(full_x, -1))
+                if full_x < tiles_x:
+                    edge = rows[:, full_x * tile_size:].reshape(1, -1)
+                    out[ty, full_x] = _fnv_columns(edge)[0]
+    return out
+
+
+def _fnv_columns(data):
+    """
+    FNV-1a 64 of each row of a 2-D uint8 array.
+    """
+    h = np.full(data.shape[0], FNV_OFFSET, dtype=np.uint64)
+    cols = np.ascontiguousarray(data.T, dtype=np.uint64)
+    for col in cols:
+        h ^= col
+        h *= FNV_PRIME
+    return h
+
+
+def downsample(image, factor, chunk_bytes=CHUNK_BYTES):
+    """
+    Box-filtered preview, one output pixel per factor x factor block (a
+    partial last row/column of blocks is averaged over what exists).
+    """
+    height, width, channels = image.shape
+    out_h, out_w = -(-height // factor), -(-width // factor)
+    out = np.empty((out_h, out_w, channels), dtype=image.dtype)
+    xs = np.minimum(factor, width - np.arange(out_w) * factor)
+    for y0, y1, band in bands(image, chunk_bytes // 8, factor):
+        v = np.pad(band.astype(np.float64), ((0, -(y1 - y0) % factor), (0, -width % factor), (0, 0)))
+        blocks = v.reshape(v.shape[0] // factor, factor, out_w, factor, channels).sum(axis=(1, 3))
+        ys = np.minimum(factor, y1 - y0 - np.arange(blocks.shape[0]) * factor)
+        oy = y0 // factor
+        out[oy:oy + blocks.shape[0]] = np.rint(blocks / (ys[:, None] * xs[None, :])[..., None])
+    return out
+
+
+# --- command line ---
+
+def _cmd_info(args):
+    width, height, channels, maxval, offset = read_header(args.image)
+    print(f'{args.image}: {width}×{height}, {channels} channel(s), maxval {maxval}, payload at byte {offset}')
+
+
+def _cmd_diff(args):
+    a, b = open_ppm(args.a), open_ppm(args.b)
+    if a.shape != b.shape:
+        print(f'Image shapes differ: {a.shape} vs {b.shape}')
+        return 1
+    r = diff(a, b, args.tile_size)
+    print(f"{r['differing']} of {r['pixels']} pixels differ, max error {r['max_error']}, "
+          f"MSE {r['mse']:.4g}, PSNR {r['psnr']:.2f} dB")
+    if args.tile_size and r['differing']:
+        bad = np.argwhere(r['tile_max_error'] > args.max_error)
+        print(f'{len(bad)} of {r["tile_max_error"].size} tiles ({args.tile_size}×{args.tile_size}) '
+              f'exceed max error {args.max_error}')
+        for ty, tx in bad[:20]:
+            print(f"  tile at ({tx * args.tile_size}, {ty * args.tile_size}): max error "
+                  f"{r['tile_max_error'][ty, tx]}, PSNR {r['tile_psnr'][ty, tx]:.2f} dB")
+    return 1 if r['max_error'] > args.max_error else 0
+
+
+def _cmd_hist(args):
+    image = open_ppm(args.image)
+    hist = histogram(image)
+    names = 'RGB' if image.shape[2] == 3 else 'Y'
+    values = np.arange(hist.shape[1])
+    for c, name in enumerate(names):
+        total = hist[c].sum()
+        mean = (hist[c] * values).sum() / total
+        nonzero = np.nonzero(hist[c])[0]
+        top = np.argsort(hist[c])[::-1][:3]
+        print(f'{name}: mean {mean:.2f}, range {nonzero[0]}..{nonzero[-1]}, most frequent '
+              + ', '.join(f'{v} ({hist[c][v] / total:.1%})' for v in top))
+
+
+def _cmd_tiles(args):
+    mean, std = tile_stats(open_ppm(args.image), args.tile_size)
+    for ty in range(mean.shape[0]):
+        for tx in range(mean.shape[1]):
+            m = ' '.join(f'{v:6.1f}' for v in mean[ty, tx])
+            s = ' '.join(f'{v:5.1f}' for v in std[ty, tx])
+            print(f'{tx * args.tile_size:6d} {ty * args.tile_size:6d}  mean {m}  std {s}')
+
+
+def _cmd_preview(args):
+    image = open_ppm(args.image)
+    factor = args.factor or max(1, -(-max(image.shape[:2]) // args.max_size))
+    small = downsample(image, factor)
+    if small.dtype != np.uint8:
+        small = (small.astype(np.float64) * 255 / 65535).astype(np.uint8)
+    if small.shape[2] == 1:
+        small = np.repeat(small, 3, axis=2)
+    write_ppm(args.output, small)
+    print(f'Preview {small.shape[1]}×{small.shape[0]} (1/{factor}) saved to {args.output}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Memory-mapped PPM tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('info', help='print the header')
+    p.add_argument('image')
+    p.set_defaults(func=_cmd_info)
+    p = sub.add_parser('diff', help='pixel and per-tile differences of two images')
+    p.add_argument('a')
+    p.add_argument('b')
+    p.add_argument('--tile-size', type=int, default=None)
+    p.add_argument('--max-error', type=int, default=0)
+    p.set_defaults(func=_cmd_diff)
+    p = sub.add_parser('hist', help='per-channel histogram summary')
+    p.add_argument('image')
+    p.set_defaults(func=_cmd_hist)
+    p = sub.add_parser('tiles', help='per-tile mean and standard deviation')
+    p.add_argument('image')
+    p.add_argument('--tile-size', type=int, default=256)
+    p.set_defaults(func=_cmd_tiles)
+    p = sub.add_parser('preview', help='box-filtered downsampled copy')
+    p.add_argument('image')
+    p.add_argument('output')
+    p.add_argument('--max-size', type=int, default=1024, help='longest side of the preview')
+    p.add_argument('--factor', type=int, default=None, help='downsampling factor (overrides --max-size)')
+    p.set_defaults(func=_cmd_preview)
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
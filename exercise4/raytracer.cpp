@@ -1,465 +1,939 @@
-// This file is distributed under the MIT license.
-// See the LICENSE file for details.
-
-/*
-  SNOWMAN is currently under active development.
-  Features, functionality, and output may change frequently.
-
-  It is created for teaching purposes as part of an HPC (High Performance Computing) course.
-
-  If you encounter any issues feel free to reach out:
-
-  Contact: kmanda@uni-bonn.de.com
- 
-*/
-
-#include "raytracer.hpp"
-#include <fstream>
-#include <limits>
-#include <iostream>
-#include <random>
-#include <cmath>
-#include <omp.h>
-
-RayTracer::RayTracer(int w, int h) : width(w), height(h), scene(nullptr) {}
-
-void RayTracer::set_scene(Scene* s) {
-    scene = s;
-}
-
-bool RayTracer::intersect_sphere(const Vec3& ray_orig, const Vec3& ray_dir,
-                                 const Sphere& sphere, double& t) {
-    Vec3 oc = ray_orig - sphere.center;
-    double a = ray_dir.dot(ray_dir);
-    double b = 2.0 * oc.dot(ray_dir);
-    double c = oc.dot(oc) - sphere.radius * sphere.radius;
-    double discriminant = b*b - 4*a*c;
-
-    if (discriminant < 0) return false;
-
-    double sqrt_disc = std::sqrt(discriminant);
-    double t0 = (-b - sqrt_disc) / (2*a);
-    double t1 = (-b + sqrt_disc) / (2*a);
-
-    if (t0 > 1e-4) {
-        t = t0;
-        return true;
-    } else if (t1 > 1e-4) {
-        t = t1;
-        return true;
-    }
-    return false;
-}
-
-bool RayTracer::intersect_plane(const Vec3& ray_orig, const Vec3& ray_dir, const Plane& plane, double& t) {
-    double denom = plane.normal.dot(ray_dir);
-    if (std::fabs(denom) > 1e-6) {
-        double t_temp = (plane.point - ray_orig).dot(plane.normal) / denom;
-        if (t_temp >= 1e-4) {
-            t = t_temp;
-            return true;
-        }
-    }
-    return false;
-}
-
-void RayTracer::render(int rank, int size, std::vector<Color>& out_pixels) {
-    if (!scene) {
-        if(rank == 0) std::cerr << "Scene not set!\n";
-        return;
-    }
-
-    int rows_per_rank = height / size;
-    int start_row = rank * rows_per_rank;
-    int end_row = (rank == size - 1) ? height : start_row + rows_per_rank;
-
-    out_pixels.resize((end_row - start_row) * width);
-
-    Vec3 camera_pos(0, 2, 5); // Camera position
-    Vec3 camera_lookat(0, 1, 0); // Point camera is looking at
-    Vec3 camera_dir = (camera_lookat - camera_pos).normalize();
-    Vec3 up(0, 1, 0); // World up vector
-    Vec3 right = camera_dir.cross(up).normalize(); // Camera's right vector
-    Vec3 cam_up = right.cross(camera_dir).normalize(); // Camera's actual up vector
-
-    double fov = 60.0;
-    double aspect_ratio = double(width) / height;
-    double scale = tan((fov * 0.5) * M_PI / 180.0);
-
-    Vec3 sunlight_dir = Vec3(-1, -1, -1).normalize(); // Direction of sunlight
-    double ambient = 0.3; // Base ambient light in the scene
-
-    // Find floor plane (normal y ~1 and point.y ~0)
-    const Plane* floor_plane = nullptr;
-    for (const auto& plane : scene->planes) {
-        if (plane.normal.y > 0.99 && std::abs(plane.point.y) < 1e-3) {
-            floor_plane = &plane;
-            break;
-        }
-    }
-
-    std::mt19937 rng(rank + 12345); // Seed RNG for different snowflakes per rank
-    const int snowflake_count = 75000; 
-    std::vector<Vec3> snowflakes(snowflake_count);
-
-    std::normal_distribution<double> dist_xz(0.0, 6.0);
-    std::uniform_real_distribution<double> dist_y(-1.0, 25.0);
-
-    for (int i = 0; i < snowflake_count; ++i) {
-        double x_rand = dist_xz(rng);
-        double y_rand = dist_y(rng);
-        double z_rand = dist_xz(rng);
-
-        // Clamping bounds: covering a wide, deep area
-        if (x_rand < -25.0) x_rand = -25.0;
-        else if (x_rand > 25.0) x_rand = 25.0;
-
-        if (z_rand < -25.0) z_rand = -25.0;
-        else if (z_rand > 25.0) z_rand = 25.0;
-
-        snowflakes[i] = Vec3(x_rand, y_rand, z_rand);
-    }
-
-    for (int y = start_row; y < end_row; ++y) {
-        for (int x = 0; x < width; ++x) {
-            double ndc_x = (x + 0.5) / width;
-            double ndc_y = (y + 0.5) / height;
-            double px = (2 * ndc_x - 1) * aspect_ratio * scale;
-            double py = (1 - 2 * ndc_y) * scale;
-
-            Vec3 ray_dir = (camera_dir + right * px + cam_up * py).normalize();
-            Vec3 ray_orig = camera_pos;
-
-            double closest_t = std::numeric_limits<double>::max();
-            const Sphere* hit_sphere = nullptr;
-            const Plane* hit_plane = nullptr;
-
-            // Find closest sphere hit
-            for (const auto& sphere : scene->spheres) {
-                double t;
-                if (intersect_sphere(ray_orig, ray_dir, sphere, t) && t < closest_t) {
-                    closest_t = t;
-                    hit_sphere = &sphere;
-                    hit_plane = nullptr;
-                }
-            }
-
-            // Find closest plane hit
-            for (const auto& plane : scene->planes) {
-                double t;
-                if (intersect_plane(ray_orig, ray_dir, plane, t) && t < closest_t) {
-                    closest_t = t;
-                    hit_plane = &plane;
-                    hit_sphere = nullptr;
-                }
-            }
-
-            Color pixel_color;
-
-            if (hit_sphere) {
-                Vec3 hit_point = ray_orig + ray_dir * closest_t;
-                Vec3 normal = (hit_point - hit_sphere->center).normalize();
-
-                Vec3 shadow_origin = hit_point + normal * 1e-4;
-                bool in_shadow = false;
-
-                Vec3 shadow_dir = -sunlight_dir;
-                for (const auto& s : scene->spheres) {
-                    double t_shadow;
-                    if (&s != hit_sphere && intersect_sphere(shadow_origin, shadow_dir, s, t_shadow)) {
-                        if (t_shadow > 1e-4) {
-                            in_shadow = true;
-                            break;
-                        }
-                    }
-                }
-                if (!in_shadow && floor_plane) {
-                    double t_shadow_floor;
-                    if (intersect_plane(shadow_origin, shadow_dir, *floor_plane, t_shadow_floor)) {
-                        if (t_shadow_floor > 1e-4) {
-                            in_shadow = true;
-                        }
-                    }
-                }
-
-                double diffuse = in_shadow ? 0.0 : std::max(0.0, normal.dot(-sunlight_dir));
-                double brightness = ambient + (1.0 - ambient) * diffuse;
-
-                pixel_color.r = std::min(255, int(hit_sphere->color.r * brightness));
-                pixel_color.g = std::min(255, int(hit_sphere->color.g * brightness));
-                pixel_color.b = std::min(255, int(hit_sphere->color.b * brightness));
-            }
-            else if (hit_plane) {
-                Vec3 hit_point = ray_orig + ray_dir * closest_t;
-                Vec3 normal = hit_plane->normal;
-
-                Vec3 shadow_origin = hit_point + normal * 1e-4;
-                bool in_shadow = false;
-
-                Vec3 shadow_dir = -sunlight_dir;
-                for (const auto& s : scene->spheres) {
-                    double t_shadow;
-                    if (intersect_sphere(shadow_origin, shadow_dir, s, t_shadow)) {
-                        if (t_shadow > 1e-4) {
-                            in_shadow = true;
-                            break;
-                        }
-                    }
-                }
-
-                if (floor_plane && hit_plane == floor_plane) {
-                    // Base color for the floor is pure white
-                    pixel_color = Color(255, 255, 255);
-
-                    // Apply shadow effect to the white floor
-                    if (in_shadow) {
-                        // This makes the shadow appear as a darker shade of white.
-                        double shadow_brightness_factor = 0.6; // Adjust for desired shadow intensity
-                        pixel_color.r = (unsigned char)(pixel_color.r * shadow_brightness_factor);
-                        pixel_color.g = (unsigned char)(pixel_color.g * shadow_brightness_factor);
-                        pixel_color.b = (unsigned char)(pixel_color.b * shadow_brightness_factor);
-                    }
-                } else {
-                    // Other planes with their original lighting
-                    double diffuse = in_shadow ? 0.0 : std::max(0.0, normal.dot(-sunlight_dir));
-                    double brightness = ambient + (1.0 - ambient) * diffuse;
-                    pixel_color.r = std::min(255, int(hit_plane->color.r * brightness));
-                    pixel_color.g = std::min(255, int(hit_plane->color.g * brightness));
-                    pixel_color.b = std::min(255, int(hit_plane->color.b * brightness));
-                }
-            }
-            else {
-                // Sky gradient (top blue, bottom white)
-                double t = 0.5 * (ray_dir.y + 1.0);
-                Color top(135, 206, 235);
-                Color bottom(255, 255, 255);
-                pixel_color.r = (1 - t) * bottom.r + t * top.r;
-                pixel_color.g = (1 - t) * bottom.g + t * top.g;
-                pixel_color.b = (1 - t) * bottom.b + t * top.b;
-            }
-
-            // SNOWFLAKE OVERLAY
-            // Overlay snowflakes as tiny white dots
-            const double snowflake_radius = 0.008; 
-            const double max_ray_distance = 8.0; 
-
-            for (const auto& flake_pos : snowflakes) {
-                Vec3 to_flake = flake_pos - ray_orig;
-                double proj = to_flake.dot(ray_dir);
-
-                // Check if snowflake is in front of the camera, within max_ray_distance,
-                // AND not behind any other scene object (closest_t)
-                if (proj < 0 || proj > max_ray_distance || proj > closest_t) continue;
-
-                Vec3 closest_point_on_ray = ray_orig + ray_dir * proj;
-                double dist_sq = (closest_point_on_ray.x - flake_pos.x)*(closest_point_on_ray.x - flake_pos.x) +
-                                 (closest_point_on_ray.y - flake_pos.y)*(closest_point_on_ray.y - flake_pos.y) +
-                                 (closest_point_on_ray.z - flake_pos.z)*(closest_point_on_ray.z - flake_pos.z);
-
-                if (dist_sq < snowflake_radius * snowflake_radius) {
-                    pixel_color = Color(255, 255, 255); // Pure white snowflake dot
-                    break;
-                }
-            }
-
-            out_pixels[(y - start_row) * width + x] = pixel_color;
-        }
-    }
-}
-
-void RayTracer::renderTile(int x0, int y0, int w, int h, unsigned int seed, std::vector<Color>& out) {
-    if (!scene) {
-        return;
-    }
-
-    out.resize(w * h);
-
-    Vec3 camera_pos(0, 2, 5); // Camera position
-    Vec3 camera_lookat(0, 1, 0); // Point camera is looking at
-    Vec3 camera_dir = (camera_lookat - camera_pos).normalize();
-    Vec3 up(0, 1, 0); // World up vector
-    Vec3 right = camera_dir.cross(up).normalize(); // Camera's right vector
-    Vec3 cam_up = right.cross(camera_dir).normalize(); // Camera's actual up vector
-
-    double fov = 60.0;
-    double aspect_ratio = double(width) / height;
-    double scale = tan((fov * 0.5) * M_PI / 180.0);
-
-    Vec3 sunlight_dir = Vec3(-1, -1, -1).normalize(); // Direction of sunlight
-    double ambient = 0.3; // Base ambient light in the scene
-
-    // Find floor plane (normal y ~1 and point.y ~0)
-    const Plane* floor_plane = nullptr;
-    for (const auto& plane : scene->planes) {
-        if (plane.normal.y > 0.99 && std::abs(plane.point.y) < 1e-3) {
-            floor_plane = &plane;
-            break;
-        }
-    }
-
-    std::mt19937 rng(seed + 12345);
-    const int snowflake_count = 75000;
-    std::vector<Vec3> snowflakes(snowflake_count);
-
-    std::normal_distribution<double> dist_xz(0.0, 6.0);
-    std::uniform_real_distribution<double> dist_y(-1.0, 25.0);
-
-    for (int i = 0; i < snowflake_count; ++i) {
-        double x_rand = dist_xz(rng);
-        double y_rand = dist_y(rng);
-        double z_rand = dist_xz(rng);
-
-        if (x_rand < -25.0) x_rand = -25.0;
-        else if (x_rand > 25.0) x_rand = 25.0;
-
-        if (z_rand < -25.0) z_rand = -25.0;
-        else if (z_rand > 25.0) z_rand = 25.0;
-
-        snowflakes[i] = Vec3(x_rand, y_rand, z_rand);
-    }
-    #pragma omp parallel for collapse(2)
-    for (int ty = 0; ty < h; ++ty) {
-        int y = y0 + ty;
-        for (int tx = 0; tx < w; ++tx) {
-            int x = x0 + tx;
-            double ndc_x = (x + 0.5) / width;
-            double ndc_y = (y + 0.5) / height;
-            double px = (2 * ndc_x - 1) * aspect_ratio * scale;
-            double py = (1 - 2 * ndc_y) * scale;
-
-            Vec3 ray_dir = (camera_dir + right * px + cam_up * py).normalize();
-            Vec3 ray_orig = camera_pos;
-
-            double closest_t = std::numeric_limits<double>::max();
-            const Sphere* hit_sphere = nullptr;
-            const Plane* hit_plane = nullptr;
-
-            for (const auto& sphere : scene->spheres) {
-                double t;
-                if (intersect_sphere(ray_orig, ray_dir, sphere, t) && t < closest_t) {
-                    closest_t = t;
-                    hit_sphere = &sphere;
-                    hit_plane = nullptr;
-                }
-            }
-
-            for (const auto& plane : scene->planes) {
-                double t;
-                if (intersect_plane(ray_orig, ray_dir, plane, t) && t < closest_t) {
-                    closest_t = t;
-                    hit_plane = &plane;
-                    hit_sphere = nullptr;
-                }
-            }
-
-            Color pixel_color;
-
-            if (hit_sphere) {
-                Vec3 hit_point = ray_orig + ray_dir * closest_t;
-                Vec3 normal = (hit_point - hit_sphere->center).normalize();
-
-                Vec3 shadow_origin = hit_point + normal * 1e-4;
-                bool in_shadow = false;
-
-                Vec3 shadow_dir = -sunlight_dir;
-                for (const auto& s : scene->spheres) {
-                    double t_shadow;
-                    if (&s != hit_sphere && intersect_sphere(shadow_origin, shadow_dir, s, t_shadow)) {
-                        if (t_shadow > 1e-4) {
-                            in_shadow = true;
-                            break;
-                        }
-                    }
-                }
-                if (!in_shadow && floor_plane) {
-                    double t_shadow_floor;
-                    if (intersect_plane(shadow_origin, shadow_dir, *floor_plane, t_shadow_floor)) {
-                        if (t_shadow_floor > 1e-4) {
-                            in_shadow = true;
-                        }
-                    }
-                }
-
-                double diffuse = in_shadow ? 0.0 : std::max(0.0, normal.dot(-sunlight_dir));
-                double brightness = ambient + (1.0 - ambient) * diffuse;
-
-                pixel_color.r = std::min(255, int(hit_sphere->color.r * brightness));
-                pixel_color.g = std::min(255, int(hit_sphere->color.g * brightness));
-                pixel_color.b = std::min(255, int(hit_sphere->color.b * brightness));
-            }
-            else if (hit_plane) {
-                Vec3 hit_point = ray_orig + ray_dir * closest_t;
-                Vec3 normal = hit_plane->normal;
-
-                Vec3 shadow_origin = hit_point + normal * 1e-4;
-                bool in_shadow = false;
-
-                Vec3 shadow_dir = -sunlight_dir;
-                for (const auto& s : scene->spheres) {
-                    double t_shadow;
-                    if (intersect_sphere(shadow_origin, shadow_dir, s, t_shadow)) {
-                        if (t_shadow > 1e-4) {
-                            in_shadow = true;
-                            break;
-                        }
-                    }
-                }
-
-                if (floor_plane && hit_plane == floor_plane) {
-                    pixel_color = Color(255, 255, 255);
-                    if (in_shadow) {
-                        double shadow_brightness_factor = 0.6;
-                        pixel_color.r = (unsigned char)(pixel_color.r * shadow_brightness_factor);
-                        pixel_color.g = (unsigned char)(pixel_color.g * shadow_brightness_factor);
-                        pixel_color.b = (unsigned char)(pixel_color.b * shadow_brightness_factor);
-                    }
-                } else {
-                    double diffuse = in_shadow ? 0.0 : std::max(0.0, normal.dot(-sunlight_dir));
-                    double brightness = ambient + (1.0 - ambient) * diffuse;
-                    pixel_color.r = std::min(255, int(hit_plane->color.r * brightness));
-                    pixel_color.g = std::min(255, int(hit_plane->color.g * brightness));
-                    pixel_color.b = std::min(255, int(hit_plane->color.b * brightness));
-                }
-            }
-            else {
-                double t = 0.5 * (ray_dir.y + 1.0);
-                Color top(135, 206, 235);
-                Color bottom(255, 255, 255);
-                pixel_color.r = (1 - t) * bottom.r + t * top.r;
-                pixel_color.g = (1 - t) * bottom.g + t * top.g;
-                pixel_color.b = (1 - t) * bottom.b + t * top.b;
-            }
-
-            const double snowflake_radius = 0.008;
-            const double max_ray_distance = 8.0;
-
-            for (const auto& flake_pos : snowflakes) {
-                Vec3 to_flake = flake_pos - ray_orig;
-                double proj = to_flake.dot(ray_dir);
-                if (proj < 0 || proj > max_ray_distance || proj > closest_t) continue;
-
-                Vec3 closest_point_on_ray = ray_orig + ray_dir * proj;
-                double dx = (closest_point_on_ray.x - flake_pos.x);
-                double dy = (closest_point_on_ray.y - flake_pos.y);
-                double dz = (closest_point_on_ray.z - flake_pos.z);
-                double dist_sq = dx*dx + dy*dy + dz*dz;
-
-                if (dist_sq < snowflake_radius * snowflake_radius) {
-                    pixel_color = Color(255, 255, 255);
-                    break;
-                }
-            }
-
-            out[ty * w + tx] = pixel_color;
-        }
-    }
-}
-
-void RayTracer::save_image(const std::string& filename, const std::vector<Color>& pixels) {
-    std::ofstream ofs(filename, std::ios::binary);
-    ofs << "P6\n" << width << " " << height << "\n255\n";
-    for (auto& c : pixels) {
-        ofs << (unsigned char)c.r << (unsigned char)c.g << (unsigned char)c.b;
-    }
-    ofs.close();
-}
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+/*
+  SNOWMAN is currently under active development.
+  Features, functionality, and output may change frequently.
+
+  It is created for teaching purposes as part of an HPC (High Performance Computing) course.
+
+  If you encounter any issues feel free to reach out:
+
+  Contact: kmanda@uni-bonn.de.com
+ 
+*/
+
+#include "raytracer.hpp"
+#include <algorithm>
+#include <fstream>
+#include <limits>
+#include <iostream>
+#include <random>
+#include <cmath>
+#include <omp.h>
+
+RayTracer::RayTracer(int w, int h)
+    : width(w), height(h), scene(nullptr), has_scene(false), snow_fall(0.0), aa_samples(1), aa_threshold(16),
+      primary_rays(0), refined_pixels(0), pixel_parallel(true), profiling(false),
+      culling(true), splatting(false), wavefront(false) {}
+
+void PhaseStats::add(const PhaseStats& o) {
+    for (int p = 0; p < PHASES; ++p) time[p] += o.time[p];
+    flakes_generated += o.flakes_generated;
+    box_tests += o.box_tests;
+    sphere_tests += o.sphere_tests;
+    plane_tests += o.plane_tests;
+    flake_tests += o.flake_tests;
+    flakes_near += o.flakes_near;
+}
+
+void RayTracer::set_scene(Scene* s) {
+    scene = s;
+    has_scene = s != nullptr;
+}
+
+void RayTracer::set_scene(const SceneView& view) {
+    scene = nullptr;
+    external = view;
+    has_scene = true;
+}
+
+SceneView RayTracer::current_view() const {
+    return scene ? scene->view() : external;
+}
+
+bool RayTracer::intersect_sphere(const Vec3& ray_orig, const Vec3& ray_dir,
+                                 const Sphere& sphere, double& t) {
+    Vec3 oc = ray_orig - sphere.center;
+    double a = ray_dir.dot(ray_dir);
+    double b = 2.0 * oc.dot(ray_dir);
+    double c = oc.dot(oc) - sphere.radius * sphere.radius;
+    double discriminant = b*b - 4*a*c;
+
+    if (discriminant < 0) return false;
+
+    double sqrt_disc = std::sqrt(discriminant);
+    double t0 = (-b - sqrt_disc) / (2*a);
+    double t1 = (-b + sqrt_disc) / (2*a);
+
+    if (t0 > 1e-4) {
+        t = t0;
+        return true;
+    } else if (t1 > 1e-4) {
+        t = t1;
+        return true;
+    }
+    return false;
+}
+
+bool RayTracer::intersect_plane(const Vec3& ray_orig, const Vec3& ray_dir, const Plane& plane, double& t) {
+    double denom = plane.normal.dot(ray_dir);
+    if (std::fabs(denom) > 1e-6) {
+        double t_temp = (plane.point - ray_orig).dot(plane.normal) / denom;
+        if (t_temp >= 1e-4) {
+            t = t_temp;
+            return true;
+        }
+    }
+    return false;
+}
+
+// --- BVH traversal ---
+
+namespace {
+
+const int BVH_STACK_SIZE = 64;
+
+// Work of the calling thread, moved into RayTracer::phases at the end of
+// each parallel region of renderTile.
+thread_local PhaseStats tl_work;
+
+// Entry distance of the ray into the node's box, or +inf if it misses.
+inline double enter_box(const BVHNode& n, const Vec3& orig, const Vec3& inv_dir) {
+    ++tl_work.box_tests;
+    double o[3] = {orig.x, orig.y, orig.z};
+    double inv[3] = {inv_dir.x, inv_dir.y, inv_dir.z};
+    double t_near = 0.0;
+    double t_far = std::numeric_limits<double>::infinity();
+    for (int a = 0; a < 3; ++a) {
+        double t0 = (n.bmin[a] - o[a]) * inv[a];
+        double t1 = (n.bmax[a] - o[a]) * inv[a];
+        if (t0 > t1) std::swap(t0, t1);
+        t_near = t0 > t_near ? t0 : t_near;
+        t_far = t1 < t_far ? t1 : t_far;
+        if (t_near > t_far) return std::numeric_limits<double>::infinity();
+    }
+    return t_near;
+}
+
+// Visit the leaves of `nodes` the ray enters before closest_t, nearest first.
+// leaf(first, count) tests the items and may lower closest_t.
+template <typename Leaf>
+void traverse_closest(const BVHNode* nodes, const Vec3& orig, const Vec3& inv_dir, const double& closest_t,
+                      const Leaf& leaf) {
+    int stack[BVH_STACK_SIZE];
+    double stack_t[BVH_STACK_SIZE];
+    int top = 0;
+    double t_root = enter_box(nodes[0], orig, inv_dir);
+    if (t_root < closest_t) {
+        stack[top] = 0;
+        stack_t[top++] = t_root;
+    }
+    while (top > 0) {
+        --top;
+        if (stack_t[top] >= closest_t) continue;   // entered beyond a hit found meanwhile
+        const BVHNode& node = nodes[stack[top]];
+        if (node.count > 0) {
+            leaf(node.first, node.count);
+            continue;
+        }
+        // push the farther child first so the nearer one is visited first
+        int near_child = stack[top] + 1;
+        int far_child = node.first;
+        double t_near = enter_box(nodes[near_child], orig, inv_dir);
+        double t_far = enter_box(nodes[far_child], orig, inv_dir);
+        if (t_near > t_far) {
+            std::swap(near_child, far_child);
+            std::swap(t_near, t_far);
+        }
+        if (t_far < closest_t) {
+            stack[top] = far_child;
+            stack_t[top++] = t_far;
+        }
+        if (t_near < closest_t) {
+            stack[top] = near_child;
+            stack_t[top++] = t_near;
+        }
+    }
+}
+
+// True as soon as leaf(first, count) returns true for a leaf the ray enters.
+template <typename Leaf>
+bool traverse_any(const BVHNode* nodes, const Vec3& orig, const Vec3& inv_dir, const Leaf& leaf) {
+    const double miss = std::numeric_limits<double>::infinity();
+    int stack[BVH_STACK_SIZE];
+    int top = 0;
+    stack[top++] = 0;
+    while (top > 0) {
+        int index = stack[--top];
+        const BVHNode& node = nodes[index];
+        if (enter_box(node, orig, inv_dir) == miss) continue;
+        if (node.count > 0) {
+            if (leaf(node.first, node.count)) return true;
+            continue;
+        }
+        stack[top++] = node.first;
+        stack[top++] = index + 1;
+    }
+    return false;
+}
+
+// The ray in the template space of an instance. The direction is only
+// scaled, not normalized, so hit distances are the same as in world space.
+inline void to_instance(const Instance& inst, const Vec3& orig, const Vec3& dir, const Vec3& inv_dir,
+                        Vec3& inst_orig, Vec3& inst_dir, Vec3& inst_inv_dir) {
+    double inv_scale = 1.0 / inst.scale;
+    inst_orig = (orig - inst.offset) * inv_scale;
+    inst_dir = dir * inv_scale;
+    inst_inv_dir = inv_dir * inst.scale;
+}
+
+} // namespace
+
+bool RayTracer::closest_sphere(const SceneView& v, const Vec3& ray_orig, const Vec3& ray_dir, double& closest_t,
+                               SphereHit& hit) {
+    double t;
+    int index = -1;
+    Vec3 inv_dir(1.0 / ray_dir.x, 1.0 / ray_dir.y, 1.0 / ray_dir.z);
+    if (v.num_nodes > 0) {
+        traverse_closest(v.nodes, ray_orig, inv_dir, closest_t, [&](int first, int count) {
+            tl_work.sphere_tests += count;
+            for (int i = first; i < first + count; ++i) {
+                if (intersect_sphere(ray_orig, ray_dir, v.spheres[i], t) && t < closest_t) {
+                    closest_t = t;
+                    index = i;
+                }
+            }
+        });
+    } else {
+        tl_work.sphere_tests += v.num_spheres;
+        for (size_t i = 0; i < v.num_spheres; ++i) {
+            if (intersect_sphere(ray_orig, ray_dir, v.spheres[i], t) && t < closest_t) {
+                closest_t = t;
+                index = (int)i;
+            }
+        }
+    }
+
+    // instances: top-level BVH, then the template BVH in instance space
+    int instance = -1;
+    if (v.num_instance_nodes > 0) {
+        traverse_closest(v.instance_nodes, ray_orig, inv_dir, closest_t, [&](int first, int count) {
+            for (int k = first; k < first + count; ++k) {
+                Vec3 o, d, inv_d;
+                to_instance(v.instances[k], ray_orig, ray_dir, inv_dir, o, d, inv_d);
+                traverse_closest(v.template_nodes, o, inv_d, closest_t, [&](int f, int c) {
+                    tl_work.sphere_tests += c;
+                    for (int i = f; i < f + c; ++i) {
+                        if (intersect_sphere(o, d, v.template_spheres[i], t) && t < closest_t) {
+                            closest_t = t;
+                            index = i;
+                            instance = k;
+                        }
+                    }
+                });
+            }
+        });
+    }
+
+    if (index < 0) return false;
+    hit.index = index;
+    hit.instance = instance;
+    if (instance < 0) {
+        hit.sphere = v.spheres[index];
+    } else {
+        const Instance& inst = v.instances[instance];
+        const Sphere& s = v.template_spheres[index];
+        hit.sphere = Sphere(inst.offset + s.center * inst.scale, s.radius * inst.scale, s.color);
+    }
+    return true;
+}
+
+bool RayTracer::occluded(const SceneView& v, const Vec3& ray_orig, const Vec3& ray_dir, const SphereHit* skip) {
+    double t;
+    int skip_index = skip ? skip->index : -1;
+    int skip_instance = skip ? skip->instance : -1;
+    Vec3 inv_dir(1.0 / ray_dir.x, 1.0 / ray_dir.y, 1.0 / ray_dir.z);
+
+    int own = skip_instance < 0 ? skip_index : -1;
+    auto sphere_leaf = [&](int first, int count) {
+        for (int i = first; i < first + count; ++i) {
+            ++tl_work.sphere_tests;
+            if (i != own && intersect_sphere(ray_orig, ray_dir, v.spheres[i], t)) return true;
+        }
+        return false;
+    };
+    if (v.num_nodes > 0) {
+        if (traverse_any(v.nodes, ray_orig, inv_dir, sphere_leaf)) return true;
+    } else if (sphere_leaf(0, (int)v.num_spheres)) {
+        return true;
+    }
+
+    if (v.num_instance_nodes == 0) return false;
+    return traverse_any(v.instance_nodes, ray_orig, inv_dir, [&](int first, int count) {
+        for (int k = first; k < first + count; ++k) {
+            Vec3 o, d, inv_d;
+            to_instance(v.instances[k], ray_orig, ray_dir, inv_dir, o, d, inv_d);
+            int own_in_instance = k == skip_instance ? skip_index : -1;
+            bool hit = traverse_any(v.template_nodes, o, inv_d, [&](int f, int c) {
+                for (int i = f; i < f + c; ++i) {
+                    ++tl_work.sphere_tests;
+                    if (i != own_in_instance && intersect_sphere(o, d, v.template_spheres[i], t)) return true;
+                }
+                return false;
+            });
+            if (hit) return true;
+        }
+        return false;
+    });
+}
+
+// --- per-tile culling ---
+
+namespace {
+
+const double SNOWFLAKE_RADIUS = 0.008;
+const double MAX_FLAKE_DISTANCE = 8.0;
+// slack for rounding in the frustum tests; keeps the culling conservative
+const double CULL_MARGIN = 1e-6;
+
+// The camera rays of a tile start at `origin` and point into the pyramid
+// bounded by four planes through it (inward unit normals); `corner` are the
+// (unnormalized) directions of its edges.
+struct Frustum {
+    Vec3 origin;
+    Vec3 normal[4];
+    Vec3 corner[4];
+};
+
+// True if a ball of radius r around p can reach into the frustum.
+inline bool ball_in_frustum(const Frustum& f, const Vec3& p, double r) {
+    Vec3 d = p - f.origin;
+    for (int i = 0; i < 4; ++i) {
+        if (d.dot(f.normal[i]) < -(r + CULL_MARGIN)) return false;
+    }
+    return true;
+}
+
+// True unless the box lies entirely outside one of the frustum planes.
+inline bool box_in_frustum(const Frustum& f, const BVHNode& n) {
+    for (int i = 0; i < 4; ++i) {
+        const Vec3& nv = f.normal[i];
+        // the corner of the box farthest along the normal
+        Vec3 p(nv.x >= 0 ? n.bmax[0] : n.bmin[0], nv.y >= 0 ? n.bmax[1] : n.bmin[1],
+               nv.z >= 0 ? n.bmax[2] : n.bmin[2]);
+        if ((p - f.origin).dot(nv) < -CULL_MARGIN) return false;
+    }
+    return true;
+}
+
+// True if a sphere (or an instance box) of `nodes` may be hit by a ray of the frustum.
+template <typename Leaf>
+bool any_in_frustum(const Frustum& f, const BVHNode* nodes, const Leaf& leaf) {
+    int stack[BVH_STACK_SIZE];
+    int top = 0;
+    stack[top++] = 0;
+    while (top > 0) {
+        int index = stack[--top];
+        const BVHNode& node = nodes[index];
+        if (!box_in_frustum(f, node)) continue;
+        if (node.count > 0) {
+            if (leaf(node.first, node.count)) return true;
+            continue;
+        }
+        stack[top++] = node.first;
+        stack[top++] = index + 1;
+    }
+    return false;
+}
+
+// True if some ray of the frustum may hit the plane: the rays are positive
+// combinations of the corners, so a plane in front of the camera is missed
+// only if all corners point away from it.
+bool plane_in_frustum(const Frustum& f, const Plane& plane) {
+    double k = (plane.point - f.origin).dot(plane.normal);
+    if (k == 0.0) return true;
+    for (int i = 0; i < 4; ++i) {
+        if (plane.normal.dot(f.corner[i]) * (k > 0 ? 1.0 : -1.0) > -1e-9) return true;
+    }
+    return false;
+}
+
+// The snowflake overlay rule: the ray passes within the flake's radius, at
+// most MAX_FLAKE_DISTANCE along it and in front of its hit at closest_t.
+// Counts the flakes within that range in `near`.
+inline bool flake_covers(const Vec3& flake_pos, const Vec3& ray_orig, const Vec3& ray_dir, double closest_t,
+                         uint64_t& near) {
+    Vec3 to_flake = flake_pos - ray_orig;
+    double proj = to_flake.dot(ray_dir);
+    if (proj < 0 || proj > MAX_FLAKE_DISTANCE || proj > closest_t) return false;
+    ++near;
+
+    Vec3 closest_point_on_ray = ray_orig + ray_dir * proj;
+    double dx = (closest_point_on_ray.x - flake_pos.x);
+    double dy = (closest_point_on_ray.y - flake_pos.y);
+    double dz = (closest_point_on_ray.z - flake_pos.z);
+    double dist_sq = dx*dx + dy*dy + dz*dz;
+    return dist_sq < SNOWFLAKE_RADIUS * SNOWFLAKE_RADIUS;
+}
+
+inline Color sky_color(const Vec3& ray_dir) {
+    double t = 0.5 * (ray_dir.y + 1.0);
+    Color top(135, 206, 235);
+    Color bottom(255, 255, 255);
+    Color c;
+    c.r = (1 - t) * bottom.r + t * top.r;
+    c.g = (1 - t) * bottom.g + t * top.g;
+    c.b = (1 - t) * bottom.b + t * top.b;
+    return c;
+}
+
+} // namespace
+
+Vec3 RayTracer::camera_ray(const TileSetup& s, double sx, double sy) const {
+    double ndc_x = sx / width;
+    double ndc_y = sy / height;
+    double px = (2 * ndc_x - 1) * s.aspect_ratio * s.scale;
+    double py = (1 - 2 * ndc_y) * s.scale;
+    return (s.camera_dir + s.right * px + s.cam_up * py).normalize();
+}
+
+void RayTracer::cull_tile(TileSetup& s, int x0, int y0, int w, int h) {
+    // image-plane extent of the tile's pixels (samples lie inside them)
+    double px_min = (2.0 * x0 / width - 1) * s.aspect_ratio * s.scale;
+    double px_max = (2.0 * (x0 + w) / width - 1) * s.aspect_ratio * s.scale;
+    double py_max = (1 - 2.0 * y0 / height) * s.scale;
+    double py_min = (1 - 2.0 * (y0 + h) / height) * s.scale;
+
+    // inside means px_min <= right/dir <= px_max and likewise for up
+    Frustum f;
+    f.origin = s.camera_pos;
+    f.normal[0] = (s.right - s.camera_dir * px_min).normalize();
+    f.normal[1] = (s.camera_dir * px_max - s.right).normalize();
+    f.normal[2] = (s.cam_up - s.camera_dir * py_min).normalize();
+    f.normal[3] = (s.camera_dir * py_max - s.cam_up).normalize();
+    f.corner[0] = s.camera_dir + s.right * px_min + s.cam_up * py_min;
+    f.corner[1] = s.camera_dir + s.right * px_max + s.cam_up * py_min;
+    f.corner[2] = s.camera_dir + s.right * px_min + s.cam_up * py_max;
+    f.corner[3] = s.camera_dir + s.right * px_max + s.cam_up * py_max;
+
+    // a flake can only be hit within its radius of a ray and MAX_FLAKE_DISTANCE along it
+    const double reach = MAX_FLAKE_DISTANCE + SNOWFLAKE_RADIUS + CULL_MARGIN;
+    size_t kept = 0;
+    for (const Vec3& flake : s.snowflakes) {
+        Vec3 d = flake - s.camera_pos;
+        if (d.dot(d) < reach * reach && ball_in_frustum(f, flake, SNOWFLAKE_RADIUS)) {
+            s.snowflakes[kept++] = flake;
+        }
+    }
+    s.snowflakes.resize(kept);
+
+    const SceneView& v = s.view;
+    s.sky_only = s.snowflakes.empty();
+    for (size_t i = 0; s.sky_only && i < v.num_planes; ++i) {
+        s.sky_only = !plane_in_frustum(f, v.planes[i]);
+    }
+    auto sphere_leaf = [&](int first, int count) {
+        for (int i = first; i < first + count; ++i) {
+            if (ball_in_frustum(f, v.spheres[i].center, v.spheres[i].radius)) return true;
+        }
+        return false;
+    };
+    if (s.sky_only && v.num_nodes > 0) {
+        s.sky_only = !any_in_frustum(f, v.nodes, sphere_leaf);
+    } else if (s.sky_only) {
+        s.sky_only = !sphere_leaf(0, (int)v.num_spheres);
+    }
+    if (s.sky_only && v.num_instance_nodes > 0) {
+        s.sky_only = !any_in_frustum(f, v.instance_nodes, [](int, int) { return true; });
+    }
+}
+
+void RayTracer::shade_wavefront(const TileSetup& s, int x0, int y0, int w, int h, Color* out,
+                                std::size_t row_pitch, double* depth, Wavefront& wf) {
+    int n = w * h;
+    double t_start = profiling ? omp_get_wtime() : 0.0;
+
+    // stage 1: what every camera ray hits (the G-buffer)
+    #pragma omp for schedule(runtime)
+    for (int i = 0; i < n; ++i) {
+        wf.ray_dir[i] = camera_ray(s, x0 + i % w + 0.5, y0 + i / w + 0.5);
+        primary_hit(s, wf.ray_dir[i], wf.hits[i]);
+    }
+
+    // stage 2: shadow rays of the pixels that hit something, sphere hits
+    // first (each checks the floor as well), then plane hits
+    #pragma omp single
+    {
+        wf.queue.clear();
+        for (SurfaceHit::Kind kind : {SurfaceHit::SPHERE, SurfaceHit::PLANE}) {
+            for (int i = 0; i < n; ++i) {
+                if (wf.hits[i].kind == kind) wf.queue.push_back(i);
+            }
+        }
+    }
+    #pragma omp for schedule(runtime)
+    for (int q = 0; q < (int)wf.queue.size(); ++q) {
+        int i = wf.queue[q];
+        wf.shadow[i] = in_shadow(s, wf.hits[i]);
+    }
+
+    // stage 3: shading
+    #pragma omp for schedule(static)
+    for (int i = 0; i < n; ++i) {
+        out[(i / w) * row_pitch + i % w] = surface_color(s, wf.ray_dir[i], wf.hits[i], wf.shadow[i]);
+        depth[i] = wf.hits[i].t;
+    }
+    if (profiling) tl_work.time[PhaseStats::INTERSECT] += omp_get_wtime() - t_start;
+}
+
+void RayTracer::flake_footprints(const TileSetup& s, int x0, int y0, int w, int h,
+                                 std::vector<FlakeFootprint>& footprints) const {
+    // image plane to pixel coordinates, the inverse of camera_ray
+    double to_sx = width / (2 * s.aspect_ratio * s.scale);
+    double to_sy = height / (2 * s.scale);
+    const double r = SNOWFLAKE_RADIUS;
+
+    const double reach = MAX_FLAKE_DISTANCE + r + CULL_MARGIN;
+
+    footprints.clear();
+    for (const Vec3& flake : s.snowflakes) {
+        // out of reach, or behind the camera: camera rays only move forward
+        Vec3 to_flake = flake - s.camera_pos;
+        if (to_flake.dot(to_flake) >= reach * reach || to_flake.dot(s.camera_dir) < -(r + CULL_MARGIN)) continue;
+        // A ray within r of the flake passes through the cube around it, so
+        // its pixel lies in the bounds of the cube's projected corners (as
+        // long as the whole cube is in front of the camera).
+        double sx_min = std::numeric_limits<double>::infinity(), sx_max = -sx_min;
+        double sy_min = sx_min, sy_max = -sx_min;
+        bool in_front = true;
+        for (int c = 0; c < 8 && in_front; ++c) {
+            Vec3 d = flake + Vec3(c & 1 ? r : -r, c & 2 ? r : -r, c & 4 ? r : -r) - s.camera_pos;
+            double a = d.dot(s.camera_dir);
+            in_front = a > CULL_MARGIN;
+            double sx = width / 2.0 + d.dot(s.right) / a * to_sx;
+            double sy = height / 2.0 - d.dot(s.cam_up) / a * to_sy;
+            sx_min = std::min(sx_min, sx);
+            sx_max = std::max(sx_max, sx);
+            sy_min = std::min(sy_min, sy);
+            sy_max = std::max(sy_max, sy);
+        }
+
+        FlakeFootprint f;
+        f.flake = flake;
+        if (in_front) {
+            // pixel centres are at +0.5; one pixel of slack for rounding
+            f.x_lo = (int)std::max(0.0, std::floor(sx_min - 0.5) - 1 - x0);
+            f.x_hi = (int)std::min(w - 1.0, std::ceil(sx_max - 0.5) + 1 - x0);
+            f.y_lo = (int)std::max(0.0, std::floor(sy_min - 0.5) - 1 - y0);
+            f.y_hi = (int)std::min(h - 1.0, std::ceil(sy_max - 0.5) + 1 - y0);
+            if (f.x_lo > f.x_hi || f.y_lo > f.y_hi) continue;
+        } else {
+            f.x_lo = 0;
+            f.x_hi = w - 1;
+            f.y_lo = 0;
+            f.y_hi = h - 1;
+        }
+        footprints.push_back(f);
+    }
+}
+
+void RayTracer::render(int rank, int size, std::vector<Color>& out_pixels) {
+    if (!has_scene) {
+        if(rank == 0) std::cerr << "Scene not set!\n";
+        return;
+    }
+
+    int rows_per_rank = height / size;
+    int start_row = rank * rows_per_rank;
+    int end_row = (rank == size - 1) ? height : start_row + rows_per_rank;
+
+    // a block of full rows is a tile; the snowflakes are seeded by the rank
+    renderTile(0, start_row, width, end_row - start_row, rank, out_pixels);
+}
+
+void RayTracer::init_tile(TileSetup& s) const {
+    s.camera_pos = camera.position; // Camera position
+    Vec3 camera_lookat = camera.lookat; // Point camera is looking at
+    s.camera_dir = (camera_lookat - s.camera_pos).normalize();
+    Vec3 up(0, 1, 0); // World up vector
+    s.right = s.camera_dir.cross(up).normalize(); // Camera's right vector
+    s.cam_up = s.right.cross(s.camera_dir).normalize(); // Camera's actual up vector
+
+    double fov = camera.fov;
+    s.aspect_ratio = double(width) / height;
+    s.scale = tan((fov * 0.5) * M_PI / 180.0);
+
+    s.sunlight_dir = Vec3(-1, -1, -1).normalize(); // Direction of sunlight
+    s.ambient = 0.3; // Base ambient light in the scene
+
+    s.view = current_view();
+
+    // Find floor plane (normal y ~1 and point.y ~0)
+    s.floor_plane = nullptr;
+    for (size_t i = 0; i < s.view.num_planes; ++i) {
+        const Plane& plane = s.view.planes[i];
+        if (plane.normal.y > 0.99 && std::abs(plane.point.y) < 1e-3) {
+            s.floor_plane = &plane;
+            break;
+        }
+    }
+}
+
+void RayTracer::renderPreview(int x0, int y0, int w, int h, int stride, Color* out) {
+    if (!has_scene) {
+        return;
+    }
+
+    TileSetup s;
+    init_tile(s);
+    // without snowflakes, culling only finds the sky-only tiles
+    s.sky_only = false;
+    if (culling) cull_tile(s, x0, y0, w, h);
+
+    int pw = (w + stride - 1) / stride;
+    int ph = (h + stride - 1) / stride;
+    #pragma omp parallel if(pixel_parallel)
+    {
+        #pragma omp for schedule(static)
+        for (int py = 0; py < ph; ++py) {
+            for (int px = 0; px < pw; ++px) {
+                Vec3 ray_dir = camera_ray(s, x0 + px * stride + 0.5, y0 + py * stride + 0.5);
+                double closest_t;
+                out[py * pw + px] = s.sky_only ? sky_color(ray_dir) : shade(s, ray_dir, closest_t);
+            }
+        }
+        // the phase stats describe renderTile, so the preview's work is dropped
+        tl_work = PhaseStats();
+    }
+    #pragma omp atomic
+    primary_rays += (uint64_t)pw * ph;
+}
+
+void RayTracer::renderTile(int x0, int y0, int w, int h, unsigned int seed, std::vector<Color>& out) {
+    if (!has_scene) {
+        return;
+    }
+
+    out.resize(w * h);
+    renderTile(x0, y0, w, h, seed, out.data(), w);
+}
+
+void RayTracer::renderTile(int x0, int y0, int w, int h, unsigned int seed, Color* out, std::size_t row_pitch) {
+    if (!has_scene) {
+        return;
+    }
+
+    TileSetup s;
+    init_tile(s);
+
+    double t_gen = profiling ? omp_get_wtime() : 0.0;
+    std::mt19937 rng(seed + 12345);
+    const int snowflake_count = 75000;
+    std::vector<Vec3>& snowflakes = s.snowflakes;
+    snowflakes.resize(snowflake_count);
+
+    std::normal_distribution<double> dist_xz(0.0, 6.0);
+    std::uniform_real_distribution<double> dist_y(-1.0, 25.0);
+
+    for (int i = 0; i < snowflake_count; ++i) {
+        double x_rand = dist_xz(rng);
+        double y_rand = dist_y(rng);
+        double z_rand = dist_xz(rng);
+
+        if (x_rand < -25.0) x_rand = -25.0;
+        else if (x_rand > 25.0) x_rand = 25.0;
+
+        if (z_rand < -25.0) z_rand = -25.0;
+        else if (z_rand > 25.0) z_rand = 25.0;
+
+        if (snow_fall != 0.0) {
+            // fall and re-enter at the top of [-1, 25)
+            y_rand = -1.0 + std::fmod(y_rand + 1.0 - snow_fall, 26.0);
+            if (y_rand < -1.0) y_rand += 26.0;
+        }
+
+        snowflakes[i] = Vec3(x_rand, y_rand, z_rand);
+    }
+    tl_work.flakes_generated += snowflake_count;
+    s.sky_only = false;
+    if (culling) cull_tile(s, x0, y0, w, h);
+    if (profiling) tl_work.time[PhaseStats::FLAKE_GEN] += omp_get_wtime() - t_gen;
+
+    uint64_t rays = (uint64_t)w * h;
+    uint64_t refined = 0;
+    // Adaptive anti-aliasing: pixels whose colour differs from one of their
+    // 4-neighbours in the tile by more than aa_threshold in some channel get
+    // aa_samples - 1 more samples, which are averaged with the first one.
+    std::vector<unsigned char> refine(aa_samples > 1 ? w * h : 0, 0);
+    auto differs = [&](const Color& a, const Color& b) {
+        return std::abs(a.r - b.r) > aa_threshold || std::abs(a.g - b.g) > aa_threshold
+               || std::abs(a.b - b.b) > aa_threshold;
+    };
+    // Splatting and the wavefront mode shade the first sample of all pixels
+    // before adding the snowflakes, with the depth of each pixel in between.
+    bool splat = splatting && !s.sky_only;
+    bool staged = (splatting || wavefront) && !s.sky_only;
+    std::vector<double> depth(staged ? w * h : 0);
+    std::vector<unsigned char> covered(splat ? w * h : 0, 0);
+    std::vector<FlakeFootprint> footprints;
+    Wavefront wf;
+    if (staged && wavefront) {
+        wf.ray_dir.resize(w * h);
+        wf.hits.resize(w * h);
+        wf.shadow.assign(w * h, 0);
+    }
+
+    #pragma omp parallel if(pixel_parallel)
+    {
+        if (s.sky_only) {
+            #pragma omp for schedule(static)
+            for (int ty = 0; ty < h; ++ty) {
+                #pragma omp simd
+                for (int tx = 0; tx < w; ++tx) {
+                    out[ty * row_pitch + tx] = sky_color(camera_ray(s, x0 + tx + 0.5, y0 + ty + 0.5));
+                }
+            }
+        } else if (!staged) {
+            #pragma omp for collapse(2) schedule(runtime)
+            for (int ty = 0; ty < h; ++ty) {
+                for (int tx = 0; tx < w; ++tx) {
+                    out[ty * row_pitch + tx] = trace_pixel(s, x0 + tx + 0.5, y0 + ty + 0.5);
+                }
+            }
+        } else {
+            // first pass without snowflakes
+            if (wavefront) {
+                shade_wavefront(s, x0, y0, w, h, out, row_pitch, depth.data(), wf);
+            } else {
+                #pragma omp for collapse(2) schedule(runtime)
+                for (int ty = 0; ty < h; ++ty) {
+                    for (int tx = 0; tx < w; ++tx) {
+                        double t_start = profiling ? omp_get_wtime() : 0.0;
+                        out[ty * row_pitch + tx] = shade(s, camera_ray(s, x0 + tx + 0.5, y0 + ty + 0.5),
+                                                         depth[ty * w + tx]);
+                        if (profiling) tl_work.time[PhaseStats::INTERSECT] += omp_get_wtime() - t_start;
+                    }
+                }
+            }
+
+            // then the snowflakes in front of each pixel's depth
+            if (splat) {
+                #pragma omp single
+                flake_footprints(s, x0, y0, w, h, footprints);
+
+                // rows are split over the threads; each rasterizes the footprints crossing its rows
+                #pragma omp for schedule(static)
+                for (int ty = 0; ty < h; ++ty) {
+                    double t_start = profiling ? omp_get_wtime() : 0.0;
+                    uint64_t tested = 0, near = 0;
+                    for (const FlakeFootprint& f : footprints) {
+                        if (ty < f.y_lo || ty > f.y_hi) continue;
+                        for (int tx = f.x_lo; tx <= f.x_hi; ++tx) {
+                            if (covered[ty * w + tx]) continue;
+                            ++tested;
+                            Vec3 ray_dir = camera_ray(s, x0 + tx + 0.5, y0 + ty + 0.5);
+                            if (flake_covers(f.flake, s.camera_pos, ray_dir, depth[ty * w + tx], near)) {
+                                covered[ty * w + tx] = 1;
+                                out[ty * row_pitch + tx] = Color(255, 255, 255);
+                            }
+                        }
+                    }
+                    tl_work.flake_tests += tested;
+                    tl_work.flakes_near += near;
+                    if (profiling) tl_work.time[PhaseStats::OVERLAY] += omp_get_wtime() - t_start;
+                }
+            } else {
+                #pragma omp for collapse(2) schedule(runtime)
+                for (int ty = 0; ty < h; ++ty) {
+                    for (int tx = 0; tx < w; ++tx) {
+                        double t_start = profiling ? omp_get_wtime() : 0.0;
+                        if (hits_flake(s, camera_ray(s, x0 + tx + 0.5, y0 + ty + 0.5), depth[ty * w + tx])) {
+                            out[ty * row_pitch + tx] = Color(255, 255, 255);
+                        }
+                        if (profiling) tl_work.time[PhaseStats::OVERLAY] += omp_get_wtime() - t_start;
+                    }
+                }
+            }
+        }
+
+        if (aa_samples > 1) {
+            #pragma omp for schedule(static)
+            for (int ty = 0; ty < h; ++ty) {
+                for (int tx = 0; tx < w; ++tx) {
+                    const Color& c = out[ty * row_pitch + tx];
+                    refine[ty * w + tx] = (tx > 0 && differs(c, out[ty * row_pitch + tx - 1]))
+                                          || (tx + 1 < w && differs(c, out[ty * row_pitch + tx + 1]))
+                                          || (ty > 0 && differs(c, out[(ty - 1) * row_pitch + tx]))
+                                          || (ty + 1 < h && differs(c, out[(ty + 1) * row_pitch + tx]));
+                }
+            }
+
+            #pragma omp for collapse(2) schedule(runtime) reduction(+:refined)
+            for (int ty = 0; ty < h; ++ty) {
+                for (int tx = 0; tx < w; ++tx) {
+                    if (!refine[ty * w + tx]) continue;
+                    Color& c = out[ty * row_pitch + tx];
+                    int sum[3] = {c.r, c.g, c.b};
+                    for (int k = 1; k < aa_samples; ++k) {
+                        // R2 low-discrepancy offsets within the pixel; k = 0 is its centre
+                        double ox = std::fmod(0.5 + k * 0.7548776662466927, 1.0);
+                        double oy = std::fmod(0.5 + k * 0.5698402909980532, 1.0);
+                        Color sample = trace_pixel(s, x0 + tx + ox, y0 + ty + oy);
+                        sum[0] += sample.r;
+                        sum[1] += sample.g;
+                        sum[2] += sample.b;
+                    }
+                    c = Color((sum[0] + aa_samples / 2) / aa_samples, (sum[1] + aa_samples / 2) / aa_samples,
+                              (sum[2] + aa_samples / 2) / aa_samples);
+                    ++refined;
+                }
+            }
+        }
+
+        #pragma omp critical(raytracer_phases)
+        phases.add(tl_work);
+        tl_work = PhaseStats();
+    }
+
+    if (aa_samples > 1) {
+        rays += refined * (aa_samples - 1);
+        #pragma omp atomic
+        refined_pixels += refined;
+    }
+    #pragma omp atomic
+    primary_rays += rays;
+}
+
+Color RayTracer::trace_pixel(const TileSetup& s, double sx, double sy) {
+    Vec3 ray_dir = camera_ray(s, sx, sy);
+    double t_start = profiling ? omp_get_wtime() : 0.0;
+    double closest_t;
+    Color pixel_color = shade(s, ray_dir, closest_t);
+    double t_overlay = profiling ? omp_get_wtime() : 0.0;
+    if (hits_flake(s, ray_dir, closest_t)) pixel_color = Color(255, 255, 255);
+    if (profiling) {
+        double t_end = omp_get_wtime();
+        tl_work.time[PhaseStats::INTERSECT] += t_overlay - t_start;
+        tl_work.time[PhaseStats::OVERLAY] += t_end - t_overlay;
+    }
+    return pixel_color;
+}
+
+Color RayTracer::shade(const TileSetup& s, const Vec3& ray_dir, double& closest_t) {
+    SurfaceHit hit;
+    primary_hit(s, ray_dir, hit);
+    closest_t = hit.t;
+    return surface_color(s, ray_dir, hit, hit.kind != SurfaceHit::SKY && in_shadow(s, hit));
+}
+
+void RayTracer::primary_hit(const TileSetup& s, const Vec3& ray_dir, SurfaceHit& hit) {
+    Vec3 ray_orig = s.camera_pos;
+    double closest_t = std::numeric_limits<double>::max();
+    bool sphere_hit = closest_sphere(s.view, ray_orig, ray_dir, closest_t, hit.sphere);
+    const Plane* hit_plane = nullptr;
+
+    tl_work.plane_tests += s.view.num_planes;
+    for (size_t i = 0; i < s.view.num_planes; ++i) {
+        double t;
+        if (intersect_plane(ray_orig, ray_dir, s.view.planes[i], t) && t < closest_t) {
+            closest_t = t;
+            hit_plane = &s.view.planes[i];
+            sphere_hit = false;
+        }
+    }
+
+    hit.t = closest_t;
+    hit.plane = hit_plane;
+    if (sphere_hit) {
+        hit.kind = SurfaceHit::SPHERE;
+        Vec3 hit_point = ray_orig + ray_dir * closest_t;
+        hit.normal = (hit_point - hit.sphere.sphere.center).normalize();
+        hit.shadow_origin = hit_point + hit.normal * 1e-4;
+    } else if (hit_plane) {
+        hit.kind = SurfaceHit::PLANE;
+        Vec3 hit_point = ray_orig + ray_dir * closest_t;
+        hit.normal = hit_plane->normal;
+        hit.shadow_origin = hit_point + hit.normal * 1e-4;
+    } else {
+        hit.kind = SurfaceHit::SKY;
+    }
+}
+
+bool RayTracer::in_shadow(const TileSetup& s, const SurfaceHit& hit) {
+    Vec3 shadow_dir = -s.sunlight_dir;
+    if (hit.kind == SurfaceHit::PLANE) return occluded(s.view, hit.shadow_origin, shadow_dir, nullptr);
+
+    bool in_shadow = occluded(s.view, hit.shadow_origin, shadow_dir, &hit.sphere);
+    if (!in_shadow && s.floor_plane) {
+        ++tl_work.plane_tests;
+        double t_shadow_floor;
+        if (intersect_plane(hit.shadow_origin, shadow_dir, *s.floor_plane, t_shadow_floor)) {
+            if (t_shadow_floor > 1e-4) {
+                in_shadow = true;
+            }
+        }
+    }
+    return in_shadow;
+}
+
+Color RayTracer::surface_color(const TileSetup& s, const Vec3& ray_dir, const SurfaceHit& hit, bool in_shadow) const {
+    Color pixel_color;
+
+    if (hit.kind == SurfaceHit::SPHERE) {
+        const Sphere* hit_sphere = &hit.sphere.sphere;
+        double diffuse = in_shadow ? 0.0 : std::max(0.0, hit.normal.dot(-s.sunlight_dir));
+        double brightness = s.ambient + (1.0 - s.ambient) * diffuse;
+
+        pixel_color.r = std::min(255, int(hit_sphere->color.r * brightness));
+        pixel_color.g = std::min(255, int(hit_sphere->color.g * brightness));
+        pixel_color.b = std::min(255, int(hit_sphere->color.b * brightness));
+    }
+    else if (hit.kind == SurfaceHit::PLANE) {
+        const Plane* hit_plane = hit.plane;
+        if (s.floor_plane && hit_plane == s.floor_plane) {
+            pixel_color = Color(255, 255, 255);
+            if (in_shadow) {
+                double shadow_brightness_factor = 0.6;
+                pixel_color.r = (unsigned char)(pixel_color.r * shadow_brightness_factor);
+                pixel_color.g = (unsigned char)(pixel_color.g * shadow_brightness_factor);
+                pixel_color.b = (unsigned char)(pixel_color.b * shadow_brightness_factor);
+            }
+        } else {
+            double diffuse = in_shadow ? 0.0 : std::max(0.0, hit.normal.dot(-s.sunlight_dir));
+            double brightness = s.ambient + (1.0 - s.ambient) * diffuse;
+            pixel_color.r = std::min(255, int(hit_plane->color.r * brightness));
+            pixel_color.g = std::min(255, int(hit_plane->color.g * brightness));
+            pixel_color.b = std::min(255, int(hit_plane->color.b * brightness));
+        }
+    }
+    else {
+        pixel_color = sky_color(ray_dir);
+    }
+
+    return pixel_color;
+}
+
+bool RayTracer::hits_flake(const TileSetup& s, const Vec3& ray_dir, double closest_t) {
+    uint64_t tested = 0, near = 0;
+    bool hit = false;
+    for (const auto& flake_pos : s.snowflakes) {
+        ++tested;
+        if (flake_covers(flake_pos, s.camera_pos, ray_dir, closest_t, near)) {
+            hit = true;
+            break;
+        }
+    }
+    tl_work.flake_tests += tested;
+    tl_work.flakes_near += near;
+    return hit;
+}
+
+void RayTracer::save_image(const std::string& filename, const std::vector<Color>& pixels, bool append) {
+    std::ofstream ofs(filename, append ? std::ios::binary | std::ios::app : std::ios::binary);
+    ofs << "P6\n" << width << " " << height << "\n255\n";
+    for (auto& c : pixels) {
+        ofs << (unsigned char)c.r << (unsigned char)c.g << (unsigned char)c.b;
+    }
+    ofs.close();
+}
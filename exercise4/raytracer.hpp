@@ -1,35 +1,195 @@
-// This file is distributed under the MIT license.
-// See the LICENSE file for details.
-
-
-#ifndef RAYTRACER_HPP
-#define RAYTRACER_HPP
-
-#include <vector>
-#include <string>
-#include "utils.hpp"
-#include "scene.hpp"
-
-class RayTracer {
-public:
-    RayTracer(int width, int height);
-    void set_scene(Scene* scene);
-    void render(int rank, int size, std::vector<Color>& out_pixels);
-    // Render a rectangular tile given its top-left corner (x0,y0) and size (w,h).
-    // `out` will be resized to w*h and filled row-major.
-    // `seed` is used to initialize any RNG for deterministic overlays per tile.
-    void renderTile(int x0, int y0, int w, int h, unsigned int seed, std::vector<Color>& out);
-    void save_image(const std::string& filename, const std::vector<Color>& pixels);
-
-private:
-    int width, height;
-    Scene* scene;
-
-    bool intersect_sphere(const Vec3& ray_orig, const Vec3& ray_dir,
-                          const Sphere& sphere, double& t);
-    bool intersect_plane(const Vec3& ray_orig, const Vec3& ray_dir,
-                         const Plane& plane, double& t);
-};
-
-#endif
-
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+
+#ifndef RAYTRACER_HPP
+#define RAYTRACER_HPP
+
+#include <cstddef>
+#include <cstdint>
+#include <vector>
+#include <string>
+#include "utils.hpp"
+#include "scene.hpp"
+
+// Pinhole camera; the defaults are the original fixed view.
+struct Camera {
+    Vec3 position = Vec3(0, 2, 5);
+    Vec3 lookat = Vec3(0, 1, 0);
+    double fov = 60.0;   // vertical, degrees
+};
+
+// Work done in the phases of renderTile, summed over threads and tiles:
+// snowflake generation, intersection and shading (camera and shadow rays),
+// and the snowflake overlay. The counts are always kept; the times are
+// thread-seconds and only measured with set_profiling(true).
+struct PhaseStats {
+    enum Phase { FLAKE_GEN, INTERSECT, OVERLAY, PHASES };
+    double time[PHASES] = {0, 0, 0};
+    uint64_t flakes_generated = 0;
+    uint64_t box_tests = 0;      // ray/BVH node box tests
+    uint64_t sphere_tests = 0;   // ray/sphere tests, instanced ones included
+    uint64_t plane_tests = 0;
+    uint64_t flake_tests = 0;    // ray/snowflake projections
+    uint64_t flakes_near = 0;    // of which within range, needing the distance test
+
+    void add(const PhaseStats& o);
+};
+
+class RayTracer {
+public:
+    RayTracer(int width, int height);
+    void set_scene(Scene* scene);
+    // Render from externally owned data (a mapped cache or a shared window);
+    // the data must outlive the renders.
+    void set_scene(const SceneView& view);
+    void set_camera(const Camera& c) { camera = c; }
+    // Move the snowflakes down by `dy` (wrapping around their height range),
+    // for animated snowfall.
+    void set_snow_fall(double dy) { snow_fall = dy; }
+    // Adaptive anti-aliasing: after one sample per pixel, pixels differing
+    // from a neighbour by more than `threshold` (0-255, any channel) are
+    // sampled up to `max_samples` times in total. max_samples 1 turns it off.
+    void set_sampling(int max_samples, int threshold) { aa_samples = max_samples; aa_threshold = threshold; }
+    // Whether renderTile spreads the pixels of a tile over the OpenMP threads
+    // (default). Turn off to render whole tiles per thread, e.g. as tasks.
+    void set_pixel_parallel(bool on) { pixel_parallel = on; }
+    // Per-tile culling (default on): each tile keeps only the snowflakes its
+    // view frustum can show, and tiles that can only see sky are filled with
+    // the gradient directly. The image is the same either way.
+    void set_culling(bool on) { culling = on; }
+    // Snowflake overlay of the first sample of each pixel: off (default) tests
+    // every snowflake against every camera ray; on projects each snowflake of
+    // the tile to the screen once and tests only the pixels of its footprint,
+    // with the same rule and against the depth of the first pass, so the
+    // image is the same. Anti-aliasing samples always use the ray test.
+    void set_splatting(bool on) { splatting = on; }
+    // Render the first sample of each pixel in stages over the whole tile
+    // (visibility into a G-buffer, shadow rays of the pixels that hit
+    // something, shading, snowflakes) instead of pixel by pixel. Same image.
+    void set_wavefront(bool on) { wavefront = on; }
+    // Camera rays (samples) traced and pixels supersampled since construction
+    // or the last reset_counters() (which also clears the phase stats).
+    uint64_t rays_traced() const { return primary_rays; }
+    uint64_t pixels_refined() const { return refined_pixels; }
+    void reset_counters() { primary_rays = 0; refined_pixels = 0; phases = PhaseStats(); }
+    // Time the phases of renderTile (see PhaseStats); costs a clock read
+    // per phase and sample.
+    void set_profiling(bool on) { profiling = on; }
+    PhaseStats phase_stats() const { return phases; }
+    void render(int rank, int size, std::vector<Color>& out_pixels);
+    // Render a rectangular tile given its top-left corner (x0,y0) and size (w,h).
+    // `out` will be resized to w*h and filled row-major.
+    // `seed` is used to initialize any RNG for deterministic overlays per tile.
+    void renderTile(int x0, int y0, int w, int h, unsigned int seed, std::vector<Color>& out);
+    // Same, but writes into caller-owned memory: row ty of the tile starts at
+    // out + ty*row_pitch (pitch in pixels), so a tile can be rendered in place
+    // into a larger framebuffer.
+    void renderTile(int x0, int y0, int w, int h, unsigned int seed, Color* out, std::size_t row_pitch);
+    // Low-resolution preview of a tile: every `stride`-th pixel in x and y,
+    // without snowflakes and anti-aliasing (so it needs no snowflake
+    // generation). `out` receives ceil(w/stride) x ceil(h/stride) pixels.
+    void renderPreview(int x0, int y0, int w, int h, int stride, Color* out);
+    // With `append`, the image is added to the end of the file, which then
+    // holds a stream of PPM images (e.g. for ffmpeg -f image2pipe).
+    void save_image(const std::string& filename, const std::vector<Color>& pixels, bool append = false);
+
+private:
+    int width, height;
+    Scene* scene;          // if set, its current view is used at render time
+    SceneView external;
+    bool has_scene;
+    Camera camera;
+    double snow_fall;
+    int aa_samples;
+    int aa_threshold;
+    uint64_t primary_rays;
+    uint64_t refined_pixels;
+    bool pixel_parallel;
+    bool profiling;
+    bool culling;
+    bool splatting;
+    bool wavefront;
+    PhaseStats phases;
+
+    // Per-tile state shared by all samples of a tile.
+    struct TileSetup {
+        SceneView view;
+        Vec3 camera_pos, camera_dir, right, cam_up;
+        double aspect_ratio, scale;
+        Vec3 sunlight_dir;
+        double ambient;
+        const Plane* floor_plane;
+        std::vector<Vec3> snowflakes;   // culled to the tile's frustum
+        bool sky_only;                  // no camera ray of the tile can hit anything
+    };
+
+    // Pixels of a tile (inclusive, tile-relative) whose camera ray may pass
+    // within the radius of a snowflake.
+    struct FlakeFootprint {
+        Vec3 flake;
+        int x_lo, x_hi, y_lo, y_hi;
+    };
+
+    // A sphere hit: the sphere in world space and where it came from.
+    struct SphereHit {
+        Sphere sphere = Sphere(Vec3(), 0.0, Color());
+        int index = -1;      // into spheres, or template_spheres if instance >= 0
+        int instance = -1;
+    };
+
+    // What a camera ray sees first: one G-buffer entry of the wavefront mode.
+    struct SurfaceHit {
+        enum Kind : unsigned char { SKY, SPHERE, PLANE };
+        Kind kind = SKY;
+        double t = 0.0;                // max double for sky
+        SphereHit sphere;              // if kind == SPHERE
+        const Plane* plane = nullptr;  // if kind == PLANE
+        Vec3 normal, shadow_origin;
+    };
+
+    // Per-tile buffers of the wavefront mode.
+    struct Wavefront {
+        std::vector<Vec3> ray_dir;
+        std::vector<SurfaceHit> hits;
+        std::vector<int> queue;              // pixels needing a shadow ray, spheres first
+        std::vector<unsigned char> shadow;
+    };
+
+    SceneView current_view() const;
+    // Camera, lighting, scene and floor plane of a tile (no snowflakes yet).
+    void init_tile(TileSetup& s) const;
+    // Drop the snowflakes no camera ray of the tile can hit and decide sky_only.
+    void cull_tile(TileSetup& s, int x0, int y0, int w, int h);
+    // Unit direction of the camera ray through image position (sx, sy).
+    Vec3 camera_ray(const TileSetup& s, double sx, double sy) const;
+    // Colour of the camera ray through image position (sx, sy), in pixels.
+    Color trace_pixel(const TileSetup& s, double sx, double sy);
+    // Colour of the camera ray without snowflakes; sets closest_t to the
+    // distance of its hit (max double for sky).
+    Color shade(const TileSetup& s, const Vec3& ray_dir, double& closest_t);
+    void primary_hit(const TileSetup& s, const Vec3& ray_dir, SurfaceHit& hit);
+    bool in_shadow(const TileSetup& s, const SurfaceHit& hit);
+    Color surface_color(const TileSetup& s, const Vec3& ray_dir, const SurfaceHit& hit, bool in_shadow) const;
+    // Stages 1-3 of the wavefront mode over a tile: out without snowflakes and
+    // the depth of each pixel. Called by every thread of a parallel region.
+    void shade_wavefront(const TileSetup& s, int x0, int y0, int w, int h, Color* out, std::size_t row_pitch,
+                         double* depth, Wavefront& wf);
+    // True if the camera ray hits a snowflake in front of closest_t.
+    bool hits_flake(const TileSetup& s, const Vec3& ray_dir, double closest_t);
+    void flake_footprints(const TileSetup& s, int x0, int y0, int w, int h,
+                          std::vector<FlakeFootprint>& footprints) const;
+    // Closest sphere or instanced sphere hit with t < closest_t (updated).
+    bool closest_sphere(const SceneView& v, const Vec3& ray_orig, const Vec3& ray_dir, double& closest_t,
+                        SphereHit& hit);
+    // True if any sphere other than `skip` (may be null) is hit in front of the origin.
+    bool occluded(const SceneView& v, const Vec3& ray_orig, const Vec3& ray_dir, const SphereHit* skip);
+
+    bool intersect_sphere(const Vec3& ray_orig, const Vec3& ray_dir,
+                          const Sphere& sphere, double& t);
+    bool intersect_plane(const Vec3& ray_orig, const Vec3& ray_dir,
+                         const Plane& plane, double& t);
+};
+
+#endif
+
@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+NumPy reference implementation of the snowman renderer.
+
+Reimplements Scene::generate_snowmen and RayTracer::renderTile (camera basis,
+sphere/plane hits, directional shadow, sky gradient and snowflake overlay)
+with whole tiles processed as batched arrays of rays against batched spheres,
+so images from the C++ code can be checked by diffing instead of eyeballing
+output.ppm. The random streams of libstdc++ (std::mt19937,
+generate_canonical, the polar normal_distribution) are reproduced exactly, so
+the snowflakes land on the same pixels.
+
+Instead of testing every ray against all 75000 flakes, each flake is projected
+onto the image plane and only the pixels whose rays can pass within the flake
+radius are tested, with the same arithmetic as the C++ loop.
+
+Which flakes a tile gets depends on its seed, (tile_id*10007) ^ (rank+12345)
+in main.cpp, i.e. on the worker that rendered it. A run with a single worker
+(-np 2) or with one process is therefore reproducible; use --worker-rank 1
+for the former and --single for the latter. Runs with --seed-mode tile leave
+the rank out and are reproduced with --seed-mode tile here. Like the C++ code, every tile
+regenerates its 75000 flakes, so small tiles cost more: 256×256 takes about a
+second as a single image or with 64-pixel tiles.
+
+Usage:
+    ./reference_render.py --size 256 --snowmen 4 --single -o ref.ppm
+    ./reference_render.py --size 256 --tile-size 16 --worker-rank 1 --compare output.ppm
+"""
+
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+import ppm_io
+
+SNOWFLAKE_COUNT = 75000
+SNOWFLAKE_RADIUS = 0.008
+MAX_RAY_DISTANCE = 8.0
+EPS = 1e-4
+
+CAMERA_POS = np.array([0.0, 2.0, 5.0])
+CAMERA_LOOKAT = np.array([0.0, 1.0, 0.0])
+WORLD_UP = np.array([0.0, 1.0, 0.0])
+FOV = 60.0
+AMBIENT = 0.3
+SKY_TOP = np.array([135.0, 206.0, 235.0])
+SKY_BOTTOM = np.array([255.0, 255.0, 255.0])
+
+
+# --- libstdc++ random streams ---
+
+def mt19937(seed):
+    """
+    MT19937 bit generator seeded like std::mt19937(seed) (init_genrand).
+    """
+    key = np.empty(624, dtype=np.uint32)
+    x = seed & 0xffffffff
+    key[0] = x
+    for i in range(1, 624):
+        x = (1812433253 * (x ^ (x >> 30)) + i) & 0xffffffff
+        key[i] = x
+    bg = np.random.MT19937()
+    bg.state = {'bit_generator': 'MT19937', 'state': {'key': key, 'pos': 624}}
+    return bg
+
+
+def canonical(bg, n):
+    """
+    n values of std::generate_canonical<double, 53> on a 32-bit engine:
+    two draws, (lo + hi * 2^32) / 2^64, clamped below 1.
+    """
+    raw = bg.random_raw(2 * n).astype(np.float64)
+    u = (raw[0::2] + raw[1::2] * 4294967296.0) / 18446744073709551616.0
+    return np.minimum(u, np.nextafter(1.0, 0.0))
+
+
+def _orbit(step, start, n):
+    """
+    The first n positions start, step[start], step[step[start]], ... computed
+    by pointer doubling; step must map the sink len(step) - 1 to itself.
+    """
+    orbit = np.array([start], dtype=np.int64)
+    jump = step
+    while len(orbit) < n:
+        orbit = np.concatenate([orbit, jump[orbit]])
+        jump = jump[jump]
+    return orbit[:n]
+
+
+def snowflakes(seed, count=SNOWFLAKE_COUNT):
+    """
+    Flake positions of renderTile for a given tile seed, shape (count, 3).
+
+    Per flake the C++ loop draws normal, uniform, normal. The first normal
+    runs the polar method (pairs of canonicals until one falls inside the unit
+    circle) and returns y*mult, keeping x*mult for the second; the uniform
+    takes the canonical after the accepted pair. The stream is parsed for all
+    start positions at once and the chain of flake starts followed by pointer
+    doubling.
+    """
+    bg = mt19937(seed + 12345)
+    n = int(count * 3.6) + 64
+    while True:
+        c = canonical(bg, n)
+        u = 2.0 * c - 1.0
+        r2 = u[:-1] * u[:-1] + u[1:] * u[1:]
+        accept = (r2 <= 1.0) & (r2 != 0.0)
+        # first accepted pair at k, k+2, k+4, ... (same parity) for every k
+        first = np.full(n + 2, n, dtype=np.int64)
+        idx = np.where(accept, np.arange(n - 1), n)
+        for parity in (0, 1):
+            first[parity:n - 1:2] = np.minimum.accumulate(idx[parity::2][::-1])[::-1]
+        # the uniform after the pair must exist too
+        step = np.where(first[:n] + 2 < n, first[:n] + 3, n)
+        step = np.append(step, n)
+        starts = _orbit(step, 0, count)
+        if starts[-1] < n and first[starts[-1]] + 2 < n:
+            break
+        # stream ran out for this seed; redo with a longer one
+        bg = mt19937(seed + 12345)
+        n *= 2
+
+    pair = first[starts]
+    mult = np.sqrt(-2 * np.log(r2[pair]) / r2[pair])
+    x = u[pair + 1] * mult * 6.0 + 0.0
+    z = u[pair] * mult * 6.0 + 0.0
+    y = c[pair + 2] * (25.0 - -1.0) + -1.0
+    return np.column_stack([np.clip(x, -25.0, 25.0), y, np.clip(z, -25.0, 25.0)])
+
+
+# --- scene ---
+
+class Scene:
+    """
+    Batched copy of Scene: spheres as (m, 3) centers, (m,) radii and (m, 3)
+    colors, planes likewise.
+    """
+
+    def __init__(self, centers, radii, colors, plane_points, plane_normals, plane_colors):
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        self.radii = np.asarray(radii, dtype=np.float64)
+        self.colors = np.asarray(colors, dtype=np.float64).reshape(-1, 3)
+        self.plane_points = np.asarray(plane_points, dtype=np.float64).reshape(-1, 3)
+        normals = np.asarray(plane_normals, dtype=np.float64).reshape(-1, 3)
+        self.plane_normals = normals / np.sqrt((normals * normals).sum(axis=1))[:, None]
+        self.plane_colors = np.asarray(plane_colors, dtype=np.float64).reshape(-1, 3)
+
+    def floor_index(self):
+        """
+        Index of the floor plane (normal y ~1 and point.y ~0) or -1.
+        """
+        for i, (p, n) in enumerate(zip(self.plane_points, self.plane_normals)):
+            if n[1] > 0.99 and abs(p[1]) < 1e-3:
+                return i
+        return -1
+
+
+def generate_snowmen(count):
+    """
+    Same spheres and planes as Scene::generate_snowmen.
+    """
+    base_radius, body_radius, head_radius = 1.2, 0.9, 0.5
+    spacing = 4.0
+    start_x = -((count - 1) * spacing) / 2.0
+    offsets = canonical(mt19937(42), 2 * count) * (0.1 - -0.1) + -0.1
+
+    spheres = []
+    for i in range(count):
+        x = start_x + i * spacing
+        z = -10 + offsets[2 * i]
+        x_offset = offsets[2 * i + 1]
+        y_head = 3.0
+        y_body = y_head - head_radius - body_radius
+        y_base = y_body - body_radius - base_radius
+        head = (x + x_offset, y_head, z)
+        body = (x + x_offset, y_body, z)
+        base = (x + x_offset, y_base, z)
+
+        snow = (245, 245, 255)
+        spheres += [(base, base_radius, snow), (body, body_radius, snow), (head, head_radius, snow)]
+        spheres.append(((head[0], head[1], head[2] + head_radius + 0.12), 0.12, (255, 128, 0)))
+        eye_y = head[1] + 0.1
+        eye_z = head[2] + head_radius + 0.1
+        spheres.append(((head[0] - 0.18, eye_y, eye_z), 0.1, (0, 0, 0)))
+        spheres.append(((head[0] + 0.18, eye_y, eye_z), 0.1, (0, 0, 0)))
+        button_z = body[2] + body_radius + 0.1
+        for b in range(3):
+            spheres.append(((body[0], body[1] + 0.3 - b * 0.25, button_z), 0.12, (30, 30, 30)))
+        hat_base = (head[0], head[1] + head_radius + 0.05, head[2])
+        spheres.append((hat_base, 0.3, (15, 15, 15)))
+        spheres.append(((head[0], hat_base[1] + 0.2, head[2]), 0.2, (20, 20, 20)))
+
+    planes = [((0, 0, 0), (0, 1, 0), (245, 245, 245))] if count > 0 else []
+    return Scene([s[0] for s in spheres], [s[1] for s in spheres], [s[2] for s in spheres],
+                 [p[0] for p in planes], [p[1] for p in planes], [p[2] for p in planes])
+
+
+# --- vector helpers (component-wise, same evaluation order as Vec3) ---
+
+def _dot(a, b):
+    return a[..., 0] * b[..., 0] + a[..., 1] * b[..., 1] + a[..., 2] * b[..., 2]
+
+
+def _normalize(v):
+    return v / np.sqrt(_dot(v, v))[..., None]
+
+
+def _cross(a, b):
+    return np.array([a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]])
+
+
+def camera(width, height):
+    """
+    Camera basis and image-plane scale as in renderTile.
+    """
+    camera_dir = _normalize(CAMERA_LOOKAT - CAMERA_POS)
+    right = _normalize(_cross(camera_dir, WORLD_UP))
+    cam_up = _normalize(_cross(right, camera_dir))
+    aspect_ratio = width / height
+    scale = math.tan((FOV * 0.5) * math.pi / 180.0)
+    return camera_dir, right, cam_up, aspect_ratio, scale
+
+
+def primary_rays(width, height, xs, ys):
+    """
+    Normalized ray directions, shape (n, 3), for pixel coordinates xs, ys.
+    """
+    camera_dir, right, cam_up, aspect_ratio, scale = camera(width, height)
+    px = (2 * ((xs + 0.5) / width) - 1) * aspect_ratio * scale
+    py = (1 - 2 * ((ys + 0.5) / height)) * scale
+    d = camera_dir + right * px[:, None] + cam_up * py[:, None]
+    return _normalize(d)
+
+
+def intersect_spheres(orig, dirs, centers, radii):
+    """
+    Hit distance of every ray against every sphere, shape (n, m); inf for a miss.
+    """
+    oc = orig[:, None, :] - centers[None, :, :]
+    d = dirs[:, None, :]
+    a = _dot(d, d)
+    b = 2.0 * _dot(oc, d)
+    c = _dot(oc, oc) - radii * radii
+    disc = b * b - 4 * a * c
+    with np.errstate(invalid='ignore'):
+        sq = np.sqrt(disc)
+        t0 = (-b - sq) / (2 * a)
+        t1 = (-b + sq) / (2 * a)
+    t = np.where(t0 > EPS, t0, np.where(t1 > EPS, t1, np.inf))
+    return np.where(disc < 0, np.inf, t)
+
+
+def intersect_planes(orig, dirs, points, normals):
+    """
+    Hit distance of every ray against every plane, shape (n, k); inf for a miss.
+    """
+    denom = dirs @ normals.T
+    diff = points[None, :, :] - orig[:, None, :]
+    num = _dot(diff, normals[None, :, :])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = num / denom
+    return np.where((np.abs(denom) > 1e-6) & (t >= EPS), t, np.inf)
+
+
+def shade(scene, dirs, floor):
+    """
+    Colors (n, 3) and closest hit distances (n,) of primary rays from the camera.
+    """
+    n = len(dirs)
+    orig = np.broadcast_to(CAMERA_POS, (n, 3))
+    sun = _normalize(np.array([-1.0, -1.0, -1.0]))
+    shadow_dir = -sun
+
+    closest = np.full(n, np.finfo(np.float64).max)
+    hit_sphere = np.full(n, -1)
+    hit_plane = np.full(n, -1)
+    if len(scene.radii):
+        ts = intersect_spheres(orig, dirs, scene.centers, scene.radii)
+        j = np.argmin(ts, axis=1)
+        tj = ts[np.arange(n), j]
+        take = tj < closest
+        closest[take] = tj[take]
+        hit_sphere[take] = j[take]
+    if len(scene.plane_points):
+        tp = intersect_planes(orig, dirs, scene.plane_points, scene.plane_normals)
+        j = np.argmin(tp, axis=1)
+        tj = tp[np.arange(n), j]
+        take = tj < closest
+        closest[take] = tj[take]
+        hit_plane[take] = j[take]
+        hit_sphere[take] = -1
+
+    color = np.empty((n, 3))
+
+    # sky gradient
+    sky = (hit_sphere < 0) & (hit_plane < 0)
+    t = 0.5 * (dirs[sky, 1] + 1.0)
+    color[sky] = np.floor((1 - t)[:, None] * SKY_BOTTOM + t[:, None] * SKY_TOP)
+
+    # spheres: shadow from every other sphere and the floor
+    m = np.nonzero(hit_sphere >= 0)[0]
+    if len(m):
+        k = hit_sphere[m]
+        hit = orig[m] + dirs[m] * closest[m, None]
+        normal = _normalize(hit - scene.centers[k])
+        shadow_orig = hit + normal * 1e-4
+        sdirs = np.broadcast_to(shadow_dir, shadow_orig.shape)
+        ts = intersect_spheres(shadow_orig, sdirs, scene.centers, scene.radii)
+        ts[np.arange(len(m)), k] = np.inf
+        in_shadow = np.isfinite(ts).any(axis=1)
+        if floor >= 0:
+            tf = intersect_planes(shadow_orig, sdirs, scene.plane_points[floor:floor + 1],
+                                  scene.plane_normals[floor:floor + 1])[:, 0]
+            in_shadow |= np.isfinite(tf) & (tf > EPS)
+        diffuse = np.where(in_shadow, 0.0, np.maximum(0.0, _dot(normal, shadow_dir)))
+        brightness = AMBIENT + (1.0 - AMBIENT) * diffuse
+        color[m] = np.minimum(255, np.trunc(scene.colors[k] * brightness[:, None]))
+
+    # planes: shadow from every sphere; the floor is white or a darker white
+    m = np.nonzero(hit_plane >= 0)[0]
+    if len(m):
+        k = hit_plane[m]
+        hit = orig[m] + dirs[m] * closest[m, None]
+        normal = scene.plane_normals[k]
+        shadow_orig = hit + normal * 1e-4
+        in_shadow = np.zeros(len(m), dtype=bool)
+        if len(scene.radii):
+            ts = intersect_spheres(shadow_orig, np.broadcast_to(shadow_dir, shadow_orig.shape),
+                                   scene.centers, scene.radii)
+            in_shadow = np.isfinite(ts).any(axis=1)
+        is_floor = k == floor
+        floor_value = np.where(in_shadow, math.trunc(255 * 0.6), 255)
+        diffuse = np.where(in_shadow, 0.0, np.maximum(0.0, _dot(normal, shadow_dir)))
+        brightness = AMBIENT + (1.0 - AMBIENT) * diffuse
+        lit = np.minimum(255, np.trunc(scene.plane_colors[k] * brightness[:, None]))
+        color[m] = np.where(is_floor[:, None], floor_value[:, None], lit)
+
+    return color, closest
+
+
+def overlay_snowflakes(flakes, width, height, x0, y0, w, h, dirs, closest, color):
+    """
+    Paint flakes white into color (tile pixels row-major). Candidate pixels
+    come from projecting each flake onto the image plane; a ray through image
+    point Q passes a flake at depth d no closer than d*|P-Q|/sqrt(1+|Q|^2), P
+    being the flake's projection, which bounds the candidate box. Flakes at
+    (almost) the camera depth are tested against the whole tile.
+    """
+    camera_dir, right, cam_up, aspect_ratio, scale = camera(width, height)
+    to_flake = flakes - CAMERA_POS
+    dist = np.sqrt(_dot(to_flake, to_flake))
+    near = dist < MAX_RAY_DISTANCE + 2 * SNOWFLAKE_RADIUS
+    to_flake = to_flake[near]
+    depth = to_flake @ camera_dir
+    keep = depth > -SNOWFLAKE_RADIUS
+    to_flake, depth = to_flake[keep], depth[keep]
+
+    # tile corners on the image plane bound |Q|
+    qx = (2 * (np.array([x0, x0 + w]) / width) - 1) * aspect_ratio * scale
+    qy = (1 - 2 * (np.array([y0, y0 + h]) / height)) * scale
+    q_max = math.sqrt(np.max(qx * qx) + np.max(qy * qy))
+    reach = SNOWFLAKE_RADIUS * math.sqrt(1 + q_max * q_max) * 1.001
+
+    far = depth > 0.05
+    brute = to_flake[~far]
+    to_flake, depth = to_flake[far], depth[far]
+    px = (to_flake @ right) / depth
+    py = (to_flake @ cam_up) / depth
+    rho = reach / depth
+    sx = width / (2 * aspect_ratio * scale)
+    sy = height / (2 * scale)
+    cx = (px / (aspect_ratio * scale) + 1) * width / 2 - 0.5
+    cy = (1 - py / scale) * height / 2 - 0.5
+    lo_x = np.maximum(np.floor(cx - rho * sx) - 1, x0).astype(np.int64)
+    hi_x = np.minimum(np.ceil(cx + rho * sx) + 1, x0 + w - 1).astype(np.int64)
+    lo_y = np.maximum(np.floor(cy - rho * sy) - 1, y0).astype(np.int64)
+    hi_y = np.minimum(np.ceil(cy + rho * sy) + 1, y0 + h - 1).astype(np.int64)
+    bw = np.maximum(hi_x - lo_x + 1, 0)
+    bh = np.maximum(hi_y - lo_y + 1, 0)
+    big = bw * bh > 4096
+    if big.any():
+        brute = np.concatenate([brute, to_flake[big]])
+        bw[big] = 0
+
+    # expand (flake, pixel) candidate pairs
+    counts = bw * bh
+    flake_idx = np.repeat(np.arange(len(to_flake)), counts)
+    if len(flake_idx):
+        offset = np.arange(len(flake_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+        xs = lo_x[flake_idx] + offset % bw[flake_idx]
+        ys = lo_y[flake_idx] + offset // bw[flake_idx]
+        pix = (ys - y0) * w + (xs - x0)
+        hit = _flake_hits(to_flake[flake_idx], dirs[pix], closest[pix])
+        color[pix[hit]] = 255.0
+
+    per_block = max(1, 65536 // len(dirs))
+    for s in range(0, len(brute), per_block):
+        block = brute[s:s + per_block]
+        hit = _flake_hits(np.repeat(block, len(dirs), axis=0), np.tile(dirs, (len(block), 1)),
+                          np.tile(closest, len(block)))
+        color[np.nonzero(hit.reshape(len(block), -1).any(axis=0))[0]] = 255.0
+
+
+def _flake_hits(to_flake, dirs, closest):
+    """
+    The test of the C++ flake loop for pairs of (flake - camera, ray direction).
+    """
+    proj = _dot(to_flake, dirs)
+    point = CAMERA_POS + dirs * proj[:, None]
+    flake = to_flake + CAMERA_POS
+    d = point - flake
+    dist_sq = _dot(d, d)
+    ok = (proj >= 0) & (proj <= MAX_RAY_DISTANCE) & (proj <= closest)
+    return ok & (dist_sq < SNOWFLAKE_RADIUS * SNOWFLAKE_RADIUS)
+
+
+def render_tile(scene, width, height, x0, y0, w, h, seed, chunk=65536):
+    """
+    Reference for RayTracer::renderTile: (h, w, 3) uint8 tile. Rays are shaded
+    in chunks of at most `chunk` to bound the (rays x spheres) temporaries.
+    """
+    ys, xs = np.divmod(np.arange(w * h), w)
+    xs = xs + x0
+    ys = ys + y0
+    dirs = primary_rays(width, height, xs.astype(np.float64), ys.astype(np.float64))
+    floor = scene.floor_index()
+    color = np.empty((w * h, 3))
+    closest = np.empty(w * h)
+    for s in range(0, w * h, chunk):
+        color[s:s + chunk], closest[s:s + chunk] = shade(scene, dirs[s:s + chunk], floor)
+    overlay_snowflakes(snowflakes(seed), width, height, x0, y0, w, h, dirs, closest, color)
+    return color.astype(np.uint8).reshape(h, w, 3)
+
+
+def tile_seed(tile_id, rank):
+    """
+    Seed main.cpp passes to renderTile for a tile rendered by `rank`.
+    """
+    return ((tile_id * 10007) & 0xffffffff) ^ (rank + 12345)
+
+
+def render_image(size, snowmen, tile_size=None, worker_rank=1, chunk=65536):
+    """
+    Full image as (size, size, 3) uint8. With tile_size None the single-process
+    path (render(0, 1): one flake set for the whole image) is reproduced,
+    otherwise the tiles of the master/worker path all rendered by worker_rank.
+    """
+    scene = generate_snowmen(snowmen)
+    if tile_size is None:
+        return render_tile(scene, size, size, 0, 0, size, size, 0, chunk)
+    image = np.empty((size, size, 3), dtype=np.uint8)
+    tile_id = 0
+    for y0 in range(0, size, tile_size):
+        for x0 in range(0, size, tile_size):
+            w = min(tile_size, size - x0)
+            h = min(tile_size, size - y0)
+            image[y0:y0 + h, x0:x0 + w] = render_tile(scene, size, size, x0, y0, w, h,
+                                                      tile_seed(tile_id, worker_rank), chunk)
+            tile_id += 1
+    return image
+
+
+# --- diffing ---
+
+def diff_images(a, b, tolerance=0):
+    """
+    Compare two images; returns (differing pixels, max channel difference,
+    (y, x) coordinates of up to 10 differing pixels).
+    """
+    if a.shape != b.shape:
+        raise ValueError(f'image shapes differ: {a.shape} vs {b.shape}')
+    delta = np.abs(a.astype(np.int16) - b.astype(np.int16)).max(axis=2)
+    bad = np.argwhere(delta > tolerance)
+    return len(bad), int(delta.max(initial=0)), [tuple(map(int, p)) for p in bad[:10]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NumPy reference renderer for snowman')
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--snowmen', type=int, default=4)
+    parser.add_argument('--tile-size', type=int, default=16)
+    parser.add_argument('--single', action='store_true', help='reproduce the single-process render')
+    parser.add_argument('--worker-rank', type=int, default=1,
+                        help='rank assumed to have rendered every tile (default: 1, i.e. -np 2)')
+    parser.add_argument('--seed-mode', choices=('rank', 'tile'), default='rank',
+                        help='tile: seeds from the tile id only, as snowman --seed-mode tile')
+    parser.add_argument('--chunk', type=int, default=65536, help='rays shaded per batch')
+    parser.add_argument('-o', '--output', help='write the reference image to this PPM')
+    parser.add_argument('--compare', help='PPM produced by snowman to diff against')
+    parser.add_argument('--tolerance', type=int, default=0, help='allowed per-channel difference')
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.seed_mode == 'tile':
+        image = render_image(args.size, args.snowmen, args.tile_size, 0, args.chunk)
+    else:
+        image = render_image(args.size, args.snowmen, None if args.single else args.tile_size,
+                             args.worker_rank, args.chunk)
+    print(f'Reference render {args.size}×{args.size}: {time.perf_counter() - t0:.2f} s')
+    if args.output:
+        ppm_io.write_ppm(args.output, image)
+        print(f'Image saved to {args.output}')
+    if args.compare:
+        bad, max_delta, where = diff_images(image, ppm_io.read_ppm(args.compare), args.tolerance)
+        if bad:
+            print(f'{args.compare}: {bad} pixels differ (max channel delta {max_delta}), first at {where}')
+            return 1
+        print(f'{args.compare}: identical to the reference')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
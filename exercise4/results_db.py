@@ -0,0 +1,667 @@
+#!/usr/bin/env python3
+"""
+SQLite-backed results store for snowman benchmark runs.
+
+Every run is stored with its configuration (image size, snowmen, tile size,
+processes, threads), the git revision and compiler it was built with, and the
+pinning environment (OMP_*, KMP_AFFINITY, I_MPI_PIN*) it ran under.
+
+Runs are read from the NDJSON records written by `snowman --metrics-json`
+(see snowman_metrics.py); SLURM logs of older binaries without that option
+are parsed from their text output instead.
+
+Examples:
+    # import metrics records, or existing SLURM logs
+    ./results_db.py ingest results/metrics.ndjson
+    ./results_db.py ingest results/*.out --git-rev 2f86b1b
+
+    # run a benchmark and record it directly
+    OMP_NUM_THREADS=12 ./results_db.py record -- mpirun -np 8 ./snowman 1024 4 64
+
+    # best tile size for 8 processes x 12 threads
+    ./results_db.py best-tile --procs 8 --threads 12
+
+    # flag significant regressions between two revisions
+    ./results_db.py compare --base 2f86b1b --head HEAD
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import shlex
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import snowman_metrics
+
+DEFAULT_DB = 'results/benchmarks.sqlite'
+
+# Environment variables that influence placement/pinning and are stored per run
+PINNING_PREFIXES = ('OMP_', 'KMP_AFFINITY', 'I_MPI_PIN')
+
+# Columns identifying a configuration; runs sharing them are repetitions
+CONFIG_COLUMNS = ('image_size', 'num_snowmen', 'tile_size', 'procs', 'threads', 'variant')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id          INTEGER PRIMARY KEY,
+    recorded_at TEXT NOT NULL,
+    source      TEXT,
+    git_rev     TEXT,
+    compiler    TEXT,
+    host        TEXT,
+    image_size  INTEGER,
+    num_snowmen INTEGER,
+    tile_size   INTEGER,
+    procs       INTEGER,
+    threads     INTEGER,
+    variant     TEXT NOT NULL DEFAULT '',
+    max_time    REAL,
+    min_time    REAL,
+    avg_time    REAL,
+    wall_time   REAL,
+    env         TEXT,
+    extra       TEXT
+);
+CREATE TABLE IF NOT EXISTS rank_times (
+    run_id  INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    rank    INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (run_id, rank)
+);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (procs, threads, tile_size, image_size, num_snowmen);
+CREATE INDEX IF NOT EXISTS runs_rev ON runs (git_rev);
+"""
+
+
+# ---------------------------------------------------------------------------
+# Database access
+# ---------------------------------------------------------------------------
+
+def connect(path=DEFAULT_DB):
+    """
+    Open (and create if needed) the results database.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def insert_run(conn, run):
+    """
+    Insert one run dict (as produced by parse_log / record) and its per-rank times.
+    Returns the new run id.
+    """
+    columns = ('recorded_at', 'source', 'git_rev', 'compiler', 'host',
+               'image_size', 'num_snowmen', 'tile_size', 'procs', 'threads', 'variant',
+               'max_time', 'min_time', 'avg_time', 'wall_time')
+    values = [run.get(c) for c in columns]
+    values[columns.index('variant')] = run.get('variant') or ''
+    values[columns.index('recorded_at')] = run.get('recorded_at') or now()
+    cur = conn.execute(
+        f"INSERT INTO runs ({', '.join(columns)}, env, extra) "
+        f"VALUES ({', '.join('?' * len(columns))}, ?, ?)",
+        values + [json.dumps(run.get('env') or {}, sort_keys=True),
+                  json.dumps(run.get('extra') or {}, sort_keys=True)])
+    run_id = cur.lastrowid
+    conn.executemany('INSERT INTO rank_times (run_id, rank, seconds) VALUES (?, ?, ?)',
+                     [(run_id, r, t) for r, t in enumerate(run.get('rank_times') or [])])
+    return run_id
+
+
+def now():
+    """
+    Current UTC time as an ISO 8601 timestamp, the format of recorded_at.
+    """
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+# ---------------------------------------------------------------------------
+# Metadata detection
+# ---------------------------------------------------------------------------
+
+def detect_git_rev(cwd=None):
+    """
+    Short revision of the working tree, suffixed with '-dirty' if it has local changes.
+    """
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=cwd,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=cwd,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return rev + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def detect_compiler(makefile='Makefile'):
+    """
+    First line of `$CXX --version`, where CXX comes from the environment or the Makefile.
+    """
+    cxx = os.environ.get('CXX')
+    if not cxx and os.path.exists(makefile):
+        with open(makefile) as f:
+            for line in f:
+                m = re.match(r'^\s*CXX\s*\??=\s*(\S+)', line)
+                if m:
+                    cxx = m.group(1)
+                    break
+    if not cxx:
+        return None
+    try:
+        out = subprocess.run([cxx, '--version'], capture_output=True, text=True, timeout=30).stdout
+        first = out.strip().splitlines()[0] if out.strip() else ''
+        return f'{cxx}: {first}' if first else cxx
+    except (OSError, subprocess.SubprocessError):
+        return cxx
+
+
+def pinning_env(environ=None):
+    """
+    Subset of the environment that controls process/thread placement.
+    """
+    environ = os.environ if environ is None else environ
+    return {k: v for k, v in environ.items() if k.startswith(PINNING_PREFIXES)}
+
+
+# ---------------------------------------------------------------------------
+# Log parsing
+# ---------------------------------------------------------------------------
+
+RE_CONFIG = re.compile(r'(\d+)\s*Processes\s*×\s*(\d+)\s*Threads(?:\s*\(([^)]+)\))?')
+RE_TILE = re.compile(r'tile size:?\s*(\d+)x\d+', re.IGNORECASE)
+RE_PROCS_ONLY = re.compile(r'Running test with (?:tile size \d+x\d+ at )?(\d+) processes')
+RE_HEADER = re.compile(r'Image Size:\s*(\d+),\s*Num Snowmen:\s*(\d+),\s*MPI Processes:\s*(\d+)')
+RE_STAT = re.compile(r'(Max|Min|Avg) Local Computation Time.*?:\s*([-\d.eE+]+)\s*seconds')
+RE_RANK = re.compile(r'^Rank\s+(\d+):\s*([-\d.eE+]+)\s*seconds')
+RE_BUILD = re.compile(r'^(\S+)\s.*-o\s+snowman\S*\s')
+RE_MPI_ENV = re.compile(r'MPI startup\(\):\s*(I_MPI_PIN\w*)=(\S+)')
+RE_OMP_ENV = re.compile(r'^(?:export\s+)?((?:OMP|KMP)_\w+)=(\S+)')
+
+
+def parse_log(text, source=None):
+    """
+    Parse a snowman job log (the *.out files written by the SLURM scripts) into a
+    list of run dicts. Configuration banners echoed by the scripts are tracked as
+    state, so each "Computational Performance Metrics" block is attributed to the
+    most recent tile size / process × thread banner before it.
+    """
+    runs = []
+    compiler = None
+    env = {}
+    tile_size = None
+    threads = None
+    variant = ''
+    current = None
+    in_ranks = False
+
+    def finish():
+        if current is not None and current.get('max_time') is not None:
+            runs.append(current)
+
+    for line in text.splitlines():
+        line = line.rstrip()
+
+        m = RE_BUILD.match(line)
+        if m and compiler is None:
+            compiler = m.group(1)
+            continue
+        m = RE_MPI_ENV.search(line)
+        if m:
+            env[m.group(1)] = m.group(2)
+            continue
+        m = RE_OMP_ENV.match(line)
+        if m:
+            env[m.group(1)] = m.group(2)
+            continue
+
+        m = RE_TILE.search(line)
+        if m:
+            tile_size = int(m.group(1))
+        m = RE_CONFIG.search(line)
+        if m:
+            threads = int(m.group(2))
+            variant = m.group(3) or ''
+        elif RE_PROCS_ONLY.search(line):
+            # the pure-MPI scripts (exercise 2) run one thread per rank
+            threads = 1
+            variant = ''
+
+        if '--- Computational Performance Metrics ---' in line:
+            finish()
+            current = {
+                'source': source, 'compiler': compiler, 'env': dict(env),
+                'tile_size': tile_size, 'threads': threads, 'variant': variant,
+                'max_time': None, 'rank_times': [],
+            }
+            in_ranks = False
+            continue
+        if current is None:
+            continue
+
+        m = RE_HEADER.search(line)
+        if m:
+            current['image_size'] = int(m.group(1))
+            current['num_snowmen'] = int(m.group(2))
+            current['procs'] = int(m.group(3))
+            continue
+        m = RE_STAT.search(line)
+        if m:
+            current[m.group(1).lower() + '_time'] = float(m.group(2))
+            continue
+        if '--- Per-Rank Computation Time ---' in line:
+            in_ranks = True
+            continue
+        m = RE_RANK.match(line)
+        if in_ranks and m:
+            current['rank_times'].append(float(m.group(2)))
+            continue
+
+    finish()
+    return runs
+
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+def _betacf(a, b, x, max_iter=200, eps=3e-14):
+    # Continued fraction for the regularized incomplete beta function (Numerical Recipes)
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > 1e-300 else 1e-300)
+    h = d
+    for m in range(1, max_iter + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > 1e-300 else 1e-300)
+        c = 1.0 + aa / c
+        c = c if abs(c) > 1e-300 else 1e-300
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > 1e-300 else 1e-300)
+        c = 1.0 + aa / c
+        c = c if abs(c) > 1e-300 else 1e-300
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < eps:
+            break
+    return h
+
+
+def _betainc(a, b, x):
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    lbeta = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+    front = math.exp(lbeta + a * math.log(x) + b * math.log(1.0 - x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def t_cdf(t, df):
+    """
+    CDF of Student's t distribution.
+    """
+    x = df / (df + t * t)
+    tail = 0.5 * _betainc(df / 2.0, 0.5, x)
+    return 1.0 - tail if t >= 0 else tail
+
+
+def t_critical(confidence, df):
+    """
+    Two-sided critical value t* with P(|T| < t*) = confidence, found by bisection.
+    """
+    target = 0.5 + confidence / 2.0
+    lo, hi = 0.0, 1e3
+    for _ in range(200):
+        mid = 0.5 * (lo + hi)
+        if t_cdf(mid, df) < target:
+            lo = mid
+        else:
+            hi = mid
+    return 0.5 * (lo + hi)
+
+
+def mean_ci(values, confidence=0.95):
+    """
+    (mean, half_width) of the t confidence interval; half_width is None for n < 2.
+    """
+    n = len(values)
+    mean = statistics.fmean(values)
+    if n < 2:
+        return mean, None
+    sem = statistics.stdev(values) / math.sqrt(n)
+    return mean, t_critical(confidence, n - 1) * sem
+
+
+def welch_diff_ci(base, head, confidence=0.95):
+    """
+    Confidence interval of mean(head) - mean(base) using Welch's approximation.
+    Returns (diff, lo, hi) or None if either side has fewer than two samples.
+    """
+    if len(base) < 2 or len(head) < 2:
+        return None
+    vb = statistics.variance(base) / len(base)
+    vh = statistics.variance(head) / len(head)
+    diff = statistics.fmean(head) - statistics.fmean(base)
+    se = math.sqrt(vb + vh)
+    if se == 0.0:
+        return diff, diff, diff
+    df = (vb + vh) ** 2 / (vb ** 2 / (len(base) - 1) + vh ** 2 / (len(head) - 1))
+    half = t_critical(confidence, df) * se
+    return diff, diff - half, diff + half
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+def where_clause(filters):
+    """
+    (' WHERE ...', params) matching runs to `filters` ({column: value}); None
+    values are ignored and git_rev matches by prefix.
+    """
+    clauses, params = [], []
+    for column, value in filters.items():
+        if value is None:
+            continue
+        if column == 'git_rev':
+            clauses.append('git_rev LIKE ?')
+            params.append(value + '%')
+        else:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def grouped_times(conn, filters, group_by):
+    """
+    {group_key_tuple: [max_time, ...]} for all runs matching filters.
+    """
+    where, params = where_clause(filters)
+    rows = conn.execute(f"SELECT {', '.join(group_by)}, max_time FROM runs{where}", params)
+    groups = {}
+    for row in rows:
+        key = tuple(row[c] for c in group_by)
+        groups.setdefault(key, []).append(row['max_time'])
+    return groups
+
+
+def best_tile(conn, procs, threads, confidence=0.95, **filters):
+    """
+    Rank tile sizes for a processes × threads configuration by mean max time,
+    separately per variant. Returns a list of (tile_size, variant, n, mean,
+    ci_half_width), fastest first.
+    """
+    filters.update(procs=procs, threads=threads)
+    groups = grouped_times(conn, filters, ('tile_size', 'variant'))
+    ranking = []
+    for (tile_size, variant), times in groups.items():
+        if tile_size is None:
+            continue
+        mean, half = mean_ci(times, confidence)
+        ranking.append((tile_size, variant, len(times), mean, half))
+    ranking.sort(key=lambda r: r[3])
+    return ranking
+
+
+def resolve_rev(conn, rev):
+    """
+    Map a user-supplied revision (prefix, HEAD, branch) to the stored git_rev values.
+    """
+    if rev and not re.fullmatch(r'[0-9a-f]{4,40}(-dirty)?', rev):
+        resolved = detect_rev_name(rev)
+        rev = resolved or rev
+    rows = conn.execute('SELECT DISTINCT git_rev FROM runs WHERE git_rev LIKE ?', (rev + '%',))
+    return [r['git_rev'] for r in rows]
+
+
+def detect_rev_name(name):
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', name], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_revisions(conn, base, head, confidence=0.95, threshold=0.0):
+    """
+    Compare every configuration measured at both revisions.
+
+    A configuration is a regression if the whole confidence interval of
+    mean(head) - mean(base) lies above `threshold` × mean(base), an improvement
+    if it lies below the negated threshold. Returns a list of result dicts.
+    """
+    results = []
+    by_rev = {}
+    for label, rev in (('base', base), ('head', head)):
+        revs = resolve_rev(conn, rev)
+        if not revs:
+            raise SystemExit(f'No runs recorded for revision {rev!r}')
+        times = {}
+        for r in revs:
+            for key, vals in grouped_times(conn, {'git_rev': r}, CONFIG_COLUMNS).items():
+                times.setdefault(key, []).extend(vals)
+        by_rev[label] = times
+
+    for key in sorted(set(by_rev['base']) & set(by_rev['head']), key=lambda k: tuple(str(v) for v in k)):
+        b, h = by_rev['base'][key], by_rev['head'][key]
+        entry = dict(zip(CONFIG_COLUMNS, key))
+        entry.update(n_base=len(b), n_head=len(h),
+                     mean_base=statistics.fmean(b), mean_head=statistics.fmean(h))
+        ci = welch_diff_ci(b, h, confidence)
+        if ci is None:
+            entry['status'] = 'insufficient repeats'
+        else:
+            diff, lo, hi = ci
+            margin = threshold * entry['mean_base']
+            entry.update(diff=diff, lo=lo, hi=hi)
+            if lo > margin:
+                entry['status'] = 'REGRESSION'
+            elif hi < -margin:
+                entry['status'] = 'improvement'
+            else:
+                entry['status'] = 'no significant change'
+        results.append(entry)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def _config_label(entry):
+    threads = entry['threads'] if entry['threads'] is not None else '?'
+    tile = entry['tile_size'] if entry['tile_size'] is not None else '-'
+    label = f"{entry['procs']}p×{threads}t tile {tile} img {entry['image_size']} sm {entry['num_snowmen']}"
+    if entry.get('variant'):
+        label += f" [{entry['variant']}]"
+    return label
+
+
+def load_runs(path, variant=None):
+    """
+    Runs from a metrics NDJSON file or, for older binaries, a job log.
+    `variant` labels a code variant; metrics runs add their settings to it.
+    """
+    source = os.path.basename(path)
+    if path.endswith(('.json', '.ndjson', '.jsonl')):
+        return [snowman_metrics.to_run(r, source=source, label=variant or '')
+                for r in snowman_metrics.load_records(path)]
+    with open(path, errors='replace') as f:
+        runs = parse_log(f.read(), source=source)
+    for run in runs:
+        run['variant'] = variant or run['variant']
+    return runs
+
+
+def cmd_ingest(args):
+    conn = connect(args.db)
+    total = 0
+    with conn:
+        for path in args.logs:
+            runs = load_runs(path, args.variant)
+            for run in runs:
+                run['git_rev'] = args.git_rev or run.get('git_rev')
+                run['compiler'] = args.compiler or run.get('compiler')
+                run['host'] = args.host or run.get('host')
+                insert_run(conn, run)
+            print(f'{path}: {len(runs)} runs')
+            total += len(runs)
+    print(f'Ingested {total} runs into {args.db}')
+
+
+def cmd_record(args):
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        raise SystemExit('record: no command given')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics_path = os.path.join(tmp, 'metrics.ndjson')
+        env = dict(os.environ, SNOWMAN_METRICS_JSON=metrics_path)
+        t0 = time.perf_counter()
+        proc = subprocess.run(command, capture_output=True, text=True, env=env)
+        wall = time.perf_counter() - t0
+        sys.stdout.write(proc.stdout)
+        sys.stderr.write(proc.stderr)
+        if proc.returncode != 0:
+            raise SystemExit(f'record: command failed with exit code {proc.returncode}; nothing stored')
+        records = snowman_metrics.load_records(metrics_path) if os.path.exists(metrics_path) else []
+
+    source = shlex.join(command)
+    if records:
+        runs = [snowman_metrics.to_run(r, source=source, label=args.variant or '') for r in records]
+    else:
+        # binary without --metrics-json support
+        runs = parse_log(proc.stdout, source=source)
+        for run in runs:
+            run.update(git_rev=detect_git_rev(), compiler=detect_compiler(), host=platform.node(),
+                       wall_time=wall, env=pinning_env(), variant=args.variant or '')
+    if len(runs) != 1:
+        raise SystemExit(f'record: expected metrics for one run, found {len(runs)}')
+    run = runs[0]
+    if run.get('threads') is None and 'OMP_NUM_THREADS' in run['env']:
+        run['threads'] = int(run['env']['OMP_NUM_THREADS'])
+    if run.get('tile_size') is None and len(command) >= 1:
+        # positional arguments of snowman: <image_size> <num_snowmen> <tile_size>
+        positional = [a for a in command if re.fullmatch(r'\d+', a)]
+        if len(positional) >= 3:
+            run['tile_size'] = int(positional[-1])
+
+    conn = connect(args.db)
+    with conn:
+        run_id = insert_run(conn, run)
+    print(f'Recorded run {run_id} ({_config_label(run)}: {run["max_time"]:.3f} s) in {args.db}')
+
+
+def cmd_list(args):
+    conn = connect(args.db)
+    where, params = where_clause({'procs': args.procs, 'threads': args.threads,
+                            'tile_size': args.tile_size, 'git_rev': args.git_rev})
+    rows = conn.execute(f'SELECT * FROM runs{where} ORDER BY id', params).fetchall()
+    print(f"{'id':>5}  {'rev':<14} {'configuration':<48} {'max (s)':>10}  source")
+    for row in map(dict, rows):
+        print(f"{row['id']:>5}  {row['git_rev'] or '-':<14} {_config_label(row):<48} "
+              f"{row['max_time']:>10.3f}  {row['source'] or ''}")
+
+
+def cmd_best_tile(args):
+    conn = connect(args.db)
+    ranking = best_tile(conn, args.procs, args.threads, args.confidence,
+                        image_size=args.image_size, num_snowmen=args.snowmen, git_rev=args.git_rev,
+                        variant=args.variant)
+    if not ranking:
+        raise SystemExit(f'No runs for {args.procs}p × {args.threads}t')
+    best_mean = ranking[0][3]
+    print(f'Tile sizes for {args.procs} processes × {args.threads} threads '
+          f'({args.confidence:.0%} confidence intervals):')
+    for tile_size, variant, n, mean, half in ranking:
+        ci = f'± {half:.3f}' if half is not None else '(single run)'
+        tile = f'{tile_size}×{tile_size}' if tile_size is not None else 'unknown'
+        line = f'  {tile:<10} {mean:>10.3f} s {ci:<16} n={n:<3} {mean / best_mean:.2f}x'
+        print(f'{line}  [{variant}]' if variant else line)
+    best = ranking[0]
+    print(f'Best tile size: {best[0]}' + (f' [{best[1]}]' if best[1] else ''))
+
+
+def cmd_compare(args):
+    conn = connect(args.db)
+    results = compare_revisions(conn, args.base, args.head, args.confidence, args.threshold)
+    regressions = 0
+    for entry in results:
+        line = f"{_config_label(entry):<48} {entry['mean_base']:>9.3f} -> {entry['mean_head']:>9.3f} s"
+        if 'lo' in entry:
+            line += f"  Δ {entry['diff']:+.3f} s [{entry['lo']:+.3f}, {entry['hi']:+.3f}]"
+        print(f"{line}  {entry['status']}")
+        regressions += entry['status'] == 'REGRESSION'
+    print(f'{len(results)} configurations compared, {regressions} significant regressions')
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Snowman benchmark results database')
+    parser.add_argument('--db', default=DEFAULT_DB, help=f'database file (default: {DEFAULT_DB})')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('ingest', help='import runs from metrics files or job logs')
+    p.add_argument('logs', nargs='+', metavar='FILE')
+    p.add_argument('--git-rev', default=None, help='revision the logged binary was built from')
+    p.add_argument('--compiler', default=None, help='override the recorded compiler')
+    p.add_argument('--host', default=None)
+    p.add_argument('--variant', default=None, help='label for a code variant (e.g. collapse)')
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser('record', help='run a benchmark command and store its result')
+    p.add_argument('--variant', default=None)
+    p.add_argument('command', nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_record)
+
+    p = sub.add_parser('list', help='list stored runs')
+    p.add_argument('--procs', type=int)
+    p.add_argument('--threads', type=int)
+    p.add_argument('--tile-size', type=int)
+    p.add_argument('--git-rev')
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser('best-tile', help='rank tile sizes for a processes × threads configuration')
+    p.add_argument('--procs', type=int, required=True)
+    p.add_argument('--threads', type=int, required=True)
+    p.add_argument('--image-size', type=int)
+    p.add_argument('--snowmen', type=int)
+    p.add_argument('--git-rev')
+    p.add_argument('--variant', help='only runs of this variant (default: rank every variant)')
+    p.add_argument('--confidence', type=float, default=0.95)
+    p.set_defaults(func=cmd_best_tile)
+
+    p = sub.add_parser('compare', help='flag significant changes between two revisions')
+    p.add_argument('--base', required=True)
+    p.add_argument('--head', required=True)
+    p.add_argument('--confidence', type=float, default=0.95)
+    p.add_argument('--threshold', type=float, default=0.0,
+                   help='ignore changes smaller than this fraction of the base mean')
+    p.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Roofline characterization of the tile renderer.
+
+Combines the machine ceilings of roofline_bench (STREAM triad bandwidth and
+peak multiply-add rate per thread count) with the phase counters of
+`snowman --profile-phases` to place each phase of renderTile on the roofline:
+
+    flake_gen   generating the 75000 snowflakes of a tile (integer RNG bound;
+                shown for completeness, its flops are an estimate)
+    intersect   camera and shadow rays against the BVH, spheres and planes
+    overlay     the camera rays against every snowflake
+
+snowman counts the operations of each phase; OP_COST turns them into flops
+and bytes read from the scene and snowflake arrays. That is the intensity
+seen by the core (all loads), not DRAM traffic: the snowflakes of a tile
+(1.8 MB) are read once per pixel but stay in the caches, so a phase can sit
+above the STREAM roof. Achieved rates are per phase over all rendering
+threads (phase thread-seconds divided by the threads that share them).
+
+Usage:
+    make roofline_bench snowman
+    mpirun -np 2 ./snowman 512 4 32 --profile-phases --metrics-json roof.ndjson
+    ./roofline.py roof.ndjson --bench ./roofline_bench --threads 1,2,4 --plot roofline.png
+    ./roofline_bench --threads 1,2,4 > ceilings.ndjson
+    ./roofline.py roof.ndjson --ceilings ceilings.ndjson
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+import snowman_metrics
+
+# flops and bytes read per counted operation (double precision, see raytracer.cpp)
+OP_COST = {
+    'flakes_generated': (20, 24),   # two normal and one uniform draw, clamping; writes a Vec3
+    'box_tests': (12, 56),          # enter_box: (bmin/bmax - o) * inv per axis; one BVHNode
+    'sphere_tests': (30, 40),       # intersect_sphere up to the discriminant and roots; one Sphere
+    'plane_tests': (14, 56),        # intersect_plane; one Plane
+    'flake_tests': (8, 24),         # to_flake and its projection on the ray; one Vec3
+    'flakes_near': (14, 0),         # closest point on the ray and squared distance
+}
+
+PHASES = {
+    'flake_gen': ('flakes_generated',),
+    'intersect': ('box_tests', 'sphere_tests', 'plane_tests'),
+    'overlay': ('flake_tests', 'flakes_near'),
+}
+
+
+def load_ceilings(lines):
+    """Ceilings by thread count from roofline_bench output (one JSON object per line)."""
+    ceilings = {}
+    for line in lines:
+        line = line.strip()
+        if line.startswith('{'):
+            c = json.loads(line)
+            ceilings[c['threads']] = c
+    return ceilings
+
+
+def run_bench(bench, threads, n=None):
+    cmd = [bench, '--threads', threads]
+    if n:
+        cmd += ['--n', str(n)]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return load_ceilings(out.splitlines())
+
+
+def rendering_threads(config):
+    """Threads rendering tiles concurrently: rank 0 only coordinates when there are workers."""
+    workers = config['procs'] - 1 if config['procs'] > 1 else 1
+    return workers * config['threads']
+
+
+def phase_points(record):
+    """Per phase: flops, bytes, intensity and achieved GFLOP/s of one profiled run."""
+    stats = record.get('stats', {})
+    if 'phase_time_intersect' not in stats:
+        return None
+    threads = rendering_threads(record['config'])
+    points = {}
+    for phase, ops in PHASES.items():
+        flops = sum(stats.get('ops_' + op, 0) * OP_COST[op][0] for op in ops)
+        nbytes = sum(stats.get('ops_' + op, 0) * OP_COST[op][1] for op in ops)
+        thread_seconds = stats['phase_time_' + phase]
+        if flops == 0 or nbytes == 0 or thread_seconds <= 0:
+            continue
+        points[phase] = {
+            'flops': flops,
+            'bytes': nbytes,
+            'time': thread_seconds / threads,
+            'intensity': flops / nbytes,
+            'gflops': flops / (thread_seconds / threads) / 1e9,
+        }
+    return points
+
+
+def ceiling_for(ceilings, threads):
+    """Ceiling measured at the thread count closest to `threads`."""
+    return ceilings[min(ceilings, key=lambda t: (abs(t - threads), -t))]
+
+
+def roof(ceiling, intensity):
+    return min(ceiling['peak_gflops'], intensity * ceiling['bandwidth_gbs'])
+
+
+def report(records, ceilings):
+    print(f"{'threads':>7} {'GB/s':>9} {'GFLOP/s':>9} {'ridge':>7}")
+    for t in sorted(ceilings):
+        c = ceilings[t]
+        print(f"{t:>7} {c['bandwidth_gbs']:>9.2f} {c['peak_gflops']:>9.2f} "
+              f"{c['peak_gflops'] / c['bandwidth_gbs']:>7.2f}")
+
+    results = []
+    for record in records:
+        points = phase_points(record)
+        if not points:
+            continue
+        config = record['config']
+        threads = rendering_threads(config)
+        ceiling = ceiling_for(ceilings, threads)
+        ridge = ceiling['peak_gflops'] / ceiling['bandwidth_gbs']
+        total = sum(p['time'] for p in points.values())
+        print(f"\n{config['image_size']}px, {config['num_snowmen']} snowmen, tile {config['tile_size']}, "
+              f"{config['procs']}x{config['threads']} ({threads} rendering threads, "
+              f"ceilings at {ceiling['threads']} threads)")
+        print(f"{'phase':<10} {'time %':>7} {'GFLOP':>9} {'flop/B':>7} {'GFLOP/s':>9} {'roof':>9} "
+              f"{'of roof':>8}  bound")
+        for phase, p in points.items():
+            r = roof(ceiling, p['intensity'])
+            print(f"{phase:<10} {100 * p['time'] / total:>6.1f}% {p['flops'] / 1e9:>9.3f} "
+                  f"{p['intensity']:>7.3f} {p['gflops']:>9.3f} {r:>9.2f} {100 * p['gflops'] / r:>7.1f}%  "
+                  f"{'memory' if p['intensity'] < ridge else 'compute'}")
+        results.append((record, threads, points))
+    return results
+
+
+def plot_roofline(results, ceilings, path):
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    intensities = [p['intensity'] for _, _, points in results for p in points.values()]
+    lo = min(intensities + [0.01]) / 4
+    hi = max(intensities + [max(c['peak_gflops'] / c['bandwidth_gbs'] for c in ceilings.values())]) * 4
+    x = np.logspace(np.log10(lo), np.log10(hi), 200)
+
+    plt.figure(figsize=(8, 5.5))
+    for t in sorted(ceilings):
+        c = ceilings[t]
+        line, = plt.plot(x, np.minimum(c['peak_gflops'], x * c['bandwidth_gbs']), '-',
+                         label=f'{t} thread(s): {c["bandwidth_gbs"]:.1f} GB/s, {c["peak_gflops"]:.1f} GFLOP/s')
+        for record, threads, points in results:
+            if ceiling_for(ceilings, threads)['threads'] != t:
+                continue
+            for phase, p in points.items():
+                plt.plot(p['intensity'], p['gflops'], 'o', color=line.get_color())
+                plt.annotate(phase, (p['intensity'], p['gflops']), textcoords='offset points', xytext=(5, 5),
+                             fontsize=8)
+    plt.xscale('log')
+    plt.yscale('log')
+    plt.xlabel('Arithmetic intensity (flop/byte loaded)')
+    plt.ylabel('GFLOP/s')
+    plt.title('Roofline of the renderTile phases')
+    plt.grid(True, which='both', linestyle='--', linewidth=0.5)
+    plt.legend(fontsize=8)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    print(f'Saved: {path}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Place the renderTile phases on the machine roofline')
+    parser.add_argument('metrics', nargs='+', help='metrics NDJSON of runs with --profile-phases')
+    parser.add_argument('--ceilings', help='roofline_bench output (default: run --bench)')
+    parser.add_argument('--bench', default='./roofline_bench')
+    parser.add_argument('--threads', default='1', help='comma-separated thread counts for --bench')
+    parser.add_argument('--stream-n', type=int, help='STREAM array length for --bench')
+    parser.add_argument('--plot', help='save the roofline plot to this file')
+    args = parser.parse_args(argv)
+
+    if args.ceilings:
+        with open(args.ceilings) as f:
+            ceilings = load_ceilings(f)
+    else:
+        ceilings = run_bench(args.bench, args.threads, args.stream_n)
+    if not ceilings:
+        print('No ceilings measured', file=sys.stderr)
+        return 1
+
+    records = [r for path in args.metrics for r in snowman_metrics.load_records(path)]
+    results = report(records, ceilings)
+    if not results:
+        print('No runs with --profile-phases in the metrics', file=sys.stderr)
+        return 1
+    if args.plot:
+        plot_roofline(results, ceilings, args.plot)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
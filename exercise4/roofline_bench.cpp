@@ -0,0 +1,131 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+/*
+  Machine ceilings for the roofline of the renderer (see roofline.py).
+
+  For each thread count it measures
+    - the memory bandwidth with the STREAM triad of Hands_On/stream.cpp
+      (a = b + s*c, 24 bytes and 2 flops per element), and
+    - the peak double precision rate with independent multiply-add chains
+      held in registers (2 flops per element and iteration, vectorized),
+  and prints one JSON line per thread count:
+
+    {"threads": 4, "bandwidth_gbs": 41.2, "peak_gflops": 153.0}
+
+  Usage: roofline_bench [--threads 1,2,4] [--n <elements>] [--min-time <s>]
+*/
+
+#include <cstdlib>
+#include <iostream>
+#include <sstream>
+#include <string>
+#include <vector>
+#include <omp.h>
+
+namespace {
+
+// Run kernel(niter) with doubling niter until it takes min_time; returns
+// the time and sets niter to the count that took it.
+template <typename Kernel>
+double time_kernel(const Kernel& kernel, double min_time, long& niter) {
+    niter = 1;
+    for (;;) {
+        double start = omp_get_wtime();
+        kernel(niter);
+        double runtime = omp_get_wtime() - start;
+        if (runtime >= min_time) return runtime;
+        niter *= 2;
+    }
+}
+
+double triad_gbs(size_t n, int threads, double min_time) {
+    const double s = 1.00000000001;
+    double* a = (double*) aligned_alloc(64, n * sizeof(double));
+    double* b = (double*) aligned_alloc(64, n * sizeof(double));
+    double* c = (double*) aligned_alloc(64, n * sizeof(double));
+    // first touch by the threads that use the data
+    #pragma omp parallel for num_threads(threads) schedule(static)
+    for (size_t i = 0; i < n; ++i) {
+        a[i] = 0.0;
+        b[i] = 1.0;
+        c[i] = 1.0;
+    }
+
+    long niter;
+    double runtime = time_kernel([&](long iters) {
+        for (long k = 0; k < iters; ++k) {
+            #pragma omp parallel for num_threads(threads) schedule(static)
+            for (size_t i = 0; i < n; ++i) {
+                a[i] = b[i] + s * c[i];
+            }
+            if (a[n / 2] < 0.0) std::cout << a[n / 2] << std::endl;
+        }
+    }, min_time, niter);
+
+    free(a);
+    free(b);
+    free(c);
+    return 3.0 * sizeof(double) * n * niter / (runtime * 1e9);
+}
+
+double peak_gflops(int threads, double min_time) {
+    // enough independent chains per thread to cover the FMA latency of
+    // every vector unit
+    const int chains = 64;
+    long niter;
+    double runtime = time_kernel([&](long iters) {
+        #pragma omp parallel num_threads(threads)
+        {
+            double x[chains];
+            for (int j = 0; j < chains; ++j) x[j] = 1.0 + j * 1e-3;
+            const double a = 0.999999, b = 1e-7;
+            for (long k = 0; k < iters; ++k) {
+                #pragma omp simd
+                for (int j = 0; j < chains; ++j) x[j] = x[j] * a + b;
+            }
+            double sum = 0.0;
+            for (int j = 0; j < chains; ++j) sum += x[j];
+            if (sum < 0.0) std::cout << sum << std::endl;
+        }
+    }, min_time, niter);
+    return 2.0 * chains * threads * (double)niter / (runtime * 1e9);
+}
+
+} // namespace
+
+int main(int argc, char** argv) {
+    std::vector<int> thread_counts;
+    size_t n = 1 << 25;   // 3 arrays of 256 MiB, well beyond the caches
+    double min_time = 0.5;
+
+    for (int i = 1; i < argc; ++i) {
+        std::string arg = argv[i];
+        if (i + 1 >= argc) {
+            std::cerr << "Usage: " << argv[0] << " [--threads 1,2,4] [--n <elements>] [--min-time <s>]\n";
+            return 1;
+        }
+        std::string value = argv[++i];
+        if (arg == "--threads") {
+            std::stringstream list(value);
+            std::string item;
+            while (std::getline(list, item, ',')) thread_counts.push_back(std::stoi(item));
+        } else if (arg == "--n") {
+            n = std::stoull(value);
+        } else if (arg == "--min-time") {
+            min_time = std::stod(value);
+        } else {
+            std::cerr << "unknown option " << arg << "\n";
+            return 1;
+        }
+    }
+    if (thread_counts.empty()) thread_counts.push_back(omp_get_max_threads());
+
+    for (int threads : thread_counts) {
+        double bandwidth = triad_gbs(n, threads, min_time);
+        double peak = peak_gflops(threads, min_time);
+        std::cout << "{\"threads\": " << threads << ", \"bandwidth_gbs\": " << bandwidth
+                  << ", \"peak_gflops\": " << peak << "}" << std::endl;
+    }
+    return 0;
+}
@@ -0,0 +1,23 @@
+#!/bin/bash
+#SBATCH --job-name=snowman_sweep
+#SBATCH --account=tmp_hpca_workshop
+#SBATCH --nodes=1
+#SBATCH --ntasks-per-node=96
+#SBATCH --output=sweep_%j.out
+#SBATCH --error=sweep_%j.err
+#SBATCH --time=01:00:00
+#SBATCH --partition=intelsr_devel
+#SBATCH --exclusive
+
+# Usage: sbatch run_sweep.sh sweeps/tile_sizes_dynamic.toml [orchestrate.py options]
+# Resubmitting with the same spec resumes an interrupted sweep.
+
+unset SLURM_EXPORT_ENV
+
+module load intel-compilers/2023.2.1
+module load  impi/2021.10.0-intel-compilers-2023.2.1
+
+spec=${1:?usage: sbatch run_sweep.sh <spec.toml> [options]}
+shift
+
+python3 orchestrate.py "$spec" --launcher srun "$@"
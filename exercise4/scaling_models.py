@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Scaling-model fitting for snowman timing data.
+
+- Amdahl: T(p) = T1 * (s + (1 - s) / p), serial fraction s by least squares
+- Gustafson: S(p) = p - s * (p - 1) for weak-scaling speedups
+- Karp-Flatt: experimentally determined serial fraction e(p) per process count
+- Communication-aware: T(p) = a + b/p + c*log(p) + d*p with a, b, c, d >= 0,
+  with bootstrap confidence intervals for the coefficients, the optimal
+  process count and the point from which adding ranks no longer pays off
+
+All fits are vectorized over the bootstrap resamples (weighted normal
+equations solved in one batch per active set).
+
+Usage:
+    ./scaling_models.py times.txt                 # two columns: processes  max_time
+    ./scaling_models.py results/sweeps/strong_scaling/metrics/*.ndjson
+    ./scaling_models.py --db results/benchmarks.sqlite --threads 1 --image-size 1024 --snowmen 4
+    ./scaling_models.py --db results/benchmarks.sqlite --threads 4 --tile-size 64 --image-size 1024 --snowmen 4
+"""
+
+import argparse
+import itertools
+import sys
+
+import numpy as np
+
+COMM_TERMS = ('a', 'b/p', 'c*log(p)', 'd*p')
+
+
+# ---------------------------------------------------------------------------
+# Closed-form laws
+# ---------------------------------------------------------------------------
+
+def amdahl_speedup(p, s):
+    p = np.asarray(p, dtype=float)
+    return 1.0 / (s + (1.0 - s) / p)
+
+
+def gustafson_speedup(p, s):
+    p = np.asarray(p, dtype=float)
+    return p - s * (p - 1.0)
+
+
+def karp_flatt(p, speedup):
+    """
+    Experimentally determined serial fraction e = (1/S - 1/p) / (1 - 1/p), for p > 1.
+    """
+    p = np.asarray(p, dtype=float)
+    speedup = np.asarray(speedup, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        e = (1.0 / speedup - 1.0 / p) / (1.0 - 1.0 / p)
+    return np.where(p > 1, e, np.nan)
+
+
+# ---------------------------------------------------------------------------
+# Fits
+# ---------------------------------------------------------------------------
+
+def fit_amdahl(p, times):
+    """
+    Least-squares fit of T(p) = a + b/p, i.e. T1 = a + b and s = a / (a + b).
+    Returns (s, T1).
+    """
+    p = np.asarray(p, dtype=float)
+    times = np.asarray(times, dtype=float)
+    X = np.column_stack([np.ones_like(p), 1.0 / p])
+    coef = nnls_small(X, times)
+    t1 = coef.sum()
+    return coef[0] / t1, t1
+
+
+def fit_gustafson(p, speedup):
+    """
+    Least-squares serial fraction of the scaled speedup S(p) = p - s (p - 1).
+    """
+    p = np.asarray(p, dtype=float)
+    speedup = np.asarray(speedup, dtype=float)
+    x = p - 1.0
+    return float(np.clip(np.sum((p - speedup) * x) / np.sum(x * x), 0.0, 1.0))
+
+
+def comm_design(p):
+    p = np.asarray(p, dtype=float)
+    return np.column_stack([np.ones_like(p), 1.0 / p, np.log(p), p])
+
+
+def nnls_small(X, y, weights=None):
+    """
+    Non-negative least squares for a handful of columns, solved exactly by
+    enumerating active sets. `weights` of shape (B, n) fits B weighted problems
+    at once (used for the bootstrap); returns coefficients of shape (k,) or (B, k).
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    single = weights is None
+    W = np.ones((1, len(y))) if single else np.asarray(weights, dtype=float)
+    B, k = W.shape[0], X.shape[1]
+
+    XtWX = np.einsum('bn,ni,nj->bij', W, X, X)
+    XtWy = np.einsum('bn,ni,n->bi', W, X, y)
+    yWy = np.einsum('bn,n->b', W, y * y)
+
+    best = np.zeros((B, k))
+    best_rss = np.full(B, np.inf)
+    for size in range(1, k + 1):
+        for subset in itertools.combinations(range(k), size):
+            idx = np.array(subset)
+            A = XtWX[:, idx[:, None], idx[None, :]]
+            rhs = XtWy[:, idx]
+            # tiny ridge keeps rank-deficient resamples (duplicated points) solvable
+            A = A + 1e-12 * np.trace(A, axis1=1, axis2=2)[:, None, None] * np.eye(size)
+            c = np.linalg.solve(A, rhs[..., None])[..., 0]
+            rss = yWy - 2.0 * np.einsum('bi,bi->b', c, rhs) + np.einsum('bi,bij,bj->b', c, A, c)
+            ok = np.all(c >= 0.0, axis=1) & (rss < best_rss)
+            if np.any(ok):
+                full = np.zeros((B, k))
+                full[:, idx] = c
+                best[ok] = full[ok]
+                best_rss[ok] = rss[ok]
+    return best[0] if single else best
+
+
+def predict_comm(coef, p):
+    return comm_design(p) @ np.asarray(coef).T
+
+
+def optimal_procs(coef, p_max):
+    """
+    Process count minimizing the fitted T(p) on 1..p_max (vectorized over coefficient rows).
+    """
+    grid = np.arange(1, p_max + 1)
+    t = predict_comm(coef, grid)
+    return grid[np.argmin(t, axis=0)]
+
+
+def diminishing_returns(coef, p_max, min_gain=0.01):
+    """
+    First p at which adding one more rank saves less than `min_gain` of T(p).
+    Equals the optimum if the curve turns up before gains fall below the threshold.
+    """
+    grid = np.arange(1, p_max + 1)
+    t = np.atleast_2d(predict_comm(coef, grid).T)
+    # a resample can fit all-zero coefficients, i.e. T(p) = 0; no gain there
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gain = np.where(t[:, :-1] > 0, (t[:, :-1] - t[:, 1:]) / t[:, :-1], 0.0)
+    below = gain < min_gain
+    first = np.where(below.any(axis=1), below.argmax(axis=1), p_max - 1)
+    result = grid[first]
+    return result[0] if np.ndim(coef) == 1 else result
+
+
+def fit_comm_model(p, times, n_boot=2000, confidence=0.95, p_max=None, min_gain=0.01, seed=0):
+    """
+    Fit T(p) = a + b/p + c log p + d p (non-negative coefficients) and bootstrap
+    (resampling measurement points) the coefficients, optimal p and the
+    diminishing-returns point. Returns a dict of estimates and (lo, hi) intervals.
+    """
+    p = np.asarray(p, dtype=float)
+    times = np.asarray(times, dtype=float)
+    p_max = int(p_max or 2 * p.max())
+    X = comm_design(p)
+
+    coef = nnls_small(X, times)
+    rng = np.random.default_rng(seed)
+    counts = rng.multinomial(len(p), np.full(len(p), 1.0 / len(p)), size=n_boot)
+    boot = nnls_small(X, times, weights=counts)
+
+    alpha = (1.0 - confidence) / 2.0
+    q = [alpha * 100, (1 - alpha) * 100]
+    p_opt_boot = optimal_procs(boot, p_max)
+    p_dim_boot = diminishing_returns(boot, p_max, min_gain)
+    residual = times - X @ coef
+    return {
+        'coef': coef,
+        'coef_ci': np.percentile(boot, q, axis=0).T,
+        'p_opt': int(optimal_procs(coef, p_max)),
+        'p_opt_ci': tuple(int(v) for v in np.percentile(p_opt_boot, q)),
+        'p_diminishing': int(diminishing_returns(coef, p_max, min_gain)),
+        'p_diminishing_ci': tuple(int(v) for v in np.percentile(p_dim_boot, q)),
+        'rmse': float(np.sqrt(np.mean(residual ** 2))),
+        'p_max': p_max,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Data loading
+# ---------------------------------------------------------------------------
+
+def aggregate(p, times, how='min'):
+    """
+    Collapse repeated measurements per process count (min is robust to stragglers).
+    """
+    p = np.asarray(p, dtype=float)
+    times = np.asarray(times, dtype=float)
+    uniq = np.unique(p)
+    reducer = {'min': np.min, 'median': np.median, 'mean': np.mean}[how]
+    return uniq, np.array([reducer(times[p == u]) for u in uniq])
+
+
+CURVE_KEYS = ('threads', 'tile_size', 'image_size', 'num_snowmen')
+
+
+def _matches(config, filters):
+    """
+    Whether a record's config passes `filters`, with the same rules as results_db.where_clause.
+    """
+    for key, value in filters.items():
+        if value is None:
+            continue
+        if key == 'git_rev' and not config['git_rev'].startswith(value):
+            return False
+        if key != 'git_rev' and config.get(key) != value:
+            return False
+    return True
+
+
+def load_points(paths, db=None, filters=None):
+    """
+    (procs, max_time) arrays from text files, metrics NDJSON files or the
+    results database, restricted to `filters` ({column: value}). Runs of
+    different thread counts, tile sizes or problem sizes are not one scaling
+    curve, so they are refused rather than aggregated together.
+    """
+    filters = filters or {}
+    procs, times, configs = [], [], set()
+    if db:
+        import results_db
+        conn = results_db.connect(db)
+        where, params = results_db.where_clause(filters)
+        for row in conn.execute(f"SELECT procs, {', '.join(CURVE_KEYS)}, max_time FROM runs{where}", params):
+            procs.append(row['procs'])
+            times.append(row['max_time'])
+            configs.add(tuple(row[k] for k in CURVE_KEYS))
+    for path in paths:
+        if path.endswith(('.json', '.ndjson', '.jsonl')):
+            import snowman_metrics
+            for record in snowman_metrics.load_records(path):
+                config = dict(record['config'], git_rev=record.get('git_rev') or '')
+                if not _matches(config, filters):
+                    continue
+                procs.append(config['procs'])
+                times.append(record['max_time'])
+                configs.add(tuple(config.get(k) for k in CURVE_KEYS))
+        else:
+            data = np.loadtxt(path, ndmin=2)
+            procs.extend(data[:, 0])
+            times.extend(data[:, 1])
+    if len(configs) > 1:
+        found = ', '.join(f'{t} threads/tile {ts}/image {i}/{sm} snowmen' for t, ts, i, sm in sorted(configs, key=str))
+        raise SystemExit(f'runs mix configurations ({found}); select one with '
+                         f'--threads, --tile-size, --image-size and --snowmen')
+    return np.asarray(procs, dtype=float), np.asarray(times, dtype=float)
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def report(p, times, n_boot=2000, confidence=0.95, p_max=None, min_gain=0.01, plot=None):
+    order = np.argsort(p)
+    p, times = p[order], times[order]
+    t1 = times[p == 1][0] if np.any(p == 1) else None
+
+    s, t1_fit = fit_amdahl(p, times)
+    print(f'Amdahl fit:   serial fraction s = {s:.5f}, T1 = {t1_fit:.3f} s '
+          f'(max speedup {1 / s if s > 0 else float("inf"):.1f})')
+
+    if t1 is not None:
+        speedup = t1 / times
+        e = karp_flatt(p, speedup)
+        print('\nKarp-Flatt serial fraction per process count:')
+        print(f"{'p':>6} {'T (s)':>10} {'speedup':>9} {'e(p)':>9}")
+        for pi, ti, si, ei in zip(p, times, speedup, e):
+            print(f'{int(pi):>6} {ti:>10.3f} {si:>9.2f} {ei:>9.4f}' if pi > 1 else
+                  f'{int(pi):>6} {ti:>10.3f} {si:>9.2f} {"-":>9}')
+
+    fit = fit_comm_model(p, times, n_boot, confidence, p_max, min_gain)
+    print(f'\nCommunication-aware model T(p) = a + b/p + c log p + d p '
+          f'({confidence:.0%} bootstrap CIs, {n_boot} resamples, RMSE {fit["rmse"]:.3f} s):')
+    for name, c, (lo, hi) in zip(COMM_TERMS, fit['coef'], fit['coef_ci']):
+        print(f'  {name:<9} {c:12.5g}   [{lo:.5g}, {hi:.5g}]')
+    print(f'Optimal process count:            {fit["p_opt"]}  CI {fit["p_opt_ci"]}  (searched 1..{fit["p_max"]})')
+    print(f'Adding ranks gains < {min_gain:.0%} from:   {fit["p_diminishing"]}  CI {fit["p_diminishing_ci"]}')
+
+    if plot:
+        import matplotlib.pyplot as plt
+        grid = np.arange(1, fit['p_max'] + 1)
+        plt.figure(figsize=(8, 5))
+        plt.plot(p, times, 'o', color='red', label='Measured max time')
+        plt.plot(grid, predict_comm(fit['coef'], grid), '-', color='black',
+                 label='a + b/p + c log p + d p')
+        plt.plot(grid, t1_fit * (s + (1 - s) / grid), '--', color='blue', label=f'Amdahl fit (s={s:.4f})')
+        plt.axvline(fit['p_opt'], color='green', linestyle=':', label=f'Optimum p={fit["p_opt"]}')
+        plt.xlabel('Number of Processes')
+        plt.ylabel('Time (seconds)')
+        plt.yscale('log')
+        plt.grid(True, linestyle='--', linewidth=0.5)
+        plt.legend()
+        plt.tight_layout()
+        plt.savefig(plot, dpi=150)
+        print(f'Saved: {plot}')
+    return fit
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit scaling models to strong-scaling timings')
+    parser.add_argument('inputs', nargs='*', help='"procs time" text files or metrics NDJSON files')
+    parser.add_argument('--db', help='read runs from the results database instead')
+    parser.add_argument('--threads', type=int)
+    parser.add_argument('--tile-size', type=int)
+    parser.add_argument('--image-size', type=int)
+    parser.add_argument('--snowmen', type=int)
+    parser.add_argument('--git-rev')
+    parser.add_argument('--aggregate', choices=('min', 'median', 'mean'), default='min',
+                        help='how repeated runs per process count are combined')
+    parser.add_argument('--bootstrap', type=int, default=2000)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--p-max', type=int, help='largest process count for the prediction')
+    parser.add_argument('--min-gain', type=float, default=0.01,
+                        help='relative time saving below which another rank is not worth it')
+    parser.add_argument('--plot', help='save a plot to this file')
+    args = parser.parse_args(argv)
+
+    if not args.inputs and not args.db:
+        parser.error('give input files or --db')
+    filters = {'threads': args.threads, 'tile_size': args.tile_size,
+               'image_size': args.image_size, 'num_snowmen': args.snowmen, 'git_rev': args.git_rev}
+    p, times = load_points(args.inputs, args.db, filters)
+    p, times = aggregate(p, times, args.aggregate)
+    # the communication-aware model has four coefficients
+    if len(p) < 4:
+        raise SystemExit(f'need at least 4 distinct process counts, got {len(p)}')
+    report(p, times, args.bootstrap, args.confidence, args.p_max, args.min_gain, args.plot)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
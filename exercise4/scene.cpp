@@ -16,15 +16,12 @@
 #include <random>
 #include <algorithm>
 #include <cmath>
+#include <limits>
 
 void Scene::generate_snowmen(int count) {
     spheres.clear();
     planes.clear(); // Clear existing planes too
-
-    // Dimensions
-    double base_radius = 1.2;
-    double body_radius = 0.9;
-    double head_radius = 0.5;
+    instances.clear();
 
     double spacing = 4.0;
     double start_x = -((count - 1) * spacing) / 2.0;
@@ -37,49 +34,228 @@ void Scene::generate_snowmen(int count) {
         double z = -10 + offset_dist(rng);  // Slight Z variation
         double x_offset = offset_dist(rng);
 
-        // Stack: Head (top) → Body → Base
-        double y_head = 3.0;
-        double y_body = y_head - head_radius - body_radius;
-        double y_base = y_body - body_radius - base_radius;
-
-        Vec3 head(x + x_offset, y_head, z);
-        Vec3 body(x + x_offset, y_body, z);
-        Vec3 base(x + x_offset, y_base, z);
-
-        Color snow(245, 245, 255);
-        spheres.emplace_back(base, base_radius, snow);
-        spheres.emplace_back(body, body_radius, snow);
-        spheres.emplace_back(head, head_radius, snow);
-
-        // Nose (carrot)
-        Vec3 nose(head.x, head.y, head.z + head_radius + 0.12);
-        spheres.emplace_back(nose, 0.12, Color(255, 128, 0)); // Larger, more visible
-
-        // Eyes
-        double eye_offset_x = 0.18;
-        double eye_y = head.y + 0.1;
-        double eye_z = head.z + head_radius + 0.1;
-        spheres.emplace_back(Vec3(head.x - eye_offset_x, eye_y, eye_z), 0.1, Color(0, 0, 0));
-        spheres.emplace_back(Vec3(head.x + eye_offset_x, eye_y, eye_z), 0.1, Color(0, 0, 0));
-
-        // Buttons (middle snowball, not base)
-        Color button_color(30, 30, 30);
-        double button_z = body.z + body_radius + 0.1;
-        double button_spacing = 0.25;
-        for (int b = 0; b < 3; ++b) {
-            double by = body.y + 0.3 - b * button_spacing;
-            spheres.emplace_back(Vec3(body.x, by, button_z), 0.12, button_color);
-        }
-
-        // Hat (2 dark spheres)
-        Vec3 hat_base(head.x, head.y + head_radius + 0.05, head.z);
-        Vec3 hat_top(head.x, hat_base.y + 0.2, head.z);
-        spheres.emplace_back(hat_base, 0.3, Color(15, 15, 15)); // brim
-        spheres.emplace_back(hat_top, 0.2, Color(20, 20, 20));  // top
+        add_snowman(x + x_offset, z);
 
         // Ground plane (only once)
         if (i == 0) {
             planes.emplace_back(Vec3(0, 0, 0), Vec3(0, 1, 0), Color(245, 245, 245));
         }
     }
+
+    build_bvh();
+}
+
+void Scene::add_snowman(double x, double z, double scale) {
+    if (instanced) {
+        instances.push_back(Instance{Vec3(x, 0, z), scale});
+        return;
+    }
+
+    // Dimensions
+    double base_radius = 1.2 * scale;
+    double body_radius = 0.9 * scale;
+    double head_radius = 0.5 * scale;
+
+    // Stack: Head (top) → Body → Base
+    double y_head = 3.0 * scale;
+    double y_body = y_head - head_radius - body_radius;
+    double y_base = y_body - body_radius - base_radius;
+
+    Vec3 head(x, y_head, z);
+    Vec3 body(x, y_body, z);
+    Vec3 base(x, y_base, z);
+
+    Color snow(245, 245, 255);
+    spheres.emplace_back(base, base_radius, snow);
+    spheres.emplace_back(body, body_radius, snow);
+    spheres.emplace_back(head, head_radius, snow);
+
+    // Nose (carrot)
+    Vec3 nose(head.x, head.y, head.z + head_radius + 0.12 * scale);
+    spheres.emplace_back(nose, 0.12 * scale, Color(255, 128, 0)); // Larger, more visible
+
+    // Eyes
+    double eye_offset_x = 0.18 * scale;
+    double eye_y = head.y + 0.1 * scale;
+    double eye_z = head.z + head_radius + 0.1 * scale;
+    spheres.emplace_back(Vec3(head.x - eye_offset_x, eye_y, eye_z), 0.1 * scale, Color(0, 0, 0));
+    spheres.emplace_back(Vec3(head.x + eye_offset_x, eye_y, eye_z), 0.1 * scale, Color(0, 0, 0));
+
+    // Buttons (middle snowball, not base)
+    Color button_color(30, 30, 30);
+    double button_z = body.z + body_radius + 0.1 * scale;
+    double button_spacing = 0.25 * scale;
+    for (int b = 0; b < 3; ++b) {
+        double by = body.y + 0.3 * scale - b * button_spacing;
+        spheres.emplace_back(Vec3(body.x, by, button_z), 0.12 * scale, button_color);
+    }
+
+    // Hat (2 dark spheres)
+    Vec3 hat_base(head.x, head.y + head_radius + 0.05 * scale, head.z);
+    Vec3 hat_top(head.x, hat_base.y + 0.2 * scale, head.z);
+    spheres.emplace_back(hat_base, 0.3 * scale, Color(15, 15, 15)); // brim
+    spheres.emplace_back(hat_top, 0.2 * scale, Color(20, 20, 20));  // top
+}
+
+// --- BVH construction ---
+
+namespace {
+
+const int BVH_LEAF_SIZE = 4;
+
+double axis_value(const Vec3& v, int axis) {
+    return axis == 0 ? v.x : (axis == 1 ? v.y : v.z);
+}
+
+// Build the subtree over items[first, first+count); returns its node index.
+// bounds(item, lo, hi) gives an item's box, centroid(item) the point it is
+// sorted by.
+template <typename Item, typename Bounds, typename Centroid>
+int build_node(std::vector<Item>& items, std::vector<BVHNode>& nodes, int first, int count,
+               const Bounds& bounds, const Centroid& centroid) {
+    int index = (int)nodes.size();
+    nodes.push_back(BVHNode());
+
+    BVHNode node;
+    double cmin[3], cmax[3];
+    for (int a = 0; a < 3; ++a) {
+        node.bmin[a] = cmin[a] = std::numeric_limits<double>::max();
+        node.bmax[a] = cmax[a] = -std::numeric_limits<double>::max();
+    }
+    for (int i = first; i < first + count; ++i) {
+        double lo[3], hi[3];
+        bounds(items[i], lo, hi);
+        Vec3 c = centroid(items[i]);
+        for (int a = 0; a < 3; ++a) {
+            node.bmin[a] = std::min(node.bmin[a], lo[a]);
+            node.bmax[a] = std::max(node.bmax[a], hi[a]);
+            cmin[a] = std::min(cmin[a], axis_value(c, a));
+            cmax[a] = std::max(cmax[a], axis_value(c, a));
+        }
+    }
+
+    int axis = 0;
+    for (int a = 1; a < 3; ++a) {
+        if (cmax[a] - cmin[a] > cmax[axis] - cmin[axis]) axis = a;
+    }
+    if (count <= BVH_LEAF_SIZE || cmax[axis] - cmin[axis] <= 0.0) {
+        node.first = first;
+        node.count = count;
+        nodes[index] = node;
+        return index;
+    }
+
+    // object median split along the widest axis of the centroids
+    int half = count / 2;
+    std::nth_element(items.begin() + first, items.begin() + first + half, items.begin() + first + count,
+                     [axis, &centroid](const Item& a, const Item& b) {
+                         return axis_value(centroid(a), axis) < axis_value(centroid(b), axis);
+                     });
+    build_node(items, nodes, first, half, bounds, centroid);
+    node.first = build_node(items, nodes, first + half, count - half, bounds, centroid);
+    node.count = 0;
+    nodes[index] = node;
+    return index;
+}
+
+void sphere_bounds(const Sphere& s, double lo[3], double hi[3]) {
+    for (int a = 0; a < 3; ++a) {
+        double c = axis_value(s.center, a);
+        // pad so that rounding in the hit computation never escapes the box
+        double pad = s.radius * (1.0 + 1e-9) + 1e-9 * (1.0 + std::fabs(c));
+        lo[a] = c - pad;
+        hi[a] = c + pad;
+    }
+}
+
+Vec3 sphere_centroid(const Sphere& s) {
+    return s.center;
+}
+
+void build_sphere_bvh(std::vector<Sphere>& spheres, std::vector<BVHNode>& nodes) {
+    nodes.clear();
+    if (spheres.empty()) return;
+    nodes.reserve(2 * spheres.size() / BVH_LEAF_SIZE + 1);
+    build_node(spheres, nodes, 0, (int)spheres.size(), sphere_bounds, sphere_centroid);
+}
+
+} // namespace
+
+void Scene::build_bvh() {
+    build_sphere_bvh(spheres, bvh);
+
+    template_spheres.clear();
+    template_bvh.clear();
+    instance_bvh.clear();
+    if (instances.empty()) return;
+
+    // the template is the snowman at the origin at scale 1
+    Scene single;
+    single.add_snowman(0.0, 0.0);
+    template_spheres = single.spheres;
+    build_sphere_bvh(template_spheres, template_bvh);
+
+    // instance boxes: the template's root box, scaled and moved (padded again
+    // for the rounding of the transform)
+    const BVHNode root = template_bvh[0];
+    auto instance_bounds = [&root](const Instance& inst, double lo[3], double hi[3]) {
+        for (int a = 0; a < 3; ++a) {
+            double o = axis_value(inst.offset, a);
+            double pad = 1e-9 * (1.0 + std::fabs(o) + inst.scale * (std::fabs(root.bmin[a]) + std::fabs(root.bmax[a])));
+            lo[a] = o + root.bmin[a] * inst.scale - pad;
+            hi[a] = o + root.bmax[a] * inst.scale + pad;
+        }
+    };
+    auto instance_centroid = [](const Instance& inst) { return inst.offset; };
+    instance_bvh.reserve(2 * instances.size() / BVH_LEAF_SIZE + 1);
+    build_node(instances, instance_bvh, 0, (int)instances.size(), instance_bounds, instance_centroid);
+}
+
+SceneView Scene::view() const {
+    SceneView v;
+    v.spheres = spheres.data();
+    v.num_spheres = spheres.size();
+    v.planes = planes.data();
+    v.num_planes = planes.size();
+    v.nodes = bvh.data();
+    v.num_nodes = bvh.size();
+    v.template_spheres = template_spheres.data();
+    v.num_template_spheres = template_spheres.size();
+    v.template_nodes = template_bvh.data();
+    v.num_template_nodes = template_bvh.size();
+    v.instances = instances.data();
+    v.num_instances = instances.size();
+    v.instance_nodes = instance_bvh.data();
+    v.num_instance_nodes = instance_bvh.size();
+    return v;
+}
+
+void scene_arrays(const SceneView& v, SceneArray out[SCENE_ARRAYS]) {
+    out[0] = SceneArray{v.spheres, v.num_spheres, sizeof(Sphere)};
+    out[1] = SceneArray{v.planes, v.num_planes, sizeof(Plane)};
+    out[2] = SceneArray{v.nodes, v.num_nodes, sizeof(BVHNode)};
+    out[3] = SceneArray{v.template_spheres, v.num_template_spheres, sizeof(Sphere)};
+    out[4] = SceneArray{v.template_nodes, v.num_template_nodes, sizeof(BVHNode)};
+    out[5] = SceneArray{v.instances, v.num_instances, sizeof(Instance)};
+    out[6] = SceneArray{v.instance_nodes, v.num_instance_nodes, sizeof(BVHNode)};
+}
+
+SceneView scene_view_at(const char* base, const uint64_t offsets[SCENE_ARRAYS],
+                        const uint64_t counts[SCENE_ARRAYS]) {
+    SceneView v;
+    v.spheres = reinterpret_cast<const Sphere*>(base + offsets[0]);
+    v.num_spheres = counts[0];
+    v.planes = reinterpret_cast<const Plane*>(base + offsets[1]);
+    v.num_planes = counts[1];
+    v.nodes = reinterpret_cast<const BVHNode*>(base + offsets[2]);
+    v.num_nodes = counts[2];
+    v.template_spheres = reinterpret_cast<const Sphere*>(base + offsets[3]);
+    v.num_template_spheres = counts[3];
+    v.template_nodes = reinterpret_cast<const BVHNode*>(base + offsets[4]);
+    v.num_template_nodes = counts[4];
+    v.instances = reinterpret_cast<const Instance*>(base + offsets[5]);
+    v.num_instances = counts[5];
+    v.instance_nodes = reinterpret_cast<const BVHNode*>(base + offsets[6]);
+    v.num_instance_nodes = counts[6];
+    return v;
 }
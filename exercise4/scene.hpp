@@ -5,6 +5,9 @@
 #ifndef SCENE_HPP
 #define SCENE_HPP
 
+#include <cstddef>
+#include <cstdint>
+#include <string>
 #include <vector>
 #include "utils.hpp"
 
@@ -18,14 +21,123 @@ struct Sphere {
         : center(c), radius(r), color(col) {}
 };
 
+// Node of the bounding volume hierarchy over the spheres, stored depth-first:
+// the left child of an inner node directly follows it.
+struct BVHNode {
+    double bmin[3];
+    double bmax[3];
+    int32_t first;   // leaf: index of the first sphere; inner node: index of the right child
+    int32_t count;   // leaf: number of spheres (> 0); inner node: 0
+};
+
+// One placement of the instanced snowman template: template sphere s appears
+// at offset + s.center * scale with radius s.radius * scale.
+struct Instance {
+    Vec3 offset;
+    double scale;
+};
+
+// Read-only view of scene data, owned by a Scene, a mapped cache file or a
+// shared memory window. This is what the ray tracer renders from.
+struct SceneView {
+    const Sphere* spheres = nullptr;
+    size_t num_spheres = 0;
+    const Plane* planes = nullptr;
+    size_t num_planes = 0;
+    const BVHNode* nodes = nullptr;   // empty: spheres are tested linearly
+    size_t num_nodes = 0;
+
+    // Instanced snowmen: the template with its own BVH, and the instances
+    // with a top-level BVH over their bounds.
+    const Sphere* template_spheres = nullptr;
+    size_t num_template_spheres = 0;
+    const BVHNode* template_nodes = nullptr;
+    size_t num_template_nodes = 0;
+    const Instance* instances = nullptr;
+    size_t num_instances = 0;
+    const BVHNode* instance_nodes = nullptr;
+    size_t num_instance_nodes = 0;
+};
+
+// The arrays of a SceneView in a fixed order, for writing a scene to a cache
+// file or an MPI window and pointing a view back at it.
+struct SceneArray {
+    const void* data;
+    size_t count;
+    size_t elem_size;
+};
+const int SCENE_ARRAYS = 7;
+void scene_arrays(const SceneView& v, SceneArray out[SCENE_ARRAYS]);
+SceneView scene_view_at(const char* base, const uint64_t offsets[SCENE_ARRAYS],
+                        const uint64_t counts[SCENE_ARRAYS]);
+
 class Scene {
 public:
     std::vector<Sphere> spheres;
     std::vector<Plane> planes;
+    std::vector<BVHNode> bvh;
+
+    // With `instanced` set, add_snowman() places an instance of one shared
+    // snowman template instead of appending its spheres.
+    bool instanced = false;
+    std::vector<Sphere> template_spheres;
+    std::vector<BVHNode> template_bvh;
+    std::vector<Instance> instances;
+    std::vector<BVHNode> instance_bvh;
 
     // Generate N snowmen evenly spaced in the scene
     void generate_snowmen(int count);
+
+    // Append one snowman standing at (x, z), all dimensions scaled by `scale`
+    void add_snowman(double x, double z, double scale = 1.0);
+
+    // Parse a text scene description (see scene_file.cpp for the format).
+    // Replaces the current contents and builds the BVH.
+    bool load_file(const std::string& path, std::string& error);
+
+    // (Re)build the BVHs; reorders `spheres` and `instances`.
+    void build_bvh();
+
+    SceneView view() const;
 };
 
-#endif
+// Binary scene cache: a header followed by the arrays of scene_arrays()
+// in their in-memory layout, so a cache can be mapped and rendered from
+// without parsing or copying.
+bool write_scene_cache(const std::string& path, const SceneView& scene, uint64_t source_hash,
+                       std::string& error);
+
+// A scene cache file mapped read-only into memory.
+class MappedScene {
+public:
+    MappedScene() = default;
+    MappedScene(const MappedScene&) = delete;
+    MappedScene& operator=(const MappedScene&) = delete;
+    ~MappedScene();
+
+    bool open(const std::string& path, std::string& error);
+    void close();
+    SceneView view() const { return view_; }
+    uint64_t source_hash() const { return source_hash_; }
+    size_t bytes() const { return size_; }
 
+private:
+    void* data_ = nullptr;
+    size_t size_ = 0;
+    uint64_t source_hash_ = 0;
+    SceneView view_;
+};
+
+// True if `path` starts with the scene cache magic (so it can be mapped directly).
+bool is_scene_cache(const std::string& path);
+
+// FNV-1a hash of a scene file's contents, the key that ties a cache to its source.
+bool hash_scene_file(const std::string& path, uint64_t& hash, std::string& error);
+
+// Make sure `cache_path` holds the parsed form of `scene_path`: reuse it if it
+// was built from the same contents and instancing mode, otherwise parse,
+// build the BVH and write it. Sets `rebuilt` if the cache was (re)written.
+bool update_scene_cache(const std::string& scene_path, const std::string& cache_path, bool instanced,
+                        bool& rebuilt, std::string& error);
+
+#endif
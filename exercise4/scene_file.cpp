@@ -0,0 +1,299 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+/*
+  Scene description files and their binary cache.
+
+  Text format, one directive per line, '#' starts a comment:
+
+    sphere  cx cy cz radius r g b
+    plane   px py pz nx ny nz r g b
+    snowman x z [scale]
+    row     count [spacing [z]]          # the layout of generate_snowmen (jitter from mt19937(42))
+    grid    nx nz spacing [cx cz]        # nx*nz snowmen centred at (cx, cz), default (0, -10)
+    forest  count radius [seed [cx cz [min_scale max_scale]]]
+                                         # uniformly in a disc, default seed 1, centre (0, -10)
+
+  e.g. the scene of `snowman 512 4 16` is "row 4" plus "plane 0 0 0 0 1 0 245 245 245".
+
+  The cache stores the arrays of the parsed scene (see scene_arrays()) in
+  their in-memory layout behind a small header, each array 64-byte aligned.
+  It is keyed by a hash of the text file and the instancing mode and mapped
+  read-only by every rank.
+*/
+
+#include "scene.hpp"
+#include <cmath>
+#include <cstdio>
+#include <cstring>
+#include <fstream>
+#include <random>
+#include <sstream>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+namespace {
+
+const char CACHE_MAGIC[8] = {'S', 'N', 'O', 'W', 'S', 'C', 'N', '\0'};
+const uint32_t CACHE_VERSION = 2;
+const uint64_t CACHE_ALIGN = 64;
+
+// the arrays are those of scene_arrays(), in that order
+struct CacheHeader {
+    char magic[8];
+    uint32_t version;
+    uint32_t num_arrays;
+    uint32_t elem_size[SCENE_ARRAYS];
+    uint32_t reserved;
+    uint64_t counts[SCENE_ARRAYS];
+    uint64_t offsets[SCENE_ARRAYS];
+    uint64_t source_hash;
+    uint64_t file_size;
+};
+
+uint64_t align_up(uint64_t n) {
+    return (n + CACHE_ALIGN - 1) / CACHE_ALIGN * CACHE_ALIGN;
+}
+
+void add_row(Scene& scene, int count, double spacing, double z0) {
+    double start_x = -((count - 1) * spacing) / 2.0;
+    std::mt19937 rng(42);
+    std::uniform_real_distribution<double> offset_dist(-0.1, 0.1);
+    for (int i = 0; i < count; ++i) {
+        double x = start_x + i * spacing;
+        double z = z0 + offset_dist(rng);
+        double x_offset = offset_dist(rng);
+        scene.add_snowman(x + x_offset, z);
+    }
+}
+
+void add_grid(Scene& scene, int nx, int nz, double spacing, double cx, double cz) {
+    for (int j = 0; j < nz; ++j) {
+        for (int i = 0; i < nx; ++i) {
+            scene.add_snowman(cx + (i - (nx - 1) / 2.0) * spacing, cz - (j - (nz - 1) / 2.0) * spacing);
+        }
+    }
+}
+
+void add_forest(Scene& scene, int count, double radius, unsigned int seed, double cx, double cz,
+                double min_scale, double max_scale) {
+    std::mt19937 rng(seed);
+    std::uniform_real_distribution<double> unit(0.0, 1.0);
+    for (int i = 0; i < count; ++i) {
+        double r = radius * std::sqrt(unit(rng));
+        double phi = 2.0 * M_PI * unit(rng);
+        double scale = min_scale + (max_scale - min_scale) * unit(rng);
+        scene.add_snowman(cx + r * std::cos(phi), cz + r * std::sin(phi), scale);
+    }
+}
+
+} // namespace
+
+bool Scene::load_file(const std::string& path, std::string& error) {
+    std::ifstream in(path);
+    if (!in) {
+        error = "cannot open scene file " + path;
+        return false;
+    }
+    spheres.clear();
+    planes.clear();
+    instances.clear();
+
+    std::string line;
+    int line_no = 0;
+    while (std::getline(in, line)) {
+        ++line_no;
+        line = line.substr(0, line.find('#'));
+        std::istringstream fields(line);
+        std::string directive;
+        if (!(fields >> directive)) continue;
+
+        std::vector<double> v;
+        double value;
+        while (fields >> value) v.push_back(value);
+        bool trailing = !fields.eof();
+        auto arity = [&](size_t lo, size_t hi) {
+            return !trailing && v.size() >= lo && v.size() <= hi;
+        };
+        auto color = [&](size_t i) {
+            return Color((unsigned char)v[i], (unsigned char)v[i + 1], (unsigned char)v[i + 2]);
+        };
+
+        bool ok = true;
+        if (directive == "sphere" && (ok = arity(7, 7))) {
+            spheres.emplace_back(Vec3(v[0], v[1], v[2]), v[3], color(4));
+        } else if (directive == "plane" && (ok = arity(9, 9))) {
+            planes.emplace_back(Vec3(v[0], v[1], v[2]), Vec3(v[3], v[4], v[5]), color(6));
+        } else if (directive == "snowman" && (ok = arity(2, 3))) {
+            add_snowman(v[0], v[1], v.size() > 2 ? v[2] : 1.0);
+        } else if (directive == "row" && (ok = arity(1, 3))) {
+            add_row(*this, (int)v[0], v.size() > 1 ? v[1] : 4.0, v.size() > 2 ? v[2] : -10.0);
+        } else if (directive == "grid" && (ok = arity(3, 5) && v.size() != 4)) {
+            add_grid(*this, (int)v[0], (int)v[1], v[2], v.size() > 3 ? v[3] : 0.0, v.size() > 3 ? v[4] : -10.0);
+        } else if (directive == "forest" && (ok = arity(2, 7) && v.size() != 4 && v.size() != 6)) {
+            add_forest(*this, (int)v[0], v[1], v.size() > 2 ? (unsigned int)v[2] : 1u,
+                       v.size() > 3 ? v[3] : 0.0, v.size() > 3 ? v[4] : -10.0,
+                       v.size() > 5 ? v[5] : 1.0, v.size() > 5 ? v[6] : 1.0);
+        } else if (ok) {
+            error = path + ":" + std::to_string(line_no) + ": unknown directive '" + directive + "'";
+            return false;
+        }
+        if (!ok) {
+            error = path + ":" + std::to_string(line_no) + ": wrong arguments for '" + directive + "'";
+            return false;
+        }
+    }
+
+    build_bvh();
+    return true;
+}
+
+bool write_scene_cache(const std::string& path, const SceneView& scene, uint64_t source_hash,
+                       std::string& error) {
+    SceneArray arrays[SCENE_ARRAYS];
+    scene_arrays(scene, arrays);
+    CacheHeader h;
+    std::memset(&h, 0, sizeof(h));
+    std::memcpy(h.magic, CACHE_MAGIC, sizeof(h.magic));
+    h.version = CACHE_VERSION;
+    h.num_arrays = SCENE_ARRAYS;
+    uint64_t end = sizeof(CacheHeader);
+    for (int i = 0; i < SCENE_ARRAYS; ++i) {
+        h.elem_size[i] = (uint32_t)arrays[i].elem_size;
+        h.counts[i] = arrays[i].count;
+        h.offsets[i] = align_up(end);
+        end = h.offsets[i] + h.counts[i] * h.elem_size[i];
+    }
+    h.file_size = end;
+    h.source_hash = source_hash;
+
+    // write under a temporary name and rename, so readers never see a partial cache
+    std::string tmp = path + ".tmp." + std::to_string(getpid());
+    {
+        std::ofstream out(tmp, std::ios::binary);
+        if (!out) {
+            error = "cannot write scene cache " + tmp;
+            return false;
+        }
+        out.write(reinterpret_cast<const char*>(&h), sizeof(h));
+        for (int i = 0; i < SCENE_ARRAYS; ++i) {
+            // zero padding up to the aligned offset, then the array
+            while ((uint64_t)out.tellp() < h.offsets[i]) out.put('\0');
+            out.write(static_cast<const char*>(arrays[i].data), (std::streamsize)(h.counts[i] * h.elem_size[i]));
+        }
+        if (!out) {
+            error = "error writing scene cache " + tmp;
+            std::remove(tmp.c_str());
+            return false;
+        }
+    }
+    if (std::rename(tmp.c_str(), path.c_str()) != 0) {
+        error = "cannot rename " + tmp + " to " + path;
+        std::remove(tmp.c_str());
+        return false;
+    }
+    return true;
+}
+
+MappedScene::~MappedScene() {
+    close();
+}
+
+void MappedScene::close() {
+    if (data_) munmap(data_, size_);
+    data_ = nullptr;
+    size_ = 0;
+    view_ = SceneView();
+}
+
+bool MappedScene::open(const std::string& path, std::string& error) {
+    close();
+    int fd = ::open(path.c_str(), O_RDONLY);
+    if (fd < 0) {
+        error = "cannot open scene cache " + path;
+        return false;
+    }
+    struct stat st;
+    if (fstat(fd, &st) != 0 || (size_t)st.st_size < sizeof(CacheHeader)) {
+        ::close(fd);
+        error = path + " is not a scene cache";
+        return false;
+    }
+    void* data = mmap(nullptr, (size_t)st.st_size, PROT_READ, MAP_SHARED, fd, 0);
+    ::close(fd);
+    if (data == MAP_FAILED) {
+        error = "cannot map scene cache " + path;
+        return false;
+    }
+    data_ = data;
+    size_ = (size_t)st.st_size;
+
+    const CacheHeader& h = *static_cast<const CacheHeader*>(data_);
+    SceneArray expected[SCENE_ARRAYS];
+    scene_arrays(SceneView(), expected);
+    bool compatible = h.version == CACHE_VERSION && h.num_arrays == SCENE_ARRAYS;
+    bool in_bounds = h.file_size == size_;
+    for (int i = 0; compatible && i < SCENE_ARRAYS; ++i) {
+        compatible = h.elem_size[i] == expected[i].elem_size;
+        in_bounds = in_bounds && h.offsets[i] % CACHE_ALIGN == 0
+                    && h.offsets[i] + h.counts[i] * h.elem_size[i] <= size_;
+    }
+    if (std::memcmp(h.magic, CACHE_MAGIC, sizeof(h.magic)) != 0) {
+        error = path + " is not a scene cache";
+    } else if (!compatible) {
+        error = path + " was written by an incompatible build";
+    } else if (!in_bounds) {
+        error = path + " is truncated";
+    } else {
+        view_ = scene_view_at(static_cast<const char*>(data_), h.offsets, h.counts);
+        source_hash_ = h.source_hash;
+        return true;
+    }
+    close();
+    return false;
+}
+
+bool is_scene_cache(const std::string& path) {
+    std::ifstream in(path, std::ios::binary);
+    char magic[sizeof(CACHE_MAGIC)] = {};
+    in.read(magic, sizeof(magic));
+    return in && std::memcmp(magic, CACHE_MAGIC, sizeof(magic)) == 0;
+}
+
+bool hash_scene_file(const std::string& path, uint64_t& hash, std::string& error) {
+    std::ifstream in(path, std::ios::binary);
+    if (!in) {
+        error = "cannot open scene file " + path;
+        return false;
+    }
+    std::ostringstream contents;
+    contents << in.rdbuf();
+    std::string data = contents.str();
+    hash = fnv1a64(reinterpret_cast<const unsigned char*>(data.data()), data.size());
+    return true;
+}
+
+bool update_scene_cache(const std::string& scene_path, const std::string& cache_path, bool instanced,
+                        bool& rebuilt, std::string& error) {
+    rebuilt = false;
+    uint64_t hash;
+    if (!hash_scene_file(scene_path, hash, error)) return false;
+    // the same file gives a different cache with instancing
+    unsigned char mode = instanced ? 1 : 0;
+    hash = fnv1a64(&mode, 1, hash);
+
+    {
+        MappedScene cached;
+        std::string ignored;
+        if (cached.open(cache_path, ignored) && cached.source_hash() == hash) return true;
+    }
+
+    Scene scene;
+    scene.instanced = instanced;
+    if (!scene.load_file(scene_path, error)) return false;
+    if (!write_scene_cache(cache_path, scene.view(), hash, error)) return false;
+    rebuilt = true;
+    return true;
+}
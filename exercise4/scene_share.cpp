@@ -0,0 +1,91 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+#include "scene_share.hpp"
+#include <algorithm>
+#include <climits>
+#include <cstdint>
+#include <cstring>
+
+namespace {
+
+const size_t SHARE_ALIGN = 64;
+
+size_t align_up(size_t n) {
+    return (n + SHARE_ALIGN - 1) / SHARE_ALIGN * SHARE_ALIGN;
+}
+
+// MPI_Bcast of more than INT_MAX bytes, in pieces.
+void bcast_bytes(char* data, size_t n, MPI_Comm comm) {
+    const size_t chunk = (size_t)1 << 30;
+    for (size_t off = 0; off < n; off += chunk) {
+        MPI_Bcast(data + off, (int)std::min(chunk, n - off), MPI_BYTE, 0, comm);
+    }
+}
+
+} // namespace
+
+SharedScene::~SharedScene() {
+    int finalized = 0;
+    MPI_Finalized(&finalized);
+    if (!finalized) free();
+}
+
+void SharedScene::share(const SceneView& scene, MPI_Comm comm) {
+    free();
+
+    int rank;
+    MPI_Comm_rank(comm, &rank);
+    SceneArray arrays[SCENE_ARRAYS];
+    scene_arrays(scene, arrays);
+    uint64_t counts[SCENE_ARRAYS];
+    for (int i = 0; i < SCENE_ARRAYS; ++i) counts[i] = arrays[i].count;
+    MPI_Bcast(counts, SCENE_ARRAYS, MPI_UINT64_T, 0, comm);
+
+    // same layout as the scene cache: the arrays 64-byte aligned
+    uint64_t offsets[SCENE_ARRAYS];
+    bytes_ = 0;
+    for (int i = 0; i < SCENE_ARRAYS; ++i) {
+        offsets[i] = align_up(bytes_);
+        bytes_ = offsets[i] + counts[i] * arrays[i].elem_size;
+    }
+
+    // one window per node, allocated by its lowest rank (rank 0 on its node)
+    MPI_Comm_split_type(comm, MPI_COMM_TYPE_SHARED, rank, MPI_INFO_NULL, &node_comm_);
+    int node_rank;
+    MPI_Comm_rank(node_comm_, &node_rank);
+    MPI_Comm_size(node_comm_, &node_ranks_);
+
+    char* base = nullptr;
+    MPI_Win_allocate_shared(node_rank == 0 ? (MPI_Aint)std::max<size_t>(bytes_, 1) : 0, 1, MPI_INFO_NULL,
+                            node_comm_, &base, &win_);
+    MPI_Aint size;
+    int disp_unit;
+    MPI_Win_shared_query(win_, 0, &size, &disp_unit, &base);
+
+    MPI_Win_fence(0, win_);
+    if (rank == 0) {
+        for (int i = 0; i < SCENE_ARRAYS; ++i) {
+            if (counts[i]) std::memcpy(base + offsets[i], arrays[i].data, counts[i] * arrays[i].elem_size);
+        }
+    }
+    // node leaders (keyed by rank, so rank 0 is the root) pass it on
+    MPI_Comm leader_comm;
+    MPI_Comm_split(comm, node_rank == 0 ? 0 : MPI_UNDEFINED, rank, &leader_comm);
+    if (leader_comm != MPI_COMM_NULL) {
+        MPI_Comm_size(leader_comm, &nodes_);
+        bcast_bytes(base, bytes_, leader_comm);
+        MPI_Comm_free(&leader_comm);
+    }
+    MPI_Bcast(&nodes_, 1, MPI_INT, 0, node_comm_);
+    MPI_Win_fence(0, win_);
+
+    view_ = scene_view_at(base, offsets, counts);
+}
+
+void SharedScene::free() {
+    if (win_ != MPI_WIN_NULL) MPI_Win_free(&win_);
+    if (node_comm_ != MPI_COMM_NULL) MPI_Comm_free(&node_comm_);
+    view_ = SceneView();
+    bytes_ = 0;
+}
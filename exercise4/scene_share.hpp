@@ -0,0 +1,44 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+
+#ifndef SCENE_SHARE_HPP
+#define SCENE_SHARE_HPP
+
+#include <mpi.h>
+#include <cstddef>
+#include "scene.hpp"
+
+// Scene data held once per node in an MPI shared-memory window.
+//
+// Rank 0 of `comm` builds the scene (and its BVH); share() copies it into the
+// window of its node and broadcasts it to one leader rank per other node,
+// which receives it directly into its node's window. All ranks then render
+// from the same read-only copy instead of each building their own.
+class SharedScene {
+public:
+    SharedScene() = default;
+    SharedScene(const SharedScene&) = delete;
+    SharedScene& operator=(const SharedScene&) = delete;
+    ~SharedScene();
+
+    // Collective over `comm`; `scene` is only read on rank 0.
+    void share(const SceneView& scene, MPI_Comm comm);
+    // Collective over the node; must be called before MPI_Finalize.
+    void free();
+
+    SceneView view() const { return view_; }
+    size_t bytes() const { return bytes_; }           // window size per node
+    int node_ranks() const { return node_ranks_; }    // ranks sharing it
+    int nodes() const { return nodes_; }
+
+private:
+    MPI_Comm node_comm_ = MPI_COMM_NULL;
+    MPI_Win win_ = MPI_WIN_NULL;
+    size_t bytes_ = 0;
+    int node_ranks_ = 0;
+    int nodes_ = 0;
+    SceneView view_;
+};
+
+#endif
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Reader for the machine-readable metrics written by `snowman --metrics-json`.
+
+Each run appends one JSON line (schema "snowman-metrics/1"):
+
+    {"schema": "snowman-metrics/1", "timestamp": ..., "host": ..., "git_rev": ...,
+     "compiler": ..., "config": {"image_size", "num_snowmen", "tile_size",
+     "procs", "threads", "mode", "schedule", "seed_mode"}, "env": {...pinning vars...},
+     "wall_time": s, "max_time": s, "min_time": s, "avg_time": s,
+     "rank_compute_time": [...], "rank_comm_time": [...], "rank_tiles": [...],
+     "image": {"file", "width", "height", "checksum", "tile_hashes"}, "stats": {...}}
+
+This module is the single place the Python tools (results_db.py,
+orchestrate.py, plotting scripts) read that schema from.
+
+Usage:
+    ./snowman_metrics.py runs.ndjson     # print a one-line summary per run
+"""
+
+import json
+import sys
+
+SCHEMA = 'snowman-metrics/1'
+
+# Settings that change the work a run does; runs differing in them are not
+# repetitions of one configuration, so they become part of its variant
+VARIANT_CONFIG = ('mode', 'schedule', 'seed_mode')
+VARIANT_STATS = ('frames', 'tile_batch', 'aa_samples', 'aa_threshold', 'speculate_factor',
+                 'preview_passes', 'flake_splat', 'wavefront', 'sweep')
+
+
+def load_records(path):
+    """
+    Read all metrics records from an NDJSON file. Lines that are not valid JSON
+    (e.g. cut off by a killed job) are skipped.
+    """
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('schema') != SCHEMA:
+                raise ValueError(f"{path}: unsupported metrics schema {record.get('schema')!r}")
+            records.append(record)
+    return records
+
+
+def append_record(path, record):
+    """
+    Append one record as a JSON line (for Python drivers producing the same schema).
+    """
+    with open(path, 'a') as f:
+        f.write(json.dumps(dict(record, schema=SCHEMA)) + '\n')
+
+
+def fnv1a64(data, h=14695981039346656037):
+    """
+    64-bit FNV-1a of a bytes-like object, same as fnv1a64() in metrics.cpp.
+    """
+    for byte in bytes(data):
+        h = ((h ^ byte) * 1099511628211) & 0xffffffffffffffff
+    return h
+
+
+def run_variant(record, label=''):
+    """
+    Variant of a record: `label` (a code variant) followed by its settings,
+    e.g. "collapse mode=tiles schedule=dynamic,1 seed_mode=rank aa_samples=4".
+    """
+    config, stats = record['config'], record.get('stats', {})
+    parts = [label] if label else []
+    parts += [f'{k}={config[k]}' for k in VARIANT_CONFIG if config.get(k)]
+    parts += [f'{k}={stats[k]:g}' for k in VARIANT_STATS if k in stats]
+    return ' '.join(parts)
+
+
+def to_run(record, source=None, label=''):
+    """
+    Convert a metrics record into the run dict used by results_db.insert_run.
+    """
+    config = record['config']
+    return {
+        'recorded_at': record.get('timestamp'),
+        'source': source,
+        'git_rev': record.get('git_rev'),
+        'compiler': record.get('compiler'),
+        'host': record.get('host'),
+        'image_size': config['image_size'],
+        'num_snowmen': config['num_snowmen'],
+        'tile_size': config['tile_size'],
+        'procs': config['procs'],
+        'threads': config['threads'],
+        'variant': run_variant(record, label),
+        'max_time': record['max_time'],
+        'min_time': record['min_time'],
+        'avg_time': record['avg_time'],
+        'wall_time': record['wall_time'],
+        'rank_times': record['rank_compute_time'],
+        'env': record.get('env', {}),
+        'extra': {
+            'rank_comm_time': record.get('rank_comm_time'),
+            'rank_tiles': record.get('rank_tiles'),
+            'checksum': record.get('image', {}).get('checksum'),
+            'stats': record.get('stats', {}),
+        },
+    }
+
+
+def summary(record):
+    """
+    One-line human readable description of a record.
+    """
+    c = record['config']
+    comm = max(record.get('rank_comm_time') or [0.0])
+    return (f"{c['procs']}p×{c['threads']}t img {c['image_size']} sm {c['num_snowmen']} "
+            f"tile {c['tile_size']}: max {record['max_time']:.3f} s, wall {record['wall_time']:.3f} s, "
+            f"max comm {comm:.3f} s, {record['image']['checksum']}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        for record in load_records(path):
+            print(summary(record))
@@ -0,0 +1,245 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+/*
+  Python bindings for the snowman renderer (CPython C API, no MPI).
+
+  Build with `make python`, then:
+
+      import numpy as np, snowman_py
+      r = snowman_py.Renderer(512, 512, 4)
+      img = np.empty((512, 512, 3), np.uint8)
+      r.render_tile(img[0:64, 64:128], 64, 0, seed)   # renders in place
+
+  render_tile writes straight into any writable uint8 buffer of shape
+  (h, w, 3) whose pixels are packed (strides (*, 3, 1)), e.g. a NumPy array
+  or a slice of one, and releases the GIL while rendering, so Python threads
+  can render disjoint tiles of one framebuffer concurrently.
+*/
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <structmember.h>
+
+#include <atomic>
+#include <cstring>
+#include "raytracer.hpp"
+#include "scene.hpp"
+
+static_assert(sizeof(Color) == 3, "Color must be packed RGB to alias uint8 buffers");
+
+struct RendererObject {
+    PyObject_HEAD
+    int width;
+    int height;
+    Scene* scene;
+    RayTracer* raytracer;
+    std::atomic<int>* active; // renders in progress (scene must not change meanwhile)
+};
+
+static void Renderer_dealloc(RendererObject* self) {
+    delete self->raytracer;
+    delete self->scene;
+    delete self->active;
+    Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+static int Renderer_init(RendererObject* self, PyObject* args, PyObject* kwds) {
+    static const char* kwlist[] = {"width", "height", "num_snowmen", nullptr};
+    int width, height, num_snowmen = 4;
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "ii|i", const_cast<char**>(kwlist),
+                                     &width, &height, &num_snowmen)) {
+        return -1;
+    }
+    if (width <= 0 || height <= 0 || num_snowmen < 0) {
+        PyErr_SetString(PyExc_ValueError, "width and height must be positive, num_snowmen non-negative");
+        return -1;
+    }
+    if (self->active && self->active->load() > 0) {
+        PyErr_SetString(PyExc_RuntimeError, "renderer is busy");
+        return -1;
+    }
+    delete self->raytracer;
+    delete self->scene;
+    if (!self->active) self->active = new std::atomic<int>(0);
+    self->width = width;
+    self->height = height;
+    self->scene = new Scene();
+    self->scene->generate_snowmen(num_snowmen);
+    self->raytracer = new RayTracer(width, height);
+    self->raytracer->set_scene(self->scene);
+    return 0;
+}
+
+static bool check_initialized(RendererObject* self) {
+    if (!self->scene) {
+        PyErr_SetString(PyExc_RuntimeError, "Renderer.__init__ was not called");
+        return false;
+    }
+    return true;
+}
+
+static PyObject* Renderer_generate_snowmen(RendererObject* self, PyObject* args) {
+    if (!check_initialized(self)) return nullptr;
+    int count;
+    if (!PyArg_ParseTuple(args, "i", &count)) return nullptr;
+    if (count < 0) {
+        PyErr_SetString(PyExc_ValueError, "count must be non-negative");
+        return nullptr;
+    }
+    if (self->active->load() > 0) {
+        PyErr_SetString(PyExc_RuntimeError, "cannot change the scene while tiles are rendering");
+        return nullptr;
+    }
+    self->scene->generate_snowmen(count);
+    Py_RETURN_NONE;
+}
+
+// Check that `view` is a writable packed (h, w, 3) uint8 buffer; returns the row pitch in pixels.
+static bool check_tile_buffer(const Py_buffer& view, Py_ssize_t& row_pitch) {
+    if (view.ndim != 3 || view.shape[2] != 3) {
+        PyErr_SetString(PyExc_ValueError, "out must have shape (h, w, 3)");
+        return false;
+    }
+    if (view.itemsize != 1 || (view.format && std::strcmp(view.format, "B") != 0)) {
+        PyErr_SetString(PyExc_TypeError, "out must be a uint8 buffer");
+        return false;
+    }
+    if (view.strides[2] != 1 || view.strides[1] != 3 || view.strides[0] < 0 || view.strides[0] % 3 != 0
+        || (view.shape[0] > 1 && view.strides[0] < 3 * view.shape[1])) {
+        PyErr_SetString(PyExc_ValueError, "out must have packed RGB pixels (strides (k*3, 3, 1))");
+        return false;
+    }
+    row_pitch = view.shape[0] > 1 ? view.strides[0] / 3 : view.shape[1];
+    return true;
+}
+
+static PyObject* Renderer_render_tile(RendererObject* self, PyObject* args, PyObject* kwds) {
+    if (!check_initialized(self)) return nullptr;
+    static const char* kwlist[] = {"out", "x0", "y0", "seed", nullptr};
+    PyObject* out;
+    int x0, y0;
+    unsigned int seed;
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OiiI", const_cast<char**>(kwlist), &out, &x0, &y0, &seed)) {
+        return nullptr;
+    }
+
+    Py_buffer view;
+    if (PyObject_GetBuffer(out, &view, PyBUF_STRIDES | PyBUF_WRITABLE | PyBUF_FORMAT) != 0) return nullptr;
+    Py_ssize_t row_pitch;
+    if (!check_tile_buffer(view, row_pitch)) {
+        PyBuffer_Release(&view);
+        return nullptr;
+    }
+    int h = (int)view.shape[0];
+    int w = (int)view.shape[1];
+    if (x0 < 0 || y0 < 0 || x0 + w > self->width || y0 + h > self->height) {
+        PyBuffer_Release(&view);
+        PyErr_Format(PyExc_ValueError, "tile (%d, %d, %d, %d) outside the %dx%d image",
+                     x0, y0, w, h, self->width, self->height);
+        return nullptr;
+    }
+
+    // the buffer stays exported (and the array alive) until released below
+    Color* pixels = static_cast<Color*>(view.buf);
+    ++*self->active;
+    Py_BEGIN_ALLOW_THREADS
+    self->raytracer->renderTile(x0, y0, w, h, seed, pixels, (std::size_t)row_pitch);
+    Py_END_ALLOW_THREADS
+    --*self->active;
+
+    PyBuffer_Release(&view);
+    Py_RETURN_NONE;
+}
+
+static PyObject* Renderer_render(RendererObject* self, PyObject* args, PyObject* kwds) {
+    static const char* kwlist[] = {"out", nullptr};
+    PyObject* out;
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", const_cast<char**>(kwlist), &out)) return nullptr;
+    if (!check_initialized(self)) return nullptr;
+
+    Py_buffer view;
+    if (PyObject_GetBuffer(out, &view, PyBUF_STRIDES | PyBUF_WRITABLE | PyBUF_FORMAT) != 0) return nullptr;
+    bool full = view.ndim == 3 && view.shape[0] == self->height && view.shape[1] == self->width;
+    PyBuffer_Release(&view);
+    if (!full) {
+        PyErr_Format(PyExc_ValueError, "out must have shape (%d, %d, 3)", self->height, self->width);
+        return nullptr;
+    }
+
+    // the single-process path of main.cpp: render(0, 1) seeds like renderTile with seed 0
+    PyObject* call_args = Py_BuildValue("(Oiii)", out, 0, 0, 0);
+    if (!call_args) return nullptr;
+    PyObject* result = Renderer_render_tile(self, call_args, nullptr);
+    Py_DECREF(call_args);
+    return result;
+}
+
+static PyObject* Renderer_get_num_spheres(RendererObject* self, void*) {
+    if (!check_initialized(self)) return nullptr;
+    return PyLong_FromSize_t(self->scene->spheres.size());
+}
+
+static PyObject* Renderer_get_shape(RendererObject* self, void*) {
+    return Py_BuildValue("(iii)", self->height, self->width, 3);
+}
+
+static PyMethodDef Renderer_methods[] = {
+    {"render_tile", (PyCFunction)(void (*)(void))Renderer_render_tile, METH_VARARGS | METH_KEYWORDS,
+     "render_tile(out, x0, y0, seed)\n\n"
+     "Render the tile at (x0, y0) of size out.shape[:2] in place into out, a\n"
+     "writable uint8 array of shape (h, w, 3). Releases the GIL."},
+    {"render", (PyCFunction)(void (*)(void))Renderer_render, METH_VARARGS | METH_KEYWORDS,
+     "render(out)\n\nRender the whole image like a single-process run into out (height, width, 3)."},
+    {"generate_snowmen", (PyCFunction)Renderer_generate_snowmen, METH_VARARGS,
+     "generate_snowmen(count)\n\nReplace the scene with `count` snowmen."},
+    {nullptr, nullptr, 0, nullptr}
+};
+
+static PyMemberDef Renderer_members[] = {
+    {"width", T_INT, offsetof(RendererObject, width), READONLY, "image width"},
+    {"height", T_INT, offsetof(RendererObject, height), READONLY, "image height"},
+    {nullptr, 0, 0, 0, nullptr}
+};
+
+static PyGetSetDef Renderer_getset[] = {
+    {"num_spheres", (getter)Renderer_get_num_spheres, nullptr, "number of spheres in the scene", nullptr},
+    {"shape", (getter)Renderer_get_shape, nullptr, "(height, width, 3) of the full image", nullptr},
+    {nullptr, nullptr, nullptr, nullptr, nullptr}
+};
+
+static PyTypeObject RendererType = {
+    PyVarObject_HEAD_INIT(nullptr, 0)
+};
+
+static PyModuleDef snowman_module = {
+    PyModuleDef_HEAD_INIT,
+    "snowman_py",
+    "Python bindings for the snowman ray tracer.",
+    -1,
+    nullptr
+};
+
+PyMODINIT_FUNC PyInit_snowman_py(void) {
+    RendererType.tp_name = "snowman_py.Renderer";
+    RendererType.tp_basicsize = sizeof(RendererObject);
+    RendererType.tp_flags = Py_TPFLAGS_DEFAULT;
+    RendererType.tp_doc = "Renderer(width, height, num_snowmen=4): scene and ray tracer for one image size";
+    RendererType.tp_new = PyType_GenericNew;
+    RendererType.tp_init = (initproc)Renderer_init;
+    RendererType.tp_dealloc = (destructor)Renderer_dealloc;
+    RendererType.tp_methods = Renderer_methods;
+    RendererType.tp_members = Renderer_members;
+    RendererType.tp_getset = Renderer_getset;
+    if (PyType_Ready(&RendererType) < 0) return nullptr;
+
+    PyObject* m = PyModule_Create(&snowman_module);
+    if (!m) return nullptr;
+    Py_INCREF(&RendererType);
+    if (PyModule_AddObject(m, "Renderer", (PyObject*)&RendererType) < 0) {
+        Py_DECREF(&RendererType);
+        Py_DECREF(m);
+        return nullptr;
+    }
+    return m;
+}
@@ -0,0 +1,134 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+#include "tile_codec.hpp"
+#include <cstring>
+#ifdef SNOWMAN_HAVE_LZ4
+#include <lz4.h>
+#endif
+
+namespace {
+
+// Pixel runs of `n` RGB pixels appended to `out`.
+void rle_encode(const unsigned char* rgb, size_t n, std::vector<unsigned char>& out) {
+    size_t i = 0;
+    while (i < n) {
+        const unsigned char* p = rgb + 3 * i;
+        size_t run = 1;
+        while (i + run < n && run < 255 && std::memcmp(p, rgb + 3 * (i + run), 3) == 0) ++run;
+        out.insert(out.end(), {(unsigned char)run, p[0], p[1], p[2]});
+        i += run;
+    }
+}
+
+// Runs of `data` back to the w*h pixels of `dest` (rows `pitch` bytes
+// apart); false if they do not add up.
+bool rle_decode(const unsigned char* data, size_t size, int w, int h, unsigned char* dest, size_t pitch) {
+    if (size % 4 != 0) return false;
+    size_t n = (size_t)w * h;
+    size_t i = 0;
+    for (size_t pos = 0; pos < size; pos += 4) {
+        size_t run = data[pos];
+        if (run == 0 || i + run > n) return false;
+        for (size_t k = 0; k < run; ++k, ++i) {
+            std::memcpy(dest + (i / w) * pitch + 3 * (i % w), data + pos + 1, 3);
+        }
+    }
+    return i == n;
+}
+
+} // namespace
+
+bool parse_tile_encoding(const std::string& name, TileEncoding& encoding, std::string& error) {
+    if (name == "raw") {
+        encoding = TileEncoding::RAW;
+    } else if (name == "rle") {
+        encoding = TileEncoding::RLE;
+    } else if (name == "delta") {
+        encoding = TileEncoding::DELTA;
+    } else if (name == "lz4") {
+#ifdef SNOWMAN_HAVE_LZ4
+        encoding = TileEncoding::LZ4;
+#else
+        error = "this build has no LZ4 support (see the Makefile)";
+        return false;
+#endif
+    } else {
+        error = "--tile-encoding must be 'raw', 'rle', 'delta' or 'lz4'";
+        return false;
+    }
+    return true;
+}
+
+void encode_tile(const unsigned char* rgb, int w, int h, TileEncoding encoding, std::vector<unsigned char>& out) {
+    size_t n = (size_t)w * h;
+    size_t raw_size = 3 * n;
+    out.clear();
+    out.push_back((unsigned char)encoding);
+
+    if (encoding == TileEncoding::RLE) {
+        rle_encode(rgb, n, out);
+    } else if (encoding == TileEncoding::DELTA) {
+        std::vector<unsigned char> delta(rgb, rgb + raw_size);
+        size_t row = 3 * (size_t)w;
+        for (size_t i = row; i < raw_size; ++i) delta[i] = (unsigned char)(rgb[i] - rgb[i - row]);
+        rle_encode(delta.data(), n, out);
+#ifdef SNOWMAN_HAVE_LZ4
+    } else if (encoding == TileEncoding::LZ4) {
+        int bound = LZ4_compressBound((int)raw_size);
+        out.resize(1 + bound);
+        int written = LZ4_compress_default(reinterpret_cast<const char*>(rgb), reinterpret_cast<char*>(&out[1]),
+                                           (int)raw_size, bound);
+        out.resize(written > 0 ? 1 + written : out.size());
+#endif
+    }
+
+    if (encoding == TileEncoding::RAW || out.size() >= 1 + raw_size) {
+        out.assign(1, (unsigned char)TileEncoding::RAW);
+        out.insert(out.end(), rgb, rgb + raw_size);
+    }
+}
+
+bool decode_tile(const unsigned char* data, size_t size, int w, int h, unsigned char* dest, size_t dest_pitch,
+                 std::string& error) {
+    size_t row = 3 * (size_t)w;
+    size_t raw_size = row * h;
+    if (size < 1) {
+        error = "empty tile";
+        return false;
+    }
+    TileEncoding encoding = (TileEncoding)data[0];
+    ++data;
+    --size;
+
+    if (encoding == TileEncoding::RAW) {
+        if (size != raw_size) {
+            error = "raw tile of " + std::to_string(size) + " bytes, expected " + std::to_string(raw_size);
+            return false;
+        }
+        for (int y = 0; y < h; ++y) std::memcpy(dest + y * dest_pitch, data + y * row, row);
+        return true;
+    }
+
+    bool ok = false;
+    if (encoding == TileEncoding::RLE || encoding == TileEncoding::DELTA) {
+        ok = rle_decode(data, size, w, h, dest, dest_pitch);
+        for (int y = 1; ok && encoding == TileEncoding::DELTA && y < h; ++y) {
+            unsigned char* p = dest + y * dest_pitch;
+            const unsigned char* above = p - dest_pitch;
+            for (size_t i = 0; i < row; ++i) p[i] = (unsigned char)(p[i] + above[i]);
+        }
+#ifdef SNOWMAN_HAVE_LZ4
+    } else if (encoding == TileEncoding::LZ4) {
+        std::vector<unsigned char> rgb(raw_size);
+        ok = LZ4_decompress_safe(reinterpret_cast<const char*>(data), reinterpret_cast<char*>(rgb.data()),
+                                 (int)size, (int)raw_size) == (int)raw_size;
+        for (int y = 0; ok && y < h; ++y) std::memcpy(dest + y * dest_pitch, rgb.data() + y * row, row);
+#endif
+    } else {
+        error = "unknown tile encoding " + std::to_string((int)encoding);
+        return false;
+    }
+    if (!ok) error = "corrupt tile data";
+    return ok;
+}
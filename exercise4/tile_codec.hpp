@@ -0,0 +1,34 @@
+// This file is distributed under the MIT license.
+// See the LICENSE file for details.
+
+
+#ifndef TILE_CODEC_HPP
+#define TILE_CODEC_HPP
+
+#include <cstddef>
+#include <string>
+#include <vector>
+
+// Encodings of the RGB bytes of a tile sent from a worker to the master.
+// Sky and floor tiles are runs of a few colours and shrink to a fraction.
+enum class TileEncoding : unsigned char {
+    RAW = 0,     // w*h*3 bytes as rendered
+    RLE = 1,     // runs of up to 255 equal pixels: count, r, g, b
+    DELTA = 2,   // each row minus the row above (bytewise, mod 256), then RLE
+    LZ4 = 3,     // LZ4 block compression (only if built with SNOWMAN_HAVE_LZ4)
+};
+
+// "raw", "rle", "delta" or "lz4"; false if unknown or not built in.
+bool parse_tile_encoding(const std::string& name, TileEncoding& encoding, std::string& error);
+
+// Encode the w*h tile `rgb` (rows of w*3 bytes) into `out`: one byte with
+// the encoding used, then the data. Falls back to RAW when `encoding` does
+// not make the tile smaller.
+void encode_tile(const unsigned char* rgb, int w, int h, TileEncoding encoding, std::vector<unsigned char>& out);
+
+// Decode the output of encode_tile into `dest`, whose rows are `dest_pitch`
+// bytes apart (so a tile can be decoded in place into a framebuffer).
+bool decode_tile(const unsigned char* data, size_t size, int w, int h, unsigned char* dest, size_t dest_pitch,
+                 std::string& error);
+
+#endif
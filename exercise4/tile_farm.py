@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Single-node tile farm: the master/worker scheme of main.cpp with a Python
+process pool instead of MPI.
+
+The parent process plays rank 0 and hands out tiles dynamically (one tile per
+worker at a time, the next one when a result comes back). Workers render with
+the C++ binding (snowman_py, `make python`) or the NumPy reference renderer and
+write their tiles directly into a multiprocessing.shared_memory framebuffer,
+so only (tile_id, elapsed) travels back instead of the pixels. Worker i plays
+rank i, so the tile seeds (with --seed-mode tile the whole image) and the
+printed metrics match an MPI run with workers+1 processes and the numbers can
+be compared to quantify the MPI protocol's overhead.
+
+Usage:
+    ./tile_farm.py 512 4 16 --workers 8
+    ./tile_farm.py 256 4 32 --workers 4 --backend numpy --metrics-json runs.ndjson --checksum
+"""
+
+import argparse
+import concurrent.futures
+import importlib.util
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import ppm_io
+import reference_render
+import results_db
+import snowman_metrics
+
+_worker = {}
+
+
+def make_renderer(backend, size, snowmen):
+    """
+    Returns (name, render(out, x0, y0, seed)) for backend 'cpp', 'numpy' or
+    'auto' (the binding if it can be imported).
+    """
+    if backend in ('auto', 'cpp'):
+        try:
+            import snowman_py
+        except ImportError:
+            if backend == 'cpp':
+                raise
+        else:
+            return 'cpp', snowman_py.Renderer(size, size, snowmen).render_tile
+    scene = reference_render.generate_snowmen(snowmen)
+
+    def render(out, x0, y0, seed):
+        h, w = out.shape[:2]
+        out[...] = reference_render.render_tile(scene, size, size, x0, y0, w, h, seed)
+    return 'numpy', render
+
+
+def backend_name(backend):
+    """
+    The backend make_renderer will use, without importing the binding: once
+    loaded, its OpenMP runtime has read OMP_NUM_THREADS and forked workers
+    could no longer set their thread count.
+    """
+    found = importlib.util.find_spec('snowman_py') is not None
+    if backend == 'auto':
+        return 'cpp' if found else 'numpy'
+    if backend == 'cpp' and not found:
+        raise ImportError('snowman_py not found (build it with make python)')
+    return backend
+
+
+def _init_worker(shm_name, size, snowmen, backend, threads, counter, per_tile_seeds):
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    with counter.get_lock():
+        counter.value += 1
+        rank = counter.value
+    # the pool shares the parent's resource tracker, which unlinks the segment once
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker.update(rank=rank, seed_rank=0 if per_tile_seeds else rank, shm=shm,
+                   frame=np.ndarray((size, size, 3), dtype=np.uint8, buffer=shm.buf),
+                   render=make_renderer(backend, size, snowmen)[1])
+
+
+def _render_tile(tile):
+    tile_id, x0, y0, w, h = tile
+    rank = _worker['rank']
+    t0 = time.perf_counter()
+    _worker['render'](_worker['frame'][y0:y0 + h, x0:x0 + w], x0, y0,
+                      reference_render.tile_seed(tile_id, _worker['seed_rank']))
+    return rank, tile_id, time.perf_counter() - t0
+
+
+def make_tiles(size, tile_size):
+    """
+    Tiles in the order of main.cpp: (tile_id, x0, y0, w, h), row-major.
+    """
+    tiles = []
+    for y0 in range(0, size, tile_size):
+        for x0 in range(0, size, tile_size):
+            tiles.append((len(tiles), x0, y0, min(tile_size, size - x0), min(tile_size, size - y0)))
+    return tiles
+
+
+def run_farm(size, snowmen, tile_size, workers, backend='auto', threads=1, seed_mode='rank'):
+    """
+    Render the image with a pool of `workers` processes. Returns (image,
+    per-rank compute times, per-rank tile counts, wall time); index 0 is the
+    master, which renders nothing.
+    """
+    tiles = make_tiles(size, tile_size)
+    compute = [0.0] * (workers + 1)
+    counts = [0] * (workers + 1)
+    shm = shared_memory.SharedMemory(create=True, size=size * size * 3)
+    try:
+        frame = np.ndarray((size, size, 3), dtype=np.uint8, buffer=shm.buf)
+        counter = multiprocessing.Value('i', 0)
+        wall_start = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(shm.name, size, snowmen, backend, threads, counter, seed_mode == 'tile')) as pool:
+            pending = {pool.submit(_render_tile, t) for t in tiles[:workers]}
+            next_tile = len(pending)
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    rank, _, elapsed = future.result()
+                    compute[rank] += elapsed
+                    counts[rank] += 1
+                    if next_tile < len(tiles):
+                        pending.add(pool.submit(_render_tile, tiles[next_tile]))
+                        next_tile += 1
+        wall = time.perf_counter() - wall_start
+        image = frame.copy()
+    finally:
+        frame = None
+        shm.close()
+        shm.unlink()
+    return image, compute, counts, wall
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render snowman with a shared-memory process pool')
+    parser.add_argument('image_size', type=int)
+    parser.add_argument('num_snowmen', type=int)
+    parser.add_argument('tile_size', type=int)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: all cores)')
+    parser.add_argument('--threads', type=int, default=1, help='OpenMP threads per worker (C++ backend)')
+    parser.add_argument('--backend', choices=('auto', 'cpp', 'numpy'), default='auto')
+    parser.add_argument('--seed-mode', choices=('rank', 'tile'), default='rank',
+                        help='snowflake seeds per tile and worker rank or per tile only, as in snowman')
+    parser.add_argument('-o', '--output', default='output.ppm')
+    parser.add_argument('--metrics-json', default=os.environ.get('SNOWMAN_METRICS_JSON'),
+                        help='append a snowman-metrics record to this NDJSON file')
+    parser.add_argument('--checksum', action='store_true',
+                        help='record the image checksum in the metrics (a pure-Python hash, slow on large images)')
+    args = parser.parse_args(argv)
+    if args.image_size <= 0 or args.tile_size <= 0 or args.num_snowmen < 0 or args.workers < 1:
+        parser.error('image_size, tile_size and workers must be positive')
+
+    backend = backend_name(args.backend)
+    image, compute, counts, wall = run_farm(args.image_size, args.num_snowmen, args.tile_size,
+                                            args.workers, backend, args.threads, args.seed_mode)
+    ppm_io.write_ppm(args.output, image)
+    print(f'Master: Image saved to {args.output}')
+
+    procs = args.workers + 1
+    print('\n--- Computational Performance Metrics ---')
+    print(f'Image Size: {args.image_size}, Num Snowmen: {args.num_snowmen}, '
+          f'Pool Workers: {args.workers} ({backend})')
+    print(f'Max Local Computation Time (across all ranks): {max(compute):g} seconds')
+    print(f'Min Local Computation Time (across all ranks): {min(compute):g} seconds')
+    print(f'Avg Local Computation Time (across all ranks): {sum(compute) / procs:g} seconds')
+    print(f'Wall time: {wall:g} seconds (overhead over max compute: {wall - max(compute):g} seconds)')
+    print('\n--- Per-Rank Computation Time ---')
+    for rank, t in enumerate(compute):
+        print(f'Rank {rank}: {t:g} seconds ({counts[rank]} tiles)')
+
+    if args.metrics_json:
+        checksum = f'fnv1a64:{snowman_metrics.fnv1a64(image.tobytes()):016x}' if args.checksum else None
+        snowman_metrics.append_record(args.metrics_json, {
+            'timestamp': results_db.now(),
+            'host': socket.gethostname(),
+            'git_rev': results_db.detect_git_rev(os.path.dirname(os.path.abspath(__file__))),
+            'compiler': f'python {sys.version.split()[0]}',
+            'config': {'image_size': args.image_size, 'num_snowmen': args.num_snowmen,
+                       'tile_size': args.tile_size, 'procs': procs, 'threads': args.threads,
+                       'mode': f'pool-{backend}', 'schedule': None,
+                       'seed_mode': args.seed_mode},
+            'env': results_db.pinning_env(),
+            'wall_time': wall,
+            'max_time': max(compute),
+            'min_time': min(compute),
+            'avg_time': sum(compute) / procs,
+            'rank_compute_time': compute,
+            'rank_tiles': counts,
+            'image': {'file': args.output, 'width': args.image_size, 'height': args.image_size,
+                      'checksum': checksum},
+            'stats': {},
+        })
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
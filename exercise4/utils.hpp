@@ -6,6 +6,8 @@
 #define UTILS_HPP
 
 #include <cmath>
+#include <cstddef>
+#include <cstdint>
 
 // Color with 8-bit RGB
 struct Color {
@@ -58,5 +60,14 @@ struct Plane {
     Plane(const Vec3& p, const Vec3& n, const Color& c) : point(p), normal(n.normalize()), color(c) {}
 };
 
+// 64-bit FNV-1a hash; pass the previous result as `h` to hash data in pieces.
+inline uint64_t fnv1a64(const unsigned char* data, size_t n, uint64_t h = 14695981039346656037ull) {
+    for (size_t i = 0; i < n; ++i) {
+        h ^= data[i];
+        h *= 1099511628211ull;
+    }
+    return h;
+}
+
 #endif
 